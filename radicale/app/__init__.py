@@ -35,11 +35,14 @@ import os
 import pprint
 import pstats
 import random
+import socket
 import time
 import traceback
-import zlib
+import wsgiref.util
+from hashlib import sha256
 from http import client
-from typing import Iterable, List, Mapping, Tuple, Union
+from typing import (Callable, Iterable, Iterator, List, Mapping, Optional,
+                    Tuple, Union, cast)
 
 from radicale import config, httputils, log, pathutils, types, utils
 from radicale.app import base as app_base
@@ -62,6 +65,9 @@ from radicale.log import logger
 # Combination of types.WSGIStartResponse and WSGI application return value
 _IntermediateResponse = Tuple[str, List[Tuple[str, str]], Iterable[bytes]]
 
+# Size of the blocks of files sent with ``wsgi.file_wrapper``
+FILE_BLOCK_SIZE = 64 * 1024
+
 REQUEST_METHODS = ["DELETE", "GET", "HEAD", "MKCALENDAR", "MKCOL", "MOVE", "OPTIONS", "POST", "PROPFIND", "PROPPATCH", "PUT", "REPORT"]
 
 
@@ -91,6 +97,7 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
     _limit_content: int
     _validate_user_value: str
     _validate_path_value: str
+    _response_cache: Optional[app_base.ResponseCache]
     profiler_per_request_method: dict[str, cProfile.Profile] = {}
     profiler_per_request_method_counter: dict[str, int] = {}
     profiler_per_request_method_starttime: datetime.datetime
@@ -125,6 +132,18 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
             logger.info("max_resource_size set to: %d bytes (%sbytes)", self._max_resource_size, utils.format_unit(self._max_resource_size, binary=True))
         self._max_vevent_rrule_occurrence = configuration.get("server", "max_vevent_rrule_occurrence")
         logger.info("max_vevent_rrule_occurrence set to: %d", self._max_vevent_rrule_occurrence)
+        self._max_export_cache_size = configuration.get("storage", "max_export_cache_size")
+        for coding in configuration.get("server", "compression"):
+            if coding not in self._compression:
+                logger.info("compression with %r is not available", coding)
+        logger.info("compression: %s (min size: %d bytes, level: %d)",
+                    ", ".join(self._compression) or "disabled",
+                    self._compression_min_size, self._compression_level)
+        if self._sendfile == "x-accel-redirect":
+            logger.info("sendfile: %s (prefix: %r)", self._sendfile,
+                        self._sendfile_prefix)
+        else:
+            logger.info("sendfile: %s", self._sendfile)
         self._bad_put_request_content = configuration.get("logging", "bad_put_request_content")
         logger.info("log bad put request content: %s", self._bad_put_request_content)
         self._request_header_on_debug = configuration.get("logging", "request_header_on_debug")
@@ -145,6 +164,25 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
         logger.notice("log response content on notice condition: %s", self._response_content_on_notice_condition)
         self._limit_content = configuration.get("logging", "limit_content")
         logger.debug("log limit for content: %d", self._limit_content)
+        max_response_cache_size = configuration.get(
+            "reporting", "max_response_cache_size")
+        self._response_cache = None
+        if not max_response_cache_size:
+            logger.info("response cache: disabled")
+        elif self._sharing._enabled:
+            logger.info("response cache: disabled (not supported with "
+                        "sharing)")
+        elif (self._request_content_on_debug or
+              self._response_content_on_debug or
+              self._request_content_on_notice_condition != {} or
+              self._response_content_on_notice_condition != {}):
+            logger.info("response cache: disabled (request or response "
+                        "content is logged)")
+        else:
+            self._response_cache = app_base.ResponseCache(
+                max_response_cache_size)
+            logger.info("response cache: %d characters",
+                        max_response_cache_size)
         self._auth_delay = configuration.get("auth", "delay")
         self._auth_type = configuration.get("auth", "type")
         self._web_type = configuration.get("web", "type")
@@ -239,6 +277,54 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
                 else:
                     logger.debug("Profiling data per request method %s after %d seconds: (no request seen so far)", method, profiler_timedelta_start)
 
+    def _cached_response(self, function: Callable[..., types.WSGIResponse],
+                         environ: types.WSGIEnviron, base_prefix: str,
+                         path: str, user: str, request_info: dict
+                         ) -> types.WSGIResponse:
+        """Answer a PROPFIND or REPORT request from the response cache.
+
+        Successful responses are cached per user, request target and
+        request body until the storage changes.
+
+        """
+        assert self._response_cache is not None
+        token = self._storage.get_change_token()
+        if token is None:
+            return function(environ, base_prefix, path, user, request_info)
+        try:
+            content = httputils.read_raw_request_body(
+                self.configuration, environ)
+        except RuntimeError as e:
+            logger.warning("Bad %s request on %r: %s",
+                           environ["REQUEST_METHOD"], path, e, exc_info=True)
+            return httputils.BAD_REQUEST
+        except socket.timeout:
+            logger.debug("Client timed out", exc_info=True)
+            return httputils.REQUEST_TIMEOUT
+        environ = {**environ, "wsgi.input": io.BytesIO(content)}
+        key: app_base.ResponseKey = (
+            user, tuple(sorted(self._rights._user_groups or ())),
+            base_prefix, path, environ["REQUEST_METHOD"],
+            environ.get("HTTP_DEPTH", ""), environ.get("CONTENT_TYPE", ""),
+            sha256(content).hexdigest())
+        entry = self._response_cache.get(key, token)
+        if entry is not None:
+            logger.debug("Response from cache")
+            request_info["status"] = entry.status
+            return entry.status, entry.headers, entry.answer, entry.xml_request
+        status, headers, answer, xml_request = function(
+            environ, base_prefix, path, user, request_info)
+        if status not in (client.OK, client.MULTI_STATUS) or answer is None:
+            return status, headers, answer, xml_request
+        entry = app_base.CachedResponse(
+            token, status, dict(headers), "", xml_request)
+        if isinstance(answer, (str, bytes)):
+            self._response_cache.put(key, entry._replace(answer=answer))
+        elif not isinstance(answer, io.IOBase):
+            answer = self._response_cache.record(
+                key, entry, cast(Iterator[str], answer))
+        return status, headers, answer, xml_request
+
     def _scrub_headers(self, environ: types.WSGIEnviron) -> types.WSGIEnviron:
         """Mask passwords and cookies."""
         headers = dict(environ)
@@ -269,6 +355,8 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
                 answers = [answer]
             start_response(status_text, headers)
         if environ.get("REQUEST_METHOD") == "HEAD":
+            if hasattr(answers, "close"):
+                answers.close()
             return []
         return answers
 
@@ -286,14 +374,47 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
 
         """Manage a request."""
         def response(status: int, headers: types.WSGIResponseHeaders,
-                     answer: Union[None, str, bytes],
+                     answer: types.WSGIResponseContent,
                      xml_request: Union[None, str] = None, request_info: dict = {}) -> _IntermediateResponse:
             """Helper to create response from internal types.WSGIResponse"""
             headers = dict(headers)
             content_encoding = "plain"
             # Set content length
-            answers = []
-            if answer is not None:
+            answers: Iterable[bytes] = []
+            content_length = None
+            if isinstance(answer, io.IOBase):
+                # Stored content that is sent as is (e.g. with
+                # ``os.sendfile`` by the internal server)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Response content: file")
+                if self._compression:
+                    headers["Vary"] = "Accept-Encoding"
+                content_length = os.fstat(answer.fileno()).st_size
+                headers["Content-Length"] = str(content_length)
+                file_wrapper = environ.get("wsgi.file_wrapper",
+                                           wsgiref.util.FileWrapper)
+                answers = file_wrapper(answer, FILE_BLOCK_SIZE)
+            elif isinstance(answer, types.EncodedStream):
+                # Streamed content that is already encoded (e.g. exports
+                # that exceed the export cache), the length is unknown
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Response content: streamed (encoded)")
+                if "Content-Encoding" in headers:
+                    content_encoding = headers["Content-Encoding"]
+                answers = answer
+            elif answer is not None and not isinstance(answer, (str, bytes)):
+                # Streamed content, the length is unknown
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Response content: streamed")
+                if "charset=" not in headers["Content-Type"]:
+                    headers["Content-Type"] += "; charset=%s" % self._encoding
+                coding = self._content_coding_headers(environ, headers)
+                if coding != "identity":
+                    content_encoding = coding
+                answers = httputils.encode_stream(
+                    cast(Iterator[str], answer), self._encoding, coding,
+                    self._compression_level)
+            elif answer is not None:
                 if isinstance(answer, str):
                     if self._response_content_on_debug:
                         if logger.isEnabledFor(logging.DEBUG):
@@ -311,19 +432,23 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
                                 logger.debug("Response content: suppressed by config/option [logging] response_content_on_debug")
                     headers["Content-Type"] += "; charset=%s" % self._encoding
                     answer = answer.encode(self._encoding)
-                accept_encoding = [
-                    encoding.strip() for encoding in
-                    environ.get("HTTP_ACCEPT_ENCODING", "").split(",")
-                    if encoding.strip()]
-
-                if "gzip" in accept_encoding:
-                    zcomp = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
-                    answer = zcomp.compress(answer) + zcomp.flush()
-                    headers["Content-Encoding"] = "gzip"
-                    content_encoding = "gzip"
-
-                headers["Content-Length"] = str(len(answer))
-                answers.append(answer)
+                if "Content-Encoding" in headers:
+                    # Content is already encoded (e.g. from cache)
+                    content_encoding = headers["Content-Encoding"]
+                elif httputils.is_compressible(
+                        headers.get("Content-Type", "")):
+                    coding = self._content_coding_headers(
+                        environ, headers, len(answer))
+                    if coding != "identity":
+                        answer = httputils.compress(
+                            answer, coding, self._compression_level)
+                        content_encoding = coding
+                elif self._compression:
+                    headers["Vary"] = "Accept-Encoding"
+
+                content_length = len(answer)
+                headers["Content-Length"] = str(content_length)
+                answers = [answer]
 
             # Add extra headers set in configuration
             headers.update(self._extra_headers)
@@ -385,9 +510,11 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
             else:
                 flags_text = ""
             if answer is not None:
-                message = "%s response status for %r%s in %.3f seconds %s %s bytes%s: %s" % (
+                message = "%s response status for %r%s in %.3f seconds %s %s%s: %s" % (
                             request_method, unsafe_path, depthinfo,
-                            time_delta_seconds, content_encoding, str(len(answer)),
+                            time_delta_seconds, content_encoding,
+                            "streamed" if content_length is None else
+                            "%d bytes" % content_length,
                             flags_text,
                             status_text)
             else:
@@ -668,8 +795,14 @@ class Application(ApplicationPartDelete, ApplicationPartHead,
                     profiler_active = True
 
             try:
-                status, headers, answer, xml_request = function(
-                    environ, base_prefix, path, user, request_info)
+                if (self._response_cache is not None and
+                        request_method in ("PROPFIND", "REPORT")):
+                    status, headers, answer, xml_request = (
+                        self._cached_response(function, environ, base_prefix,
+                                              path, user, request_info))
+                else:
+                    status, headers, answer, xml_request = function(
+                        environ, base_prefix, path, user, request_info)
             except PermissionError as e:
                 logger.error("PermissionError: %s", e)
                 status, headers, answer, xml_request = httputils.INTERNAL_SERVER_ERROR
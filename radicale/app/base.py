@@ -15,13 +15,17 @@
 # You should have received a copy of the GNU General Public License
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import io
+import itertools
 import logging
 import re
 import sys
+import threading
 import unicodedata
 import xml.etree.ElementTree as ET
-from typing import Optional, Union
+from typing import (Dict, Iterable, Iterator, List, NamedTuple, Optional,
+                    Tuple, Union)
 from urllib.parse import unquote
 
 from radicale import (auth, config, group, hook, httputils, log, pathutils,
@@ -135,6 +139,78 @@ def _check_path_format(self: storage.BaseStorage,
                              )
 
 
+# (user, groups, base prefix, path, method, depth, content type, body hash)
+ResponseKey = Tuple[str, Tuple[str, ...], str, str, str, str, str, str]
+
+
+class CachedResponse(NamedTuple):
+    token: str
+    status: int
+    headers: types.WSGIResponseHeaders
+    answer: Union[str, bytes]
+    xml_request: Optional[str]
+
+
+class ResponseCache:
+    """Bounded LRU cache of PROPFIND and REPORT responses.
+
+    Entries are only valid for the change token of the storage that was
+    current when they were generated (see
+    ``BaseStorage.get_change_token``). The size is the total length of the
+    cached answers.
+
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._size = 0
+        self._entries: "collections.OrderedDict[ResponseKey, CachedResponse]" = (
+            collections.OrderedDict())
+        self._lock = threading.Lock()
+
+    def get(self, key: ResponseKey, token: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.token != token:
+                del self._entries[key]
+                self._size -= len(entry.answer)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: ResponseKey, entry: CachedResponse) -> None:
+        if len(entry.answer) > self._max_size:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= len(old_entry.answer)
+            self._entries[key] = entry
+            self._size += len(entry.answer)
+            while self._size > self._max_size:
+                _, old_entry = self._entries.popitem(last=False)
+                self._size -= len(old_entry.answer)
+
+    def record(self, key: ResponseKey, entry: CachedResponse,
+               chunks: Iterable[str]) -> Iterator[str]:
+        """Pass through a streamed answer and add it to the cache when it
+        was produced completely."""
+        parts: Optional[List[str]] = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > self._max_size:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.put(key, entry._replace(answer="".join(parts)))
+
+
 class ApplicationBase:
 
     configuration: config.Configuration
@@ -147,6 +223,12 @@ class ApplicationBase:
     _encoding: str
     _max_resource_size: int
     _max_vevent_rrule_occurrence: int
+    _max_export_cache_size: int
+    _compression: List[str]
+    _compression_min_size: int
+    _compression_level: int
+    _sendfile: str
+    _sendfile_prefix: str
     _permit_delete_collection: bool
     _permit_overwrite_collection: bool
     _strict_preconditions: bool
@@ -172,6 +254,35 @@ class ApplicationBase:
         self._validate_user_value = configuration.get("server", "validate_user_value")
         self._validate_path_value = configuration.get("server", "validate_path_value")
         self._hook = hook.load(configuration)
+        self._compression = [
+            coding for coding in configuration.get("server", "compression")
+            if coding in httputils.CONTENT_CODINGS]
+        self._compression_min_size = configuration.get(
+            "server", "compression_min_size")
+        self._compression_level = configuration.get(
+            "server", "compression_level")
+        self._sendfile = configuration.get("server", "sendfile")
+        self._sendfile_prefix = configuration.get("server", "sendfile_prefix")
+
+    def _content_coding(self, environ: types.WSGIEnviron,
+                        size: Optional[int] = None) -> str:
+        """Select the content coding for a response of ``size`` bytes
+        (``None`` if unknown)."""
+        if size is not None and size < self._compression_min_size:
+            return "identity"
+        return httputils.negotiate_content_coding(environ, self._compression)
+
+    def _content_coding_headers(self, environ: types.WSGIEnviron,
+                                headers: Dict[str, str],
+                                size: Optional[int] = None) -> str:
+        """Select the content coding like ``_content_coding`` and add the
+        ``Vary`` and ``Content-Encoding`` headers for it."""
+        coding = self._content_coding(environ, size)
+        if self._compression:
+            headers["Vary"] = "Accept-Encoding"
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return coding
 
     def _read_xml_request_body(self,
                                environ: types.WSGIEnviron,
@@ -229,6 +340,33 @@ class ApplicationBase:
                                           xml_declaration=True)
         return f.getvalue()
 
+    def _response_content_logged(self) -> bool:
+        """Check if the content of XML responses might be logged."""
+        return bool((self._response_content_on_debug and
+                     logger.isEnabledFor(logging.DEBUG)) or
+                    self._response_content_on_notice_condition != {})
+
+    def _xml_multistatus_response(self, elements: Iterable[ET.Element],
+                                  request_info: dict
+                                  ) -> types.WSGIResponseContent:
+        """Generate a ``D:multistatus`` response from its children.
+
+        The response is streamed unless the response content is logged.
+        ``elements`` is advanced until the first child is produced, errors
+        raised before that still result in a proper error response.
+
+        """
+        if self._response_content_logged():
+            multistatus = ET.Element(xmlutils.make_clark("D:multistatus"))
+            multistatus.extend(elements)
+            return self._xml_response(multistatus, request_info)
+        logger.debug("Response content (XML): streamed")
+        elements_iter = iter(elements)
+        first = next(elements_iter, None)
+        if first is not None:
+            elements_iter = itertools.chain((first,), elements_iter)
+        return xmlutils.serialize_multistatus(elements_iter, self._encoding)
+
     def _webdav_error_response(self, status: int, human_tag: str, request_info: dict
                                ) -> types.WSGIResponse:
         """Generate XML error response."""
@@ -18,11 +18,17 @@
 # You should have received a copy of the GNU General Public License
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
+import itertools
+import json
+import os
 import posixpath
+from hashlib import sha256
 from http import client
-from typing import Union
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
 from urllib.parse import quote
 
+import radicale.item as radicale_item
 from radicale import httputils, pathutils, sharing, storage, types, xmlutils
 from radicale.app.base import Access, ApplicationBase
 from radicale.log import logger
@@ -53,6 +59,19 @@ def propose_filename(collection: storage.BaseCollection, share: Union[dict, None
     return title
 
 
+def export_rendition(content_encoding: str,
+                     share: Union[dict, None] = None) -> str:
+    """Name the rendition of a collection export for the export cache."""
+    rendition = "export"
+    if share and share['Conversion'] == "bday":
+        actions = json.dumps(share['Actions'], sort_keys=True)
+        # The age support depends on the current year
+        rendition = "bday-%d-%s" % (
+            datetime.date.today().year,
+            sha256(actions.encode()).hexdigest()[:16])
+    return "%s.%s" % (rendition, content_encoding)
+
+
 class ApplicationPartGet(ApplicationBase):
 
     def _content_disposition_attachment(self, filename: str) -> str:
@@ -67,9 +86,196 @@ class ApplicationPartGet(ApplicationBase):
             value += "; filename*=%s''%s" % (self._encoding, encoded_filename)
         return value
 
+    def _serialize_stream(self, collection: storage.BaseCollection,
+                          vcf_to_ics: bool = False,
+                          ShareActions: dict = {}) -> Iterator[str]:
+        """Serialize a snapshot of ``collection``.
+
+        The items and properties are read immediately, the storage must be
+        locked. The returned iterator is consumed without the lock, it
+        matches the state of the collection when it was created (e.g. its
+        ETag) even if the collection is modified in the meantime.
+
+        """
+        chunks = collection.serialize_stream(
+            vcf_to_ics=vcf_to_ics, ShareActions=ShareActions,
+            items=list(collection.get_all()))
+        # The properties are read for the first chunk
+        first = next(chunks, None)
+        if first is None:
+            return iter(())
+        return itertools.chain((first,), chunks)
+
+    def _export(self, collection: storage.BaseCollection,
+                share: Union[dict, None], rendition: str, coding: str
+                ) -> Union[bytes, types.EncodedStream]:
+        """Export ``collection`` encoded with the content coding ``coding``
+        and store it in the export cache.
+
+        The export is only kept in memory and stored while it is within
+        ``max_export_cache_size``, the remainder of larger exports is
+        streamed.
+
+        The storage must be locked.
+
+        """
+        if share and share['Conversion'] == "bday":
+            text_chunks = self._serialize_stream(
+                collection, vcf_to_ics=True, ShareActions=share['Actions'])
+        else:
+            text_chunks = self._serialize_stream(collection)
+        chunks = httputils.encode_stream(text_chunks, self._encoding, coding,
+                                         self._compression_level)
+        parts: List[bytes] = []
+        size = 0
+        for chunk in chunks:
+            parts.append(chunk)
+            size += len(chunk)
+            if size > self._max_export_cache_size:
+                return types.EncodedStream(itertools.chain(parts, chunks))
+        content = b"".join(parts)
+        collection.set_export_cache(rendition, content)
+        return content
+
+    def _open_stored_item(self, environ: types.WSGIEnviron,
+                          item: radicale_item.Item) -> Optional[BinaryIO]:
+        """Open the stored content of ``item`` if it can be sent as is
+        (without encoding and compression).
+
+        The storage must be locked.
+
+        """
+        if (item.collection is None or item.href is None or
+                not item.stored_as(self._encoding)):
+            return None
+        f = item.collection.open_item_file(item.href)
+        if f is None:
+            return None
+        if self._content_coding(
+                environ, os.fstat(f.fileno()).st_size) != "identity":
+            f.close()
+            return None
+        return f
+
+    def _sendfile_path(self, collection: storage.BaseCollection,
+                       share: Union[dict, None]) -> Optional[str]:
+        """Get the path of a file with the export of ``collection`` for the
+        reverse proxy.
+
+        The export is stored in the export cache first. The reverse proxy
+        reads the file after the storage lock is released. Only cached
+        exports are sent this way, because their file names contain the
+        etag and they are kept for a while after the collection changed.
+        Files of items are replaced in place.
+
+        The storage must be locked.
+
+        """
+        if not self._max_export_cache_size:
+            return None
+        # The reverse proxy compresses the content
+        rendition = export_rendition("identity", share)
+        path = collection.get_export_cache_path(rendition, reference=True)
+        if path is None and isinstance(
+                self._export(collection, share, rendition, "identity"),
+                bytes):
+            path = collection.get_export_cache_path(rendition,
+                                                    reference=True)
+        return path
+
+    def _sendfile_header(self, path: str) -> Optional[Tuple[str, str]]:
+        """Get the header that lets the reverse proxy send the file
+        ``path``."""
+        if self._sendfile == "x-sendfile":
+            return "X-Sendfile", os.path.abspath(path)
+        folder = self.configuration.get("storage", "filesystem_folder")
+        relpath = os.path.relpath(os.path.abspath(path),
+                                  os.path.abspath(folder))
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            logger.debug("Can't send %r with X-Accel-Redirect, it's not in "
+                         "the storage folder", path)
+            return None
+        return "X-Accel-Redirect", "%s/%s" % (
+            self._sendfile_prefix.rstrip("/"),
+            quote(relpath.replace(os.sep, "/")))
+
+    def _stored_size(self, item: radicale_item.Item) -> Optional[int]:
+        """Get the size of the content of ``item`` from the stored file
+        (``None`` if it isn't sent as stored).
+
+        The storage must be locked.
+
+        """
+        if (item.collection is None or item.href is None or
+                not item.stored_as(self._encoding)):
+            return None
+        path = item.collection.get_item_path(item.href)
+        if path is None:
+            return None
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+    def _export_cache_size(self, collection: storage.BaseCollection,
+                           rendition: str) -> Optional[int]:
+        """Get the size of a cached export of ``collection`` (``None`` if
+        it isn't cached).
+
+        The storage must be locked.
+
+        """
+        path = collection.get_export_cache_path(rendition)
+        if path is None:
+            content = collection.get_export_cache(rendition)
+            return None if content is None else len(content)
+        try:
+            return os.stat(path).st_size
+        except FileNotFoundError:
+            return None
+
+    def _head_headers(self, environ: types.WSGIEnviron,
+                      item: types.CollectionOrItem, headers: Dict[str, str],
+                      share: Union[dict, None]) -> Dict[str, str]:
+        """Complete the headers of a HEAD response without building the
+        content.
+
+        Headers that depend on the size of the content (``Content-Length``
+        and ``Content-Encoding`` of items) are only included if the size is
+        known without serialization (see RFC 9110 section 9.3.2).
+
+        """
+        headers["Content-Type"] += "; charset=%s" % self._encoding
+        size: Optional[int] = None
+        if isinstance(item, storage.BaseCollection):
+            # The content coding of collections doesn't depend on the size
+            coding = self._content_coding_headers(environ, headers)
+            if self._max_export_cache_size:
+                size = self._export_cache_size(
+                    item, export_rendition(coding, share))
+        else:
+            if not (share and share['Conversion'] == "bday"):
+                size = self._stored_size(item)
+            if size is None:
+                # The content coding depends on the unknown size
+                if self._compression:
+                    headers["Vary"] = "Accept-Encoding"
+            elif self._content_coding_headers(
+                    environ, headers, size) != "identity":
+                # The size of the compressed content is unknown
+                size = None
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        return headers
+
     def do_GET(self, environ: types.WSGIEnviron, base_prefix: str, path: str,
-               user: str, request_info: dict) -> types.WSGIResponse:
-        """Manage GET request."""
+               user: str, request_info: dict, head: bool = False
+               ) -> types.WSGIResponse:
+        """Manage GET request.
+
+        If ``head`` is set only the headers are computed (HEAD request).
+
+        """
         # Redirect to /.web if the root path is requested
         if not pathutils.strip_path(path):
             return httputils.redirect(base_prefix + "/.web")
@@ -136,16 +342,57 @@ class ApplicationPartGet(ApplicationBase):
                 "ETag": item.etag}
             if content_disposition:
                 headers["Content-Disposition"] = content_disposition
-            if share and share['Conversion'] == "bday":
-                if isinstance(item, storage.BaseCollection):
+            if httputils.not_modified(environ, headers["ETag"],
+                                      headers["Last-Modified"]):
+                return httputils.not_modified_response(
+                    headers["ETag"], headers["Last-Modified"])
+            if head:
+                return client.OK, self._head_headers(
+                    environ, item, headers, share), None, None
+            if (self._sendfile != "none" and
+                    isinstance(item, storage.BaseCollection)):
+                # The reverse proxy sends the file and frees the worker
+                file_path = self._sendfile_path(item, share)
+                header = (None if file_path is None else
+                          self._sendfile_header(file_path))
+                if header is not None:
+                    headers[header[0]] = header[1]
+                    headers["Content-Type"] += "; charset=%s" % self._encoding
+                    return client.OK, headers, None, None
+            answer: types.WSGIResponseContent
+            if isinstance(item, storage.BaseCollection) and self._max_export_cache_size:
+                # The cached renditions are compressed independently of
+                # the size threshold
+                content_encoding = self._content_coding_headers(
+                    environ, headers)
+                rendition = export_rendition(content_encoding, share)
+                answer = item.get_export_cache(rendition)
+                if answer is None:
+                    answer = self._export(item, share, rendition,
+                                          content_encoding)
+                headers["Content-Type"] += "; charset=%s" % self._encoding
+            elif isinstance(item, storage.BaseCollection):
+                # Stream the export instead of building it in memory
+                if share and share['Conversion'] == "bday":
                     # convert VCF to ICS
-                    answer = item.serialize(vcf_to_ics=True, ShareActions=share['Actions'])
+                    answer = self._serialize_stream(
+                        item, vcf_to_ics=True,
+                        ShareActions=share['Actions'])
                 else:
-                    item_converted = item.convert_vcf_to_ics(ShareActions=share['Actions'])
-                    if item_converted is not None:
-                        answer = item_converted.serialize()
-                    else:
-                        return httputils.NOT_FOUND
-            else:
+                    answer = self._serialize_stream(item)
+            elif share and share['Conversion'] == "bday":
+                item_converted = item.convert_vcf_to_ics(ShareActions=share['Actions'])
+                if item_converted is not None:
+                    answer = item_converted.serialize()
+                else:
+                    return httputils.NOT_FOUND
+            elif (self._response_content_on_debug or
+                    self._response_content_on_notice_condition != {}):
+                # The text is logged by the response
                 answer = item.serialize()
+            else:
+                # The stored content is sent without decoding if possible
+                answer = (self._open_stored_item(environ, item) or
+                          item.serialize_bytes(self._encoding))
+                headers["Content-Type"] += "; charset=%s" % self._encoding
             return client.OK, headers, answer, None
@@ -19,6 +19,8 @@
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
 import collections
+import copy
+import functools
 import itertools
 import posixpath
 import socket
@@ -32,6 +34,80 @@ from radicale import (httputils, pathutils, rights, sharing, storage, types,
 from radicale.app.base import Access, ApplicationBase
 from radicale.log import logger
 
+# Maximum number of cached property values per kind (see ``_fragment``)
+FRAGMENT_CACHE_SIZE = 1024
+
+
+def _fragment(func):
+    """Cache the property values built by ``func`` by its arguments.
+
+    The values of most properties of collections and principals only depend
+    on a few inputs and are shared between responses. They must not be
+    modified, responses that might be logged use copies (see
+    ``xml_propfind_response``).
+
+    """
+    return functools.lru_cache(maxsize=FRAGMENT_CACHE_SIZE)(func)
+
+
+@_fragment
+def _href_property(tag: str, href: str) -> ET.Element:
+    element = ET.Element(tag)
+    child_element = ET.SubElement(element, xmlutils.make_clark("D:href"))
+    child_element.text = href
+    return element
+
+
+@_fragment
+def _current_user_privilege_set(privileges: Tuple[str, ...]) -> ET.Element:
+    element = ET.Element(xmlutils.make_clark("D:current-user-privilege-set"))
+    for human_tag in privileges:
+        privilege = ET.SubElement(element, xmlutils.make_clark("D:privilege"))
+        privilege.append(ET.Element(xmlutils.make_clark(human_tag)))
+    return element
+
+
+@_fragment
+def _supported_report_set(reports: Tuple[str, ...]) -> ET.Element:
+    element = ET.Element(xmlutils.make_clark("D:supported-report-set"))
+    for human_tag in reports:
+        supported_report = ET.SubElement(
+            element, xmlutils.make_clark("D:supported-report"))
+        report_element = ET.SubElement(
+            supported_report, xmlutils.make_clark("D:report"))
+        report_element.append(ET.Element(xmlutils.make_clark(human_tag)))
+    return element
+
+
+@_fragment
+def _supported_calendar_component_set(components: Tuple[str, ...]
+                                      ) -> ET.Element:
+    element = ET.Element(
+        xmlutils.make_clark("C:supported-calendar-component-set"))
+    for component in components:
+        comp = ET.SubElement(element, xmlutils.make_clark("C:comp"))
+        comp.set("name", component)
+    return element
+
+
+@_fragment
+def _supported_address_data(versions: Tuple[str, ...]) -> ET.Element:
+    element = ET.Element(xmlutils.make_clark("CR:supported-address-data"))
+    for version in versions:
+        address_data_type = ET.SubElement(
+            element, xmlutils.make_clark("CR:address-data-type"))
+        address_data_type.set("content-type", "text/vcard")
+        address_data_type.set("version", version)
+    return element
+
+
+@_fragment
+def _resourcetype(resourcetypes: Tuple[str, ...]) -> ET.Element:
+    element = ET.Element(xmlutils.make_clark("D:resourcetype"))
+    for human_tag in resourcetypes:
+        element.append(ET.Element(xmlutils.make_clark(human_tag)))
+    return element
+
 
 def xml_propfind(
         self,
@@ -42,7 +118,7 @@ def xml_propfind(
         user: str, encoding: str,
         max_resource_size: int,
         shares: dict = {},
-        ) -> Optional[ET.Element]:
+        ) -> Optional[Iterator[ET.Element]]:
     """Read and answer PROPFIND requests.
 
     Read rfc4918-9.1 for info.
@@ -50,6 +126,9 @@ def xml_propfind(
     The collections parameter is a list of collections that are to be included
     in the output.
 
+    Returns an iterator over the ``D:response`` elements of the multistatus,
+    they are built while the iterator is consumed.
+
     """
     # A client may choose not to submit a request body.  An empty PROPFIND
     # request body MUST be treated as if it were an 'allprop' request.
@@ -72,15 +151,13 @@ def xml_propfind(
         # RFC 5397 doesn't seem to work with DAVx5.
         return None
 
-    # Writing answer
-    multistatus = ET.Element(xmlutils.make_clark("D:multistatus"))
-
     logger.trace("PROPFIND/xml_propfind: shares=%r", shares)
 
-    for item, permission, raw_permissions, conversion in allowed_items:
-        write = permission == "w"
-        multistatus.append(
-            xml_propfind_response(
+    # Writing answer
+    def responses() -> Iterator[ET.Element]:
+        for item, permission, raw_permissions, conversion in allowed_items:
+            write = permission == "w"
+            yield xml_propfind_response(
                 self,
                 base_prefix,
                 path,
@@ -96,9 +173,8 @@ def xml_propfind(
                 conversion=conversion,
                 raw_permissions=raw_permissions,
             )
-        )
 
-    return multistatus
+    return responses()
 
 
 def xml_propfind_response(
@@ -120,6 +196,7 @@ def xml_propfind_response(
     """Build and return a PROPFIND response."""
     if propname and allprop or (props and (propname or allprop)):
         raise ValueError("Only use one of props, propname and allprops")
+    logged = self._response_content_logged()
 
     if isinstance(item, storage.BaseCollection):
         is_collection = True
@@ -245,70 +322,57 @@ def xml_propfind_response(
             else:
                 is404 = True
         elif tag == xmlutils.make_clark("D:principal-collection-set"):
-            child_element = ET.Element(xmlutils.make_clark("D:href"))
-            child_element.text = xmlutils.make_href(base_prefix, "/")
-            element.append(child_element)
+            element = _href_property(tag, xmlutils.make_href(base_prefix, "/"))
         elif (tag in (xmlutils.make_clark("C:calendar-user-address-set"),
                       xmlutils.make_clark("D:principal-URL"),
                       xmlutils.make_clark("CR:addressbook-home-set"),
                       xmlutils.make_clark("C:calendar-home-set")) and
               is_collection and collection.is_principal):
-            child_element = ET.Element(xmlutils.make_clark("D:href"))
-            child_element.text = xmlutils.make_href(base_prefix, path)
+            principal_href = xmlutils.make_href(base_prefix, path)
             if share:
                 # backmap
-                if child_element.text.startswith(base_prefix + share['PathMapped']):
-                    child_element.text = base_prefix + str(share['PathOrToken']) + child_element.text.removeprefix(base_prefix + share['PathMapped'])
-                if share_bday_automap and child_element.text.endswith(".vcf"):
-                    child_element.text = child_element.text.removesuffix(".vcf") + ".ics"
-            element.append(child_element)
+                if principal_href.startswith(base_prefix + share['PathMapped']):
+                    principal_href = base_prefix + str(share['PathOrToken']) + principal_href.removeprefix(base_prefix + share['PathMapped'])
+                if share_bday_automap and principal_href.endswith(".vcf"):
+                    principal_href = principal_href.removesuffix(".vcf") + ".ics"
+            element = _href_property(tag, principal_href)
         elif tag == xmlutils.make_clark("C:supported-calendar-component-set"):
             human_tag = xmlutils.make_human_tag(tag)
             if is_collection and is_leaf:
-                components = []
+                components: Sequence[str] = ()
                 if collection.tag == "VCALENDAR":
                     components_text = collection.get_meta(human_tag)
                     if components_text:
                         components = components_text.split(",")
                     else:
-                        components = ["VTODO", "VEVENT", "VJOURNAL"]
+                        components = ("VTODO", "VEVENT", "VJOURNAL")
                 elif collection.tag == "VADDRESSBOOK" and share_bday_automap:
                     # enforce VEVENT-only
-                    components = ["VEVENT"]
-                for component in components:
-                    comp = ET.Element(xmlutils.make_clark("C:comp"))
-                    comp.set("name", component)
-                    element.append(comp)
+                    components = ("VEVENT",)
+                element = _supported_calendar_component_set(tuple(components))
             else:
                 is404 = True
         elif tag == xmlutils.make_clark("CR:supported-address-data"):
             if is_collection and is_leaf and collection.tag == "VADDRESSBOOK" and not share_bday_automap:
                 # Advertise supported vCard versions per RFC 6352 section 6.2.2
                 # vCard 4.0 requires vobject >= 1.0.0
-                versions: Sequence[str] = (("4.0", "3.0")
-                                           if utils.vobject_supports_vcard4()
-                                           else ("3.0",))
-                for version in versions:
-                    address_data_type = ET.Element(
-                        xmlutils.make_clark("CR:address-data-type"))
-                    address_data_type.set("content-type", "text/vcard")
-                    address_data_type.set("version", version)
-                    element.append(address_data_type)
+                element = _supported_address_data(
+                    ("4.0", "3.0") if utils.vobject_supports_vcard4()
+                    else ("3.0",))
             else:
                 is404 = True
         elif tag == xmlutils.make_clark("D:current-user-principal"):
             if user:
-                child_element = ET.Element(xmlutils.make_clark("D:href"))
                 if share:
                     # backmap
-                    child_element.text = xmlutils.make_href(
+                    principal_href = xmlutils.make_href(
                         base_prefix, "/%s/" % share['User'])
-                    if share_bday_automap and child_element.text.endswith(".vcf"):
-                        child_element.text = child_element.text.removesuffix(".vcf") + ".ics"
+                    if share_bday_automap and principal_href.endswith(".vcf"):
+                        principal_href = principal_href.removesuffix(".vcf") + ".ics"
                 else:
-                    child_element.text = xmlutils.make_href(
+                    principal_href = xmlutils.make_href(
                         base_prefix, "/%s/" % user)
-                element.append(child_element)
+                element = _href_property(tag, principal_href)
             else:
                 element.append(ET.Element(
                     xmlutils.make_clark("D:unauthenticated")))
@@ -348,11 +412,7 @@ def xml_propfind_response(
                 if ("M" in raw_permissions or (self._sharing.permit_create_map and "m" not in raw_permissions)):
                     privileges.append("RADICALE:share-map")
 
-            for human_tag in privileges:
-                privilege = ET.Element(xmlutils.make_clark("D:privilege"))
-                privilege.append(ET.Element(
-                    xmlutils.make_clark(human_tag)))
-                element.append(privilege)
+            element = _current_user_privilege_set(tuple(privileges))
         elif tag == xmlutils.make_clark("D:supported-report-set"):
             # These 3 reports are not implemented
             reports = ["D:expand-property",
@@ -367,14 +427,7 @@ def xml_propfind_response(
                 elif collection.tag == "VCALENDAR" or share_bday_automap:
                     reports.append("C:calendar-multiget")
                     reports.append("C:calendar-query")
-            for human_tag in reports:
-                supported_report = ET.Element(
-                    xmlutils.make_clark("D:supported-report"))
-                report_element = ET.Element(xmlutils.make_clark("D:report"))
-                report_element.append(
-                    ET.Element(xmlutils.make_clark(human_tag)))
-                supported_report.append(report_element)
-                element.append(supported_report)
+            element = _supported_report_set(tuple(reports))
         elif tag == xmlutils.make_clark("D:getcontentlength"):
             if not is_collection or is_leaf:
                 if collection.tag == "VADDRESSBOOK" and share_bday_automap:
@@ -385,7 +438,7 @@ def xml_propfind_response(
                             item_ics = entry.convert_vcf_to_ics(ShareActions=share['Actions'])
                             if item_ics is None:
                                 continue
-                            length += len(item_ics.vobject_item.serialize().encode(encoding))
+                            length += len(item_ics.serialize().encode(encoding))
                         element.text = str(length)
                     else:
                         logger.trace("PROPFIND/xml_propfind_response/getcontentlength: start bday automap handling for single item")
@@ -402,10 +455,8 @@ def xml_propfind_response(
             # return empty elment, if no owner available (rfc3744-5.1)
             # return empty element in case of a mapped share / clients try PROPFIND on this not accessable href
             if collection.owner and not share:
-                child_element = ET.Element(xmlutils.make_clark("D:href"))
-                child_element.text = xmlutils.make_href(
-                    base_prefix, "/%s/" % collection.owner)
-                element.append(child_element)
+                element = _href_property(tag, xmlutils.make_href(
+                    base_prefix, "/%s/" % collection.owner))
         elif tag == xmlutils.make_clark("C:max-resource-size"):
             # RFC4791#5.2.5
             element.text = str(max_resource_size)
@@ -420,25 +471,18 @@ def xml_propfind_response(
                 else:
                     is404 = True
             elif tag == xmlutils.make_clark("D:resourcetype"):
+                resourcetypes = []
                 if collection.is_principal:
-                    child_element = ET.Element(
-                        xmlutils.make_clark("D:principal"))
-                    element.append(child_element)
+                    resourcetypes.append("D:principal")
                 if is_leaf:
                     if collection.tag == "VADDRESSBOOK" and not share_bday_automap:
-                        child_element = ET.Element(
-                            xmlutils.make_clark("CR:addressbook"))
-                        element.append(child_element)
+                        resourcetypes.append("CR:addressbook")
                     elif collection.tag == "VCALENDAR" or share_bday_automap:
-                        child_element = ET.Element(
-                            xmlutils.make_clark("C:calendar"))
-                        element.append(child_element)
+                        resourcetypes.append("C:calendar")
                     elif collection.tag == "VSUBSCRIBED":
-                        child_element = ET.Element(
-                            xmlutils.make_clark("CS:subscribed"))
-                        element.append(child_element)
-                child_element = ET.Element(xmlutils.make_clark("D:collection"))
-                element.append(child_element)
+                        resourcetypes.append("CS:subscribed")
+                resourcetypes.append("D:collection")
+                element = _resourcetype(tuple(resourcetypes))
             elif tag == xmlutils.make_clark("RADICALE:displayname"):
                 # Only for internal use by the web interface
                 displayname = collection.get_meta("D:displayname")
@@ -460,7 +504,7 @@ def xml_propfind_response(
                             item_ics = entry.convert_vcf_to_ics(ShareActions=share['Actions'])
                             if item_ics is None:
                                 continue
-                            items.append(item_ics.vobject_item)
+                            items.append(item_ics)
                         element.text = str(sum(1 for x in items))
                     else:
                         element.text = str(sum(1 for x in item.get_all()))
@@ -532,6 +576,9 @@ def xml_propfind_response(
         propstat = ET.Element(xmlutils.make_clark("D:propstat"))
         response.append(propstat)
         prop = ET.Element(xmlutils.make_clark("D:prop"))
+        if logged:
+            # Logging formats the tree, keep the shared fragments intact
+            children = [copy.deepcopy(child) for child in children]
         prop.extend(children)
         propstat.append(prop)
         status = ET.Element(xmlutils.make_clark("D:status"))
@@ -672,4 +719,4 @@ class ApplicationPartPropfind(ApplicationBase):
         if xml_answer is None:
             return httputils.NOT_ALLOWED
         request_info["status"] = client.MULTI_STATUS
-        return client.MULTI_STATUS, headers, self._xml_response(xml_answer, request_info), xmlutils.pretty_xml(xml_content)
+        return client.MULTI_STATUS, headers, self._xml_multistatus_response(xml_answer, request_info), xmlutils.pretty_xml(xml_content)
@@ -22,11 +22,14 @@
 # You should have received a copy of the GNU General Public License
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import contextlib
 import copy
 import datetime
+import itertools
 import posixpath
 import socket
+import threading
 import xml.etree.ElementTree as ET
 from http import client
 from typing import (Callable, Iterable, Iterator, List, Optional, Sequence,
@@ -38,15 +41,111 @@ import vobject.base
 from vobject.base import ContentLine
 
 import radicale.item as radicale_item
-from radicale import httputils, pathutils, sharing, storage, types, xmlutils
+from radicale import (config, httputils, pathutils, sharing, storage, types,
+                      xmlutils)
 from radicale.app.base import Access, ApplicationBase
+from radicale.app.put import PRODID
 from radicale.item import filter as radicale_filter
+from radicale.item import select as radicale_select
 from radicale.log import logger
 
 DT_FORMAT_TIMESTAMP: str = '%Y%m%dT%H%M%SZ'
 DT_FORMAT_DATE: str = '%Y%m%d'
 
 
+def merge_free_busy_periods(
+        periods: Iterable[Tuple[str, datetime.datetime, datetime.datetime]]
+        ) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+    """Merge overlapping and adjacent periods with the same FBTYPE.
+
+    ``periods`` are tuples of (``fbtype``, ``start``, ``end``). The merged
+    periods are sorted by ``start``.
+
+    """
+    merged: List[Tuple[str, datetime.datetime, datetime.datetime]] = []
+    current: Optional[List] = None
+    for fbtype, start, end in sorted(periods):
+        if current is not None and current[0] == fbtype and (
+                start <= current[2]):
+            current[2] = max(current[2], end)
+            continue
+        if current is not None:
+            merged.append((current[0], current[1], current[2]))
+        current = [fbtype, start, end]
+    if current is not None:
+        merged.append((current[0], current[1], current[2]))
+    merged.sort(key=lambda period: (period[1], period[0]))
+    return merged
+
+
+def serialize_free_busy(start: datetime.datetime, end: datetime.datetime,
+                        periods: Iterable[Tuple[str, datetime.datetime,
+                                                datetime.datetime]]) -> str:
+    """Serialize a VCALENDAR with a single VFREEBUSY for the time range
+    from ``start`` to ``end`` with the FREEBUSY ``periods``.
+
+    See rfc4791-7.10 and rfc5545-3.6.4.
+
+    """
+    def format_utc(value: datetime.datetime) -> str:
+        value = value.astimezone(datetime.timezone.utc)
+        # ``strftime`` doesn't pad years before 1000 on all platforms
+        return "%04d%s" % (value.year, value.strftime(DT_FORMAT_TIMESTAMP[2:]))
+
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:%s" % PRODID,
+             "BEGIN:VFREEBUSY",
+             "DTSTAMP:%s" % format_utc(datetime.datetime.now(
+                 datetime.timezone.utc)),
+             "DTSTART:%s" % format_utc(start), "DTEND:%s" % format_utc(end)]
+    lines.extend("FREEBUSY;FBTYPE=%s:%s/%s" % (
+        fbtype, format_utc(period_start), format_utc(period_end))
+        for fbtype, period_start, period_end in periods)
+    lines.extend(("END:VFREEBUSY", "END:VCALENDAR", ""))
+    return "\r\n".join(lines)
+
+
+ExpandKey = Tuple[str, datetime.datetime, datetime.datetime,
+                  Optional[datetime.datetime], Optional[datetime.datetime],
+                  int]
+
+
+class ExpandCache:
+    """Bounded LRU cache of expanded calendar data.
+
+    Entries are keyed by the ETag of the item and the parameters of the
+    expansion (see ``_expand``), modified items get a new ETag. The size
+    is the total length of the cached texts.
+
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._size = 0
+        self._entries: "collections.OrderedDict[ExpandKey, Tuple[str, int]]" = (
+            collections.OrderedDict())
+        self._lock = threading.Lock()
+
+    def get(self, key: ExpandKey) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: ExpandKey, text: str, n_vevents: int) -> None:
+        if len(text) > self._max_size:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= len(old_entry[0])
+            self._entries[key] = (text, n_vevents)
+            self._size += len(text)
+            while self._size > self._max_size:
+                _, (old_text, _) = self._entries.popitem(last=False)
+                self._size -= len(old_text)
+
+
 def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
                      collection: storage.BaseCollection, encoding: str,
                      unlock_storage_fn: Callable[[], None],
@@ -87,8 +186,10 @@ def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Eleme
     # !!! Don't access storage after this !!!
     unlock_storage_fn()
 
-    cal = vobject.iCalendar()
+    start, end = radicale_filter.parse_time_range(time_range_element)
+    periods: List[Tuple[str, datetime.datetime, datetime.datetime]] = []
     collection_tag = collection.tag
+    filter_match = compile_filter(collection_tag, filter_element)
     while retrieved_items:
         # Second filtering before evaluating occurrences.
         # ``item.vobject_item`` might be accessed during filtering.
@@ -97,7 +198,7 @@ def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Eleme
         item, filter_matched = retrieved_items.pop(0)
         if not filter_matched:
             try:
-                if not test_filter(collection_tag, item, filter_element):
+                if not filter_match(item):
                     continue
             except ValueError as e:
                 raise ValueError("Failed to free-busy filter item %r from %r: %s" %
@@ -106,7 +207,7 @@ def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Eleme
                 raise RuntimeError("Failed to free-busy filter item %r from %r: %s" %
                                    (item.href, collection.path, e)) from e
 
-        fbtype = None
+        fbtype = "BUSY"
         if item.component_name == 'VEVENT':
             transp = getattr(item.vobject_item.vevent, 'transp', None)
             if transp and transp.value != 'OPAQUE':
@@ -123,8 +224,6 @@ def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Eleme
                 # Could do fbtype = status.value for x-name, I prefer this
                 fbtype = 'BUSY'
 
-        # TODO: coalesce overlapping periods
-
         if max_occurrence > 0:
             n_occurrences = max_occurrence+1
         else:
@@ -137,24 +236,37 @@ def free_busy_report(base_prefix: str, path: str, xml_request: Optional[ET.Eleme
             raise ValueError("FREEBUSY occurrences limit of {} hit"
                              .format(max_occurrence))
 
-        for occurrence in occurrences:
-            vfb = cal.add('vfreebusy')
-            vfb.add('dtstamp').value = item.vobject_item.vevent.dtstamp.value
-            vfb.add('dtstart').value, vfb.add('dtend').value = occurrence
-            if fbtype:
-                vfb.add('fbtype').value = fbtype
-    return (client.OK, cal.serialize())
+        # Periods are limited to the requested time range
+        periods.extend((fbtype, max(start, occurrence_start),
+                        min(end, occurrence_end))
+                       for occurrence_start, occurrence_end in occurrences)
+    return (client.OK, serialize_free_busy(
+        start, end, merge_free_busy_periods(periods)))
 
 
 def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
                collection: storage.BaseCollection, encoding: str,
                unlock_storage_fn: Callable[[], None],
                max_occurrence: int = 0, user: str = "", request_info: dict = {},
-               share: Union[dict, None] = None) -> Tuple[int, ET.Element]:
+               share: Union[dict, None] = None, max_results: int = 0,
+               expand_cache: Optional[ExpandCache] = None
+               ) -> Tuple[int, Union[ET.Element, Iterator[ET.Element]]]:
     """Read and answer REPORT requests that return XML.
 
     Read rfc3253-3.6 for info.
 
+    The number of results of queries and sync-collection is limited to
+    ``max_results`` (``0`` for no limit) or the smaller limit requested by
+    the client, truncated results are marked with a ``507`` response for
+    the request URI (see rfc6352-8.6.1 and rfc6578-3.6).
+
+    On success the children of the multistatus are returned as an iterator,
+    the responses for the items are built while the iterator is consumed.
+    Otherwise the error element is returned.
+
+    Expanded calendar data is looked up in and stored into
+    ``expand_cache`` (optional).
+
     """
     logger.trace("REPORT/xml_report: base_prefix=%r path=%r", base_prefix, path)
 
@@ -163,9 +275,9 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
         share_bday_automap = True
     logger.trace("REPORT/xml_report(1): share=%r", share)
 
-    multistatus = ET.Element(xmlutils.make_clark("D:multistatus"))
+    multistatus: List[ET.Element] = []
     if xml_request is None:
-        return client.MULTI_STATUS, multistatus
+        return client.MULTI_STATUS, iter(multistatus)
     root = xml_request
     if root.tag in (xmlutils.make_clark("D:principal-search-property-set"),
                     xmlutils.make_clark("D:principal-property-search"),
@@ -176,7 +288,7 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
         # support for them) and stops working if an error code is returned.
         logger.warning("Unsupported REPORT method %r on %r requested",
                        xmlutils.make_human_tag(root.tag), path)
-        return client.MULTI_STATUS, multistatus
+        return client.MULTI_STATUS, iter(multistatus)
     if ((root.tag == xmlutils.make_clark("C:calendar-multiget") and collection.tag != "VCALENDAR" and not share_bday_automap) or
        (root.tag == xmlutils.make_clark("CR:addressbook-multiget") and collection.tag != "VADDRESSBOOK") or
        (root.tag == xmlutils.make_clark("D:sync-collection") and collection.tag not in ("VADDRESSBOOK", "VCALENDAR"))):
@@ -190,6 +302,9 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
     else:
         props = []
 
+    limit = _parse_limit(root, max_results)
+    truncated = False
+
     hreferences: Iterable[str]
     if root.tag in (
             xmlutils.make_clark("C:calendar-multiget"),
@@ -213,7 +328,8 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
             old_sync_token = old_sync_token_element.text.strip()
         logger.debug("Client provided sync token: %r", old_sync_token)
         try:
-            sync_token, names = collection.sync(old_sync_token)
+            sync_token, names, truncated = collection.sync_page(
+                old_sync_token, limit)
         except ValueError as e:
             # Invalid sync token
             remote_useragent_txt = ""
@@ -236,6 +352,20 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
         root.findall(xmlutils.make_clark("C:filter")) +
         root.findall(xmlutils.make_clark("CR:filter")))
     expand = root.find(".//" + xmlutils.make_clark("C:expand"))
+    expand_start = expand_end = None
+    if expand is not None:
+        starts = expand.get('start')
+        ends = expand.get('end')
+
+        if (starts is None) or (ends is None):
+            return client.FORBIDDEN, xmlutils.webdav_error("C:expand")
+
+        expand_start = datetime.datetime.strptime(
+            starts, DT_FORMAT_TIMESTAMP
+        ).replace(tzinfo=datetime.timezone.utc)
+        expand_end = datetime.datetime.strptime(
+            ends, DT_FORMAT_TIMESTAMP
+        ).replace(tzinfo=datetime.timezone.utc)
 
     # if we have expand prop we use "filter (except time range) -> expand -> filter (only time range)" approach
     time_range_element = None
@@ -256,6 +386,10 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
 
         main_filters.append(filter_copy)
 
+    # Partial retrieval of calendar and address data
+    selections = {prop.tag: radicale_select.parse_selection(prop)
+                  for prop in props}
+
     # Retrieve everything required for finishing the request.
     retrieved_items = list(retrieve_items(
         base_prefix, path, collection, hreferences, main_filters, multistatus, share))
@@ -279,106 +413,146 @@ def xml_report(base_prefix: str, path: str, xml_request: Optional[ET.Element],
 
     logger.trace("REPORT/xml_report(2): share=%r", share)
 
-    n_vevents = 0
-    while retrieved_items:
-        # ``item.vobject_item`` might be accessed during filtering.
-        # Don't keep reference to ``item``, because VObject requires a lot of
-        # memory.
-        item, filters_matched = retrieved_items.pop(0)
-        if filters and not filters_matched:
-            try:
-                if not all(test_filter(collection_tag, item, filter_)
-                           for filter_ in main_filters):
-                    continue
-            except ValueError as e:
-                raise ValueError("Failed to filter item %r from %r: %s" %
-                                 (item.href, collection.path, e)) from e
-            except Exception as e:
-                raise RuntimeError("Failed to filter item %r from %r: %s" %
-                                   (item.href, collection.path, e)) from e
+    collection_uri = pathutils.unstrip_path(collection.path, True)
+    query = root.tag in (xmlutils.make_clark("C:calendar-query"),
+                         xmlutils.make_clark("CR:addressbook-query"))
 
-        found_props = []
-        not_found_props = []
-
-        for prop in props:
-            element = ET.Element(prop.tag)
-            if prop.tag == xmlutils.make_clark("D:getcontenttype"):
-                element.text = xmlutils.get_content_type(item, encoding)
-                found_props.append(element)
-            elif prop.tag in (
-                    xmlutils.make_clark("C:calendar-data"),
-                    xmlutils.make_clark("D:getetag"),
-                    xmlutils.make_clark("CR:address-data")):
-                element.text = item.serialize()
-
-                if (expand is not None) and item.component_name == 'VEVENT':
-                    starts = expand.get('start')
-                    ends = expand.get('end')
-
-                    if (starts is None) or (ends is None):
-                        return client.FORBIDDEN, \
-                            xmlutils.webdav_error("C:expand")
-
-                    start = datetime.datetime.strptime(
-                        starts, DT_FORMAT_TIMESTAMP
-                    ).replace(tzinfo=datetime.timezone.utc)
-                    end = datetime.datetime.strptime(
-                        ends, DT_FORMAT_TIMESTAMP
-                    ).replace(tzinfo=datetime.timezone.utc)
-
-                    time_range_start = None
-                    time_range_end = None
-
-                    if time_range_element is not None:
-                        time_range_start, time_range_end = radicale_filter.parse_time_range(time_range_element)
-
-                    (expanded_element, n_vev) = _expand(
-                        element=element, item=copy.copy(item),
-                        start=start, end=end,
-                        time_range_start=time_range_start, time_range_end=time_range_end,
-                        max_occurrence=max_occurrence,
-                    )
+    # The filters are compiled once for all items
+    filter_matches = [compile_filter(collection_tag, filter_)
+                      for filter_ in main_filters]
 
-                    if n_vev == 0:
-                        logger.debug("No VEVENTs found after expansion for %r, skipping", item.href)
-                        continue
+    def match(item: radicale_item.Item) -> bool:
+        try:
+            return all(filter_match(item) for filter_match in filter_matches)
+        except ValueError as e:
+            raise ValueError("Failed to filter item %r from %r: %s" %
+                             (item.href, collection.path, e)) from e
+        except Exception as e:
+            raise RuntimeError("Failed to filter item %r from %r: %s" %
+                               (item.href, collection.path, e)) from e
+
+    def responses() -> Iterator[ET.Element]:
+        n_vevents = 0
+        n_results = 0
+        while retrieved_items:
+            # Don't keep reference to ``item``, because VObject requires a
+            # lot of memory.
+            item, filters_matched = retrieved_items.pop(0)
+            # Items are filtered while the responses are sent
+            if filters and not filters_matched and not match(item):
+                continue
 
-                    n_vevents += n_vev
-                    if prop.tag == xmlutils.make_clark("D:getetag"):
-                        if n_vev > 0:
-                            logger.trace("REPORT/xml_report: getetag/expanded element")
+            found_props = []
+            not_found_props = []
+
+            for prop in props:
+                element = ET.Element(prop.tag)
+                if prop.tag == xmlutils.make_clark("D:getcontenttype"):
+                    element.text = xmlutils.get_content_type(item, encoding)
+                    found_props.append(element)
+                elif prop.tag in (
+                        xmlutils.make_clark("C:calendar-data"),
+                        xmlutils.make_clark("D:getetag"),
+                        xmlutils.make_clark("CR:address-data")):
+                    element.text = item.serialize()
+
+                    if (expand is not None) and item.component_name == 'VEVENT':
+                        assert expand_start is not None and expand_end is not None
+                        time_range_start = None
+                        time_range_end = None
+
+                        if time_range_element is not None:
+                            time_range_start, time_range_end = radicale_filter.parse_time_range(time_range_element)
+
+                        expand_key: ExpandKey = (
+                            item.etag, expand_start, expand_end,
+                            time_range_start, time_range_end, max_occurrence)
+                        cached = (expand_cache.get(expand_key)
+                                  if expand_cache is not None else None)
+                        if cached is not None:
+                            logger.trace("REPORT/xml_report: expand cache hit")
+                            expanded_element = element
+                            expanded_element.text, n_vev = cached
+                        else:
+                            (expanded_element, n_vev) = _expand(
+                                element=element, item=copy.copy(item),
+                                start=expand_start, end=expand_end,
+                                time_range_start=time_range_start, time_range_end=time_range_end,
+                                max_occurrence=max_occurrence,
+                            )
+                            if expand_cache is not None:
+                                expand_cache.put(expand_key,
+                                                 expanded_element.text or "",
+                                                 n_vev)
+
+                        if n_vev == 0:
+                            logger.debug("No VEVENTs found after expansion for %r, skipping", item.href)
+                            continue
+
+                        n_vevents += n_vev
+                        if prop.tag == xmlutils.make_clark("D:getetag"):
+                            if n_vev > 0:
+                                logger.trace("REPORT/xml_report: getetag/expanded element")
+                                element.text = item.etag
+                                found_props.append(element)
+                            else:
+                                logger.trace("REPORT/xml_report: getetag/no expanded element")
+                        else:
+                            logger.trace("REPORT/xml_report: default")
+                            selection = selections[prop.tag]
+                            if selection is not None:
+                                expanded_element.text = radicale_select.select(
+                                    expanded_element.text or "", selection)
+                            found_props.append(expanded_element)
+                    else:
+                        if prop.tag == xmlutils.make_clark("D:getetag"):
                             element.text = item.etag
                             found_props.append(element)
                         else:
-                            logger.trace("REPORT/xml_report: getetag/no expanded element")
-                    else:
-                        logger.trace("REPORT/xml_report: default")
-                        found_props.append(expanded_element)
+                            if max_occurrence:
+                                n_vevents += element.text.count(
+                                    "\nBEGIN:VEVENT")
+                            selection = selections[prop.tag]
+                            if selection is not None:
+                                element.text = radicale_select.select(
+                                    element.text, selection)
+                            found_props.append(element)
+                    # Avoid DoS with too many events
+                    if max_occurrence and n_vevents > max_occurrence:
+                        raise ValueError("REPORT occurrences limit of {} hit"
+                                         .format(max_occurrence))
                 else:
-                    if prop.tag == xmlutils.make_clark("D:getetag"):
-                        element.text = item.etag
-                        found_props.append(element)
-                    else:
-                        found_props.append(element)
-                        if hasattr(item.vobject_item, "vevent_list"):
-                            n_vevents += len(item.vobject_item.vevent_list)
-                # Avoid DoS with too many events
-                if max_occurrence and n_vevents > max_occurrence:
-                    raise ValueError("REPORT occurrences limit of {} hit"
-                                     .format(max_occurrence))
-            else:
-                not_found_props.append(element)
-
-        assert item.href
-        uri = pathutils.unstrip_path(
-            posixpath.join(collection.path, item.href))
-
-        if found_props or not_found_props:
-            multistatus.append(xml_item_response(
-                base_prefix, uri, found_props=found_props,
-                not_found_props=not_found_props, found_item=True, share=share))
-
-    return client.MULTI_STATUS, multistatus
+                    not_found_props.append(element)
+
+            assert item.href
+            uri = pathutils.unstrip_path(
+                posixpath.join(collection.path, item.href))
+
+            if found_props or not_found_props:
+                if query and limit and n_results == limit:
+                    yield xml_limit_response(base_prefix, collection_uri, share)
+                    return
+                n_results += 1
+                yield xml_item_response(
+                    base_prefix, uri, found_props=found_props,
+                    not_found_props=not_found_props, found_item=True, share=share)
+        if truncated:
+            yield xml_limit_response(base_prefix, collection_uri, share)
+
+    responses_iter = responses()
+    if expand is not None or max_occurrence and sum(
+            item.count("\nBEGIN:VEVENT") for item, _ in
+            retrieved_items) > max_occurrence:
+        # The expansion might fail or the occurrences limit might be hit
+        # by the matching items, build all responses before the status is
+        # sent
+        return client.MULTI_STATUS, iter(list(itertools.chain(
+            multistatus, responses_iter)))
+    # Errors while filtering the first item still result in a proper error
+    # response
+    first_response = list(itertools.islice(responses_iter, 1))
+    return client.MULTI_STATUS, itertools.chain(
+        multistatus, first_response, responses_iter)
 
 
 def _expand(
@@ -726,6 +900,38 @@ def _find_overridden(
     return (start, None)
 
 
+def _parse_limit(root: ET.Element, max_results: int = 0) -> int:
+    """Get the limit of results from ``D:limit`` (sync-collection) or
+    ``CR:limit`` (addressbook-query) and ``max_results``."""
+    limit = max_results
+    for namespace in ("D", "CR"):
+        nresults = root.find("%s/%s" % (
+            xmlutils.make_clark("%s:limit" % namespace),
+            xmlutils.make_clark("%s:nresults" % namespace)))
+        if nresults is None:
+            continue
+        try:
+            value = int(nresults.text or "")
+        except ValueError:
+            value = 0
+        if value <= 0:
+            raise ValueError("Invalid limit: %r" % nresults.text)
+        limit = min(limit, value) if limit else value
+    return limit
+
+
+def xml_limit_response(base_prefix: str, href: str,
+                       share: Union[dict, None] = None) -> ET.Element:
+    """Mark a truncated result (see rfc6578-3.6)."""
+    response = xml_item_response(base_prefix, href, found_item=False,
+                                 share=share)
+    status = response.find(xmlutils.make_clark("D:status"))
+    assert status is not None
+    status.text = xmlutils.make_response(client.INSUFFICIENT_STORAGE)
+    response.append(xmlutils.webdav_error("D:number-of-matches-within-limits"))
+    return response
+
+
 def xml_item_response(base_prefix: str, href: str,
                       found_props: Sequence[ET.Element] = (),
                       not_found_props: Sequence[ET.Element] = (),
@@ -776,7 +982,7 @@ def xml_item_response(base_prefix: str, href: str,
 def retrieve_items(
         base_prefix: str, path: str, collection: storage.BaseCollection,
         hreferences: Iterable[str], filters: Sequence[ET.Element],
-        multistatus: ET.Element, share: Union[dict, None]) -> Iterator[Tuple[radicale_item.Item, bool]]:
+        multistatus: List[ET.Element], share: Union[dict, None]) -> Iterator[Tuple[radicale_item.Item, bool]]:
     """Retrieves all items that are referenced in ``hreferences`` from
        ``collection`` and adds 404 responses for missing and invalid items
        to ``multistatus``."""
@@ -826,37 +1032,60 @@ def retrieve_items(
         yield from collection.get_filtered(filters)
 
 
-def test_filter(collection_tag: str, item: radicale_item.Item,
-                filter_: ET.Element) -> bool:
-    """Match an item against a filter."""
+def compile_filter(collection_tag: str, filter_: ET.Element
+                   ) -> Callable[[radicale_item.Item], bool]:
+    """Compile a filter into a predicate for items.
+
+    The filter is traversed and its values are parsed once, the predicate
+    can be evaluated for many items. ``ValueError`` is raised for invalid
+    filters.
+
+    """
     if (collection_tag == "VCALENDAR" and
             filter_.tag != xmlutils.make_clark("C:%s" % filter_)):
         if len(filter_) == 0:
-            return True
+            return lambda item: True
         if len(filter_) > 1:
             raise ValueError("Filter with %d children" % len(filter_))
         if filter_[0].tag != xmlutils.make_clark("C:comp-filter"):
             raise ValueError("Unexpected %r in filter" % filter_[0].tag)
-        return radicale_filter.comp_match(item, filter_[0])
+        return radicale_filter.compile_comp_filter(filter_[0])
     if (collection_tag == "VADDRESSBOOK" and
             filter_.tag != xmlutils.make_clark("CR:%s" % filter_)):
         for child in filter_:
             if child.tag != xmlutils.make_clark("CR:prop-filter"):
                 raise ValueError("Unexpected %r in filter" % child.tag)
+        prop_filters = [radicale_filter.compile_prop_filter(f, "CR")
+                        for f in filter_]
         test = filter_.get("test", "anyof")
         if test == "anyof":
-            return any(radicale_filter.prop_match(item.vobject_item, f, "CR")
-                       for f in filter_)
+            return lambda item: any(match(item.vobject_item)
+                                    for match in prop_filters)
         if test == "allof":
-            return all(radicale_filter.prop_match(item.vobject_item, f, "CR")
-                       for f in filter_)
+            return lambda item: all(match(item.vobject_item)
+                                    for match in prop_filters)
         raise ValueError("Unsupported filter test: %r" % test)
     raise ValueError("Unsupported filter %r for %r" %
                      (filter_.tag, collection_tag))
 
 
+def test_filter(collection_tag: str, item: radicale_item.Item,
+                filter_: ET.Element) -> bool:
+    """Match an item against a filter."""
+    return compile_filter(collection_tag, filter_)(item)
+
+
 class ApplicationPartReport(ApplicationBase):
 
+    _expand_cache: Optional[ExpandCache]
+
+    def __init__(self, configuration: config.Configuration) -> None:
+        super().__init__(configuration)
+        max_expand_cache_size = configuration.get(
+            "reporting", "max_expand_cache_size")
+        self._expand_cache = (ExpandCache(max_expand_cache_size)
+                              if max_expand_cache_size else None)
+
     def do_REPORT(self, environ: types.WSGIEnviron, base_prefix: str,
                   path: str, user: str, request_info: dict) -> types.WSGIResponse:
         """Manage REPORT request."""
@@ -913,14 +1142,22 @@ class ApplicationPartReport(ApplicationBase):
                 return status, headers, str(body), xmlutils.pretty_xml(xml_content)
             else:
                 max_occurrence = self.configuration.get("reporting", "max_expand_occurrence")
+                answer: types.WSGIResponseContent
                 try:
                     status, xml_answer = xml_report(
                         base_prefix, path, xml_content, collection, self._encoding,
-                        lock_stack.close, max_occurrence, user, request_info, share=share)
+                        lock_stack.close, max_occurrence, user, request_info, share=share,
+                        max_results=self.configuration.get("reporting", "max_results"),
+                        expand_cache=self._expand_cache)
+                    request_info["status"] = status
+                    if isinstance(xml_answer, ET.Element):
+                        answer = self._xml_response(xml_answer, request_info)
+                    else:
+                        answer = self._xml_multistatus_response(
+                            xml_answer, request_info)
                 except ValueError as e:
                     logger.warning(
                         "Bad REPORT request on %r: %s", path, e, exc_info=True)
                     return httputils.BAD_REQUEST
                 headers = {"Content-Type": "text/xml; charset=%s" % self._encoding}
-                request_info["status"] = status
-                return status, headers, self._xml_response(xml_answer, request_info), xmlutils.pretty_xml(xml_content)
+                return status, headers, answer, xmlutils.pretty_xml(xml_content)
@@ -52,6 +52,9 @@ PROFILING: Sequence[str] = ("per_request", "per_request_method", "none")
 
 VALIDATE_TYPES: Sequence[str] = ("none", "minimal", "unicode-letter", "unicode-none", "strict")
 
+CONTENT_CODINGS: Sequence[str] = ("zstd", "gzip")
+SENDFILE_TYPES: Sequence[str] = ("none", "x-accel-redirect", "x-sendfile")
+
 
 def positive_int(value: Any) -> int:
     value = int(value)
@@ -94,6 +97,45 @@ def validate_types(value: Any) -> str:
     return value
 
 
+def sendfile_type(value: Any) -> str:
+    if value not in SENDFILE_TYPES:
+        raise ValueError("unsupported sendfile type: %r" % value)
+    return value
+
+
+def list_of_content_codings(value: Any) -> List[str]:
+    result = []
+    for coding in value.split(","):
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        if coding not in CONTENT_CODINGS:
+            raise ValueError("unsupported content coding: %r" % coding)
+        result.append(coding)
+    return result
+
+
+def list_of_property_names(value: Any) -> List[str]:
+    result = []
+    for name in value.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if not re.fullmatch(r"[a-z0-9-]+", name):
+            raise ValueError("invalid property name: %r" % name)
+        if name not in result:
+            result.append(name)
+    return result
+
+
+def compression_level(value: Any) -> int:
+    value = int(value)
+    # zstd supports levels up to 22, gzip is limited to 9
+    if not (value == -1 or 1 <= value <= 22):
+        raise ValueError("value is not -1 or in range 1 to 22: %d" % value)
+    return value
+
+
 def profiling(value: Any) -> str:
     if value not in PROFILING:
         raise ValueError("unsupported profiling: %r" % value)
@@ -117,7 +159,16 @@ def list_of_ip_address(value: Any) -> List[Tuple[str, int]]:
         except ValueError:
             raise ValueError("malformed IP address: %r" % value)
 
-    return [ip_address(s) for s in value.split(",")]
+    return [ip_address(s) for s in value.split(",") if s.strip()]
+
+
+def file_mode(value: Any) -> str:
+    if not value:
+        return ""
+    mode = int(value, 8)
+    if mode < 0 or mode > 0o777:
+        raise ValueError("file mode out of range: %r" % value)
+    return value
 
 
 def str_or_callable(value: Any) -> Union[str, Callable]:
@@ -238,6 +289,22 @@ DEFAULT_CONFIG_SCHEMA: types.CONFIG_SCHEMA = OrderedDict([
             "help": "set server hostnames including ports",
             "aliases": ("-H", "--hosts",),
             "type": list_of_ip_address}),
+        ("unix_socket", {
+            "value": "",
+            "help": "set path of Unix domain socket to listen on (empty: disabled)",
+            "type": filepath}),
+        ("unix_socket_mode", {
+            "value": "",
+            "help": "file mode of Unix domain socket (empty: system default)",
+            "type": file_mode}),
+        ("unix_socket_owner", {
+            "value": "",
+            "help": "owner of Unix domain socket (empty: unchanged)",
+            "type": str}),
+        ("unix_socket_group", {
+            "value": "",
+            "help": "group of Unix domain socket (empty: unchanged)",
+            "type": str}),
         ("max_connections", {
             "value": "8",
             "help": "maximum number of parallel connections",
@@ -258,6 +325,26 @@ DEFAULT_CONFIG_SCHEMA: types.CONFIG_SCHEMA = OrderedDict([
             "value": "10000",
             "help": "maximum occurrence by an RRULE (default: 10000)",
             "type": positive_int}),
+        ("compression", {
+            "value": "zstd, gzip",
+            "help": "content codings for compressing responses in order of preference (" + "|".join(CONTENT_CODINGS) + ")",
+            "type": list_of_content_codings}),
+        ("compression_min_size", {
+            "value": "1024",
+            "help": "minimum size of responses in bytes to compress",
+            "type": positive_int}),
+        ("compression_level", {
+            "value": "-1",
+            "help": "compression level from 1 (fastest) to 22 (best, gzip uses at most 9), -1: default of the content coding",
+            "type": compression_level}),
+        ("sendfile", {
+            "value": "none",
+            "help": "let the reverse proxy send cached exports of collections (" + "|".join(SENDFILE_TYPES) + ")",
+            "type": sendfile_type}),
+        ("sendfile_prefix", {
+            "value": "/internal-radicale",
+            "help": "internal location of the reverse proxy mapped to the storage folder (x-accel-redirect)",
+            "type": str}),
         ("timeout", {
             "value": "30",
             "help": "socket timeout",
@@ -555,6 +642,18 @@ DEFAULT_CONFIG_SCHEMA: types.CONFIG_SCHEMA = OrderedDict([
             "value": "2592000",  # 30 days
             "help": "delete sync token that are older",
             "type": positive_int}),
+        ("max_export_cache_size", {
+            "value": "0",
+            "help": "maximum size in bytes of cached exports per collection (0: disabled)",
+            "type": positive_int}),
+        ("indexed_properties", {
+            "value": "summary, categories, status, fn, email, tel",
+            "help": "properties stored in the item cache for prefiltering queries",
+            "type": list_of_property_names}),
+        ("max_cached_occurrences", {
+            "value": "1000",
+            "help": "maximum number of recurrences stored in the item cache for time-range filters (0: disabled)",
+            "type": positive_int}),
         ("skip_broken_item", {
             "value": "True",
             "help": "skip broken item instead of triggering exception",
@@ -739,7 +838,11 @@ This is an automated message. Please do not reply.""",
         ("prefer_browser_login", {
             "value": "False",
             "help": "prefer browser login",
-            "type": bool})])),
+            "type": bool}),
+        ("max_age", {
+            "value": "3600",
+            "help": "time in seconds browsers may cache web assets without revalidation",
+            "type": positive_int})])),
     ("logging", OrderedDict([
         ("level", {
             "value": "info",
@@ -839,6 +942,18 @@ This is an automated message. Please do not reply.""",
         ("max_freebusy_occurrence", {
             "value": "10000",
             "help": "number of free-busy occurrences per event when reporting",
+            "type": positive_int}),
+        ("max_expand_cache_size", {
+            "value": "10000000",
+            "help": "maximum size in characters of cached expanded calendar data (0: disabled)",
+            "type": positive_int}),
+        ("max_response_cache_size", {
+            "value": "0",
+            "help": "maximum size in characters of cached PROPFIND and REPORT responses (0: disabled)",
+            "type": positive_int}),
+        ("max_results", {
+            "value": "0",
+            "help": "maximum number of results of a query or sync-collection report (0: unlimited)",
             "type": positive_int})]))
     ])
 
@@ -24,17 +24,26 @@ Helper functions for HTTP.
 """
 
 import contextlib
+import email.utils
 import logging
 import os
 import pathlib
 import sys
 import time
+import zlib
 from http import client
-from typing import List, Mapping, Union, cast
+from typing import (Any, Callable, Dict, Iterator, List, Mapping, Sequence,
+                    Union, cast)
 
 from radicale import config, log, pathutils, types, utils
 from radicale.log import logger
 
+try:
+    from compression import zstd  # type: ignore[import-not-found]
+except ImportError:
+    # Python < 3.14
+    zstd = None
+
 if sys.version_info < (3, 9):
     import pkg_resources
 
@@ -104,6 +113,8 @@ MIMETYPES: Mapping[str, str] = {
     ".woff2": "font/woff2",
     ".xml": "text/xml"}
 FALLBACK_MIMETYPE: str = "application/octet-stream"
+COMPRESSIBLE_MIMETYPES: Sequence[str] = (
+    "application/javascript", "application/json", "application/xml")
 
 
 def bad_request(additional_details: str) -> types.WSGIResponse:
@@ -177,6 +188,126 @@ def read_request_body(configuration: "config.Configuration",
     return content
 
 
+def _gzip_compressor(level: int) -> Any:
+    # Levels above 9 are only supported by zstd
+    return zlib.compressobj(min(level, 9), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _zstd_compressor(level: int) -> Any:
+    return zstd.ZstdCompressor(level=None if level < 0 else level)
+
+
+# Content codings that are available for compressing responses
+CONTENT_CODINGS: Dict[str, Callable[[int], Any]] = {"gzip": _gzip_compressor}
+if zstd is not None:
+    CONTENT_CODINGS["zstd"] = _zstd_compressor
+
+
+def is_compressible(content_type: str) -> bool:
+    """Check if content of type ``content_type`` benefits from compression."""
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return (mimetype.startswith("text/") or
+            mimetype in COMPRESSIBLE_MIMETYPES or mimetype.endswith("+xml") or
+            mimetype.endswith("+json"))
+
+
+def negotiate_content_coding(environ: types.WSGIEnviron,
+                             codings: Sequence[str]) -> str:
+    """Select the content coding of the response from ``Accept-Encoding``.
+
+    ``codings`` are the available content codings in order of preference.
+    Returns ``identity`` if none of them is acceptable.
+
+    """
+    accepted: Dict[str, float] = {}
+    for value in environ.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = value.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, param_value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    result, result_quality = "identity", 0.0
+    for coding in codings:
+        quality = accepted.get(coding, accepted.get("*", 0.0))
+        if quality > result_quality:
+            result, result_quality = coding, quality
+    return result
+
+
+def compress(content: bytes, coding: str, level: int = -1) -> bytes:
+    """Compress ``content`` with the content coding ``coding``."""
+    if coding == "identity":
+        return content
+    compressor = CONTENT_CODINGS[coding](level)
+    return compressor.compress(content) + compressor.flush()
+
+
+def encode_stream(chunks: Iterator[str], encoding: str,
+                  coding: str = "identity", level: int = -1
+                  ) -> Iterator[bytes]:
+    """Encode (and optionally compress) streamed content chunk by chunk."""
+    compressor = None
+    if coding != "identity":
+        compressor = CONTENT_CODINGS[coding](level)
+    try:
+        for chunk in chunks:
+            data = chunk.encode(encoding)
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def not_modified(environ: types.WSGIEnviron, etag: str,
+                 last_modified: str = "") -> bool:
+    """Evaluate ``If-None-Match`` and ``If-Modified-Since`` of a GET or HEAD
+    request.
+
+    Returns ``True`` if the representation of the client is up to date and
+    ``304 Not Modified`` can be answered (see RFC 7232 6).
+
+    """
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        # Weak comparison, If-Modified-Since is ignored
+        opaque_etag = etag.removeprefix("W/")
+        return any(value.strip() == "*" or
+                   value.strip().removeprefix("W/") == opaque_etag
+                   for value in if_none_match.split(","))
+    if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+    if if_modified_since and last_modified:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+            modified = email.utils.parsedate_to_datetime(last_modified)
+            return modified <= since
+        except (TypeError, ValueError):
+            # Invalid date or comparison of naive and aware datetime
+            return False
+    return False
+
+
+def not_modified_response(etag: str, last_modified: str = ""
+                          ) -> types.WSGIResponse:
+    headers = {"ETag": etag}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return client.NOT_MODIFIED, headers, None, None
+
+
 def redirect(location: str, status: int = client.FOUND) -> types.WSGIResponse:
     return (status,
             {"Location": location, "Content-Type": "text/plain"},
@@ -240,16 +371,21 @@ def _serve_traversable(
     return client.OK, headers, answer, None
 
 
+def resource_traversable(package: str, resource: str
+                         ) -> _TRAVERSABLE_LIKE_TYPE:
+    """Locate the folder ``resource`` of ``package``."""
+    if sys.version_info < (3, 9):
+        return pathlib.Path(
+            pkg_resources.resource_filename(package, resource))
+    return resources.files(package).joinpath(resource)
+
+
 def serve_resource(
         package: str, resource: str, base_prefix: str, path: str,
         path_prefix: str = "/.web", index_file: str = "index.html",
         mimetypes: Mapping[str, str] = MIMETYPES,
         fallback_mimetype: str = FALLBACK_MIMETYPE) -> types.WSGIResponse:
-    if sys.version_info < (3, 9):
-        traversable = pathlib.Path(
-            pkg_resources.resource_filename(package, resource))
-    else:
-        traversable = resources.files(package).joinpath(resource)
+    traversable = resource_traversable(package, resource)
     return _serve_traversable(traversable, base_prefix, path, path_prefix,
                               index_file, mimetypes, fallback_mimetype)
 
@@ -25,15 +25,17 @@ Module for address books and calendar entries (see ``Item``).
 """
 
 import binascii
+import codecs
 import contextlib
 import datetime
+import json
 import math
 import os
 import re
 from hashlib import sha256
 from itertools import chain
-from typing import (Any, Callable, List, MutableMapping, Optional, Sequence,
-                    Tuple, Union)
+from typing import (Any, Callable, Dict, Iterable, List, MutableMapping,
+                    Optional, Sequence, Tuple, Union)
 
 import vobject
 
@@ -425,6 +427,95 @@ def find_tag(vobject_item: vobject.base.Component) -> str:
     return ""
 
 
+def find_vtimezones(text: str
+                    ) -> Optional[Tuple[Tuple[int, str, str], ...]]:
+    """Find the VTIMEZONE components in the text of a VCALENDAR item.
+
+    Returns a tuple with the offset, the TZID (empty if missing) and the
+    text of every VTIMEZONE. Returns ``None`` if the properties of the
+    VCALENDAR don't precede all components, then the components can't be
+    separated by offsets (see ``BaseCollection.serialize_stream``).
+
+    """
+    if not (text.startswith("BEGIN:VCALENDAR\r\n") and
+            text.endswith("\r\nEND:VCALENDAR\r\n")):
+        return None
+    vtimezones: List[Tuple[int, str, str]] = []
+    has_components = False
+    start = tzid = None
+    depth = 0
+    offset = 0
+    for line in text[:-2].split("\r\n"):
+        if line.startswith("BEGIN:"):
+            depth += 1
+            if depth == 1 and offset > 0:
+                return None
+            if depth == 2:
+                has_components = True
+                if line == "BEGIN:VTIMEZONE":
+                    start, tzid = offset, ""
+        elif depth == 1 and has_components and not line.startswith("END:"):
+            # Property of VCALENDAR after components
+            return None
+        elif depth == 2 and start is not None and line.startswith("TZID:"):
+            tzid = line[len("TZID:"):]
+        if line.startswith("END:"):
+            if depth == 2 and start is not None:
+                assert tzid is not None
+                end = offset + len(line) + 2
+                vtimezones.append((start, tzid, text[start:end]))
+                start = None
+            depth -= 1
+        offset += len(line) + 2
+    if depth != 0 or not has_components:
+        return None
+    return tuple(vtimezones)
+
+
+def join_vtimezones(text: str, vtimezones: Iterable[Tuple[int, str]]
+                    ) -> str:
+    """Insert the texts of VTIMEZONE components at their offsets (see
+    ``find_vtimezones``) into the text of an item without them."""
+    parts: List[str] = []
+    pos = 0
+    removed = 0
+    for offset, vtimezone in vtimezones:
+        parts.append(text[pos:offset - removed])
+        parts.append(vtimezone)
+        pos = offset - removed
+        removed += len(vtimezone)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def index_properties(vobject_item: vobject.base.Component, tag: str,
+                     names: Iterable[str]) -> Dict[str, Tuple[str, ...]]:
+    """Collect the normalized values of the properties ``names`` from the
+    primary components of ``vobject_item``.
+
+    Properties that are not defined map to an empty tuple. See
+    ``radicale_filter.prefilter_properties``.
+
+    """
+    if vobject_item.name == "VCALENDAR":
+        components = [component for component in vobject_item.components()
+                      if component.name == tag]
+    else:
+        components = [vobject_item]
+    index: Dict[str, Tuple[str, ...]] = {}
+    for name in names:
+        values: List[str] = []
+        for component in components:
+            for prop in getattr(component, "%s_list" % name, []):
+                if type(prop.value) is list:
+                    values.extend(map(radicale_filter.normalize_text,
+                                      prop.value))
+                else:
+                    values.append(radicale_filter.normalize_text(prop.value))
+        index[name] = tuple(dict.fromkeys(values))
+    return index
+
+
 def find_time_range(vobject_item: vobject.base.Component, tag: str
                     ) -> Tuple[int, int]:
     """Find enclosing time range from ``vobject item``.
@@ -590,12 +681,23 @@ def trigger_to_timedelta(trigger) -> Union[datetime.timedelta, None]:
 class Item:
     """Class for address book and calendar entries."""
 
+    # Many instances are created per request (see ``get_all``)
+    __slots__ = ("collection", "href", "last_modified", "indexed_props",
+                 "occurrences", "vtimezones", "_collection_path", "_text",
+                 "_raw", "_raw_encoding", "_vobject_item", "_etag", "_uid",
+                 "_name", "_component_name", "_time_range")
+
     collection: Optional["storage.BaseCollection"]
     href: Optional[str]
     last_modified: Optional[str]
+    indexed_props: Optional[Dict[str, Tuple[str, ...]]]
+    occurrences: Optional[radicale_filter.Occurrences]
+    vtimezones: Optional[Tuple[Tuple[int, str, str], ...]]
 
     _collection_path: str
     _text: Optional[str]
+    _raw: Optional[bytes]
+    _raw_encoding: str
     _vobject_item: Optional[vobject.base.Component]
     _etag: Optional[str]
     _uid: Optional[str]
@@ -614,7 +716,11 @@ class Item:
                  uid: Optional[str] = None,
                  name: Optional[str] = None,
                  component_name: Optional[str] = None,
-                 time_range: Optional[Tuple[int, int]] = None):
+                 time_range: Optional[Tuple[int, int]] = None,
+                 indexed_props: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 occurrences: Optional[radicale_filter.Occurrences] = None,
+                 vtimezones: Optional[Tuple[Tuple[int, str, str], ...]] = None,
+                 raw: Optional[bytes] = None, raw_encoding: str = ""):
         """Initialize an item.
 
         ``collection_path`` the path of the parent collection (optional if
@@ -627,7 +733,7 @@ class Item:
         ``last_modified`` the HTTP-datetime of when the item was modified.
 
         ``text`` the text representation of the item (optional if
-        ``vobject_item`` is set).
+        ``vobject_item`` or ``raw`` is set).
 
         ``vobject_item`` the vobject item (optional if ``text`` is set).
 
@@ -642,10 +748,27 @@ class Item:
 
         ``time_range`` the enclosing time range. See ``find_time_range``.
 
+        ``indexed_props`` the values of indexed properties (optional). See
+        ``index_properties``.
+
+        ``occurrences`` the precomputed time ranges (optional). See
+        ``radicale_filter.find_occurrences``.
+
+        ``vtimezones`` the VTIMEZONE components in ``text`` (optional). See
+        ``find_vtimezones``.
+
+        ``raw_encoding`` the encoding of the stored content, if it is
+        exactly ``text`` (optional). See ``stored_as``.
+
+        ``raw`` the stored content (optional). It is decoded on demand
+        instead of ``text`` if the latter is omitted. See ``serialize_bytes``.
+
         """
-        if text is None and vobject_item is None:
-            raise ValueError(
-                "At least one of 'text' or 'vobject_item' must be set")
+        if raw is not None and not raw_encoding:
+            raise ValueError("'raw' requires 'raw_encoding'")
+        if text is None and vobject_item is None and raw is None:
+            raise ValueError("At least one of 'text', 'vobject_item' or "
+                             "'raw' must be set")
         if collection_path is None:
             if collection is None:
                 raise ValueError("At least one of 'collection_path' or "
@@ -658,14 +781,22 @@ class Item:
         self.href = href
         self.last_modified = last_modified
         self._text = text
+        self._raw = raw
+        self._raw_encoding = raw_encoding
         self._vobject_item = vobject_item
         self._etag = etag
         self._uid = uid
         self._name = name
         self._component_name = component_name
         self._time_range = time_range
+        self.indexed_props = indexed_props
+        self.occurrences = occurrences
+        self.vtimezones = vtimezones
 
     def serialize(self) -> str:
+        if self._text is None and self._raw is not None:
+            # Not cached, to avoid keeping the content twice in memory
+            return self._raw.decode(self._raw_encoding)
         if self._text is None:
             try:
                 self._text = self.vobject_item.serialize()
@@ -675,11 +806,41 @@ class Item:
                                     e)) from e
         return self._text
 
+    def stored_as(self, encoding: str) -> bool:
+        """Check if the stored content is the text representation encoded
+        with ``encoding``."""
+        return bool(self._raw_encoding) and (
+            codecs.lookup(self._raw_encoding).name ==
+            codecs.lookup(encoding).name)
+
+    def serialize_bytes(self, encoding: str) -> bytes:
+        """Get the text representation encoded with ``encoding``.
+
+        The stored bytes are returned without a round trip through ``str``
+        if they use the same encoding.
+
+        """
+        if self._raw is not None and self.stored_as(encoding):
+            return self._raw
+        return self.serialize().encode(encoding)
+
+    def count(self, sub: str) -> int:
+        """Count the occurrences of the ASCII string ``sub`` in the text
+        representation.
+
+        UTF-8 encoded stored content is searched without decoding it.
+
+        """
+        if (self._text is None and self._raw is not None and
+                codecs.lookup(self._raw_encoding).name == "utf-8"):
+            return self._raw.count(sub.encode("ascii"))
+        return self.serialize().count(sub)
+
     @property
     def vobject_item(self):
         if self._vobject_item is None:
             try:
-                self._vobject_item = vobject.readOne(self._text)
+                self._vobject_item = vobject.readOne(self.serialize())
             except Exception as e:
                 raise RuntimeError("Failed to parse item %r from %r: %s" %
                                    (self.href, self._collection_path,
@@ -730,6 +891,28 @@ class Item:
         self._vobject_item = orig_vobject_item
 
     def convert_vcf_to_ics(self, ShareActions: dict = {}) -> Union["Item", None]:
+        """Convert a vCard with BDAY into a calendar item with birthday
+        events.
+
+        The result is cached by the collection per etag of the vCard and
+        ``ShareActions`` (see ``BaseCollection.get_converted_item``).
+
+        """
+        if (not isinstance(self.collection, storage.BaseCollection) or
+                self.href is None):
+            return self._convert_vcf_to_ics(ShareActions)
+        key = sha256()
+        key.update(storage.CACHE_VERSION)
+        key.update(self.etag.encode())
+        key.update(json.dumps(ShareActions, sort_keys=True,
+                              default=str).encode())
+        # The age support depends on the current year
+        key.update(str(datetime.date.today().year).encode())
+        return self.collection.get_converted_item(
+            self.href, "bday", key.hexdigest(),
+            lambda: self._convert_vcf_to_ics(ShareActions))
+
+    def _convert_vcf_to_ics(self, ShareActions: dict) -> Union["Item", None]:
         logger.trace("item/convert_vcf_to_ics: ShareActions: %r", ShareActions)
         logger.trace("item/convert_vcf_to_ics: convert VCF to ICS (href): %r", self.href)
         logger.trace("item/convert_vcf_to_ics: convert VCF to ICS (vobject): %r", self.vobject_item)
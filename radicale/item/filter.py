@@ -20,13 +20,15 @@
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import bisect
 import math
+import re
 import sys
 import xml.etree.ElementTree as ET
 from datetime import date, datetime, timedelta, timezone
 from itertools import chain
-from typing import (Callable, Iterable, Iterator, List, Optional, Sequence,
-                    Tuple, Union)
+from typing import (Any, Callable, Iterable, Iterator, List, Mapping,
+                    NamedTuple, Optional, Sequence, Tuple, Union)
 
 import vobject
 
@@ -40,6 +42,8 @@ DATETIME_MIN: datetime = datetime.min.replace(tzinfo=timezone.utc)
 DATETIME_MAX: datetime = datetime.max.replace(tzinfo=timezone.utc)
 TIMESTAMP_MIN: int = math.floor(DATETIME_MIN.timestamp())
 TIMESTAMP_MAX: int = math.ceil(DATETIME_MAX.timestamp())
+EPOCH: datetime = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND: timedelta = timedelta(microseconds=1)
 
 if sys.version_info < (3, 10):
     TRIGGER = Union[datetime, None]
@@ -85,13 +89,49 @@ def time_range_timestamps(time_filter: ET.Element) -> Tuple[int, int]:
     return (math.floor(start.timestamp()), math.ceil(end.timestamp()))
 
 
-def comp_match(item: "item.Item", filter_: ET.Element, level: int = 0) -> bool:
-    """Check whether the ``item`` matches the comp ``filter_``.
+ItemPredicate = Callable[["item.Item"], bool]
+ComponentPredicate = Callable[[vobject.base.Component], bool]
+TimeRangePredicate = Callable[[vobject.base.Component, str, TRIGGER], bool]
 
-    If ``level`` is ``0``, the filter is applied on the
-    item's collection. Otherwise, it's applied on the item.
 
-    See rfc4791-9.7.1.
+class Occurrences(NamedTuple):
+    """Precomputed time ranges of the primary component of an item.
+
+    ``starts`` are the sorted starts of the time ranges in microseconds
+    since the epoch, ``ends`` the maximum end of the time ranges up to the
+    same index. Time ranges that start at or after ``horizon`` are not
+    included (``None`` if the list is complete).
+
+    See ``find_occurrences``.
+
+    """
+
+    starts: Tuple[int, ...]
+    ends: Tuple[int, ...]
+    horizon: Optional[int]
+
+
+def _microseconds(d: datetime) -> int:
+    return (d - EPOCH) // MICROSECOND
+
+
+def _invalid(message: str) -> Callable[..., bool]:
+    """Predicate for invalid parts of a filter.
+
+    The error is only raised when the part is evaluated.
+
+    """
+    def fn(*args) -> bool:
+        raise ValueError(message)
+    return fn
+
+
+def compile_comp_filter(filter_: ET.Element, level: int = 0
+                        ) -> ItemPredicate:
+    """Compile the comp ``filter_`` into a predicate for items.
+
+    The predicate is equivalent to ``comp_match``, but the filter is only
+    traversed and parsed once.
 
     """
 
@@ -99,119 +139,291 @@ def comp_match(item: "item.Item", filter_: ET.Element, level: int = 0) -> bool:
     # HACK: the filters are tested separately against all components
 
     name = filter_.get("name", "").upper()
-    logger.trace("ITEM/FILTER/comp_match: name=%s level=%d", name, level)
-
-    if level == 0:
-        tag = item.name
-    elif level == 1:
-        tag = item.component_name
-    elif level == 2:
-        tag = item.component_name
-    else:
-        logger.warning(
-            "Filters with %d levels of comp-filter are not supported", level)
-        return True
-    if not tag:
-        return False
-    if len(filter_) == 0:
-        # Point #1 of rfc4791-9.7.1
-        return name == tag
-    if len(filter_) == 1:
-        if filter_[0].tag == xmlutils.make_clark("C:is-not-defined"):
-            # Point #2 of rfc4791-9.7.1
-            return name != tag
-    if (level < 2) and (name != tag):
-        return False
-    if ((level == 0 and name != "VCALENDAR") or
-            (level == 1 and name not in ("VTODO", "VEVENT", "VJOURNAL")) or
-            (level == 2 and name not in ("VALARM"))):
-        logger.warning("Filtering %s is not supported", name)
-        return True
+    if level > 2:
+        def unsupported_level(item: "item.Item") -> bool:
+            logger.warning("Filters with %d levels of comp-filter are not "
+                           "supported", level)
+            return True
+        return unsupported_level
+    # Point #1 and #2 of rfc4791-9.7.1
+    is_defined = len(filter_) == 0
+    is_not_defined = len(filter_) == 1 and (
+        filter_[0].tag == xmlutils.make_clark("C:is-not-defined"))
+    supported = not ((level == 0 and name != "VCALENDAR") or
+                     (level == 1 and name not in ("VTODO", "VEVENT", "VJOURNAL")) or
+                     (level == 2 and name not in ("VALARM")))
     # Point #3 and #4 of rfc4791-9.7.1
-    trigger = None
-    if level == 0:
-        components = [item.vobject_item]
-    elif level == 1:
-        components = list(getattr(item.vobject_item, "%s_list" % tag.lower()))
-    elif level == 2:
-        components = list(getattr(item.vobject_item, "%s_list" % tag.lower()))
-        for comp in components:
-            subcomp = getattr(comp, name.lower(), None)
-            if not subcomp:
-                return False
-            if hasattr(subcomp, "trigger"):
-                # rfc4791-7.8.5:
-                trigger = subcomp.trigger.value
+    children: List[Callable[["item.Item", List[vobject.base.Component],
+                             TRIGGER], bool]] = []
+    # Components are only needed to match properties and alarms, items
+    # are not parsed otherwise
+    needs_components = level == 2
     for child in filter_:
         if child.tag == xmlutils.make_clark("C:prop-filter"):
-            logger.trace("ITEM/FILTER/comp_match: prop-filter level=%d", level)
-            if not any(prop_match(comp, child, "C")
-                       for comp in components):
-                return False
+            def prop_filter(item: "item.Item",
+                            components: List[vobject.base.Component],
+                            trigger: TRIGGER,
+                            match: ComponentPredicate = compile_prop_filter(
+                                child, "C")) -> bool:
+                return any(match(comp) for comp in components)
+            children.append(prop_filter)
+            needs_components = True
         elif child.tag == xmlutils.make_clark("C:time-range"):
-            logger.trace("ITEM/FILTER/comp_match: time-range level=%d tag=%s", level, tag)
-            if (level == 0) and (name == "VCALENDAR"):
-                for name_try in ("VTODO", "VEVENT", "VJOURNAL"):
-                    try:
-                        if time_range_match(item.vobject_item, filter_[0], name_try, trigger):
-                            return True
-                    except Exception:
-                        continue
-                return False
-            if not time_range_match(item.vobject_item, filter_[0], tag, trigger):
-                return False
+            # The time range is read from the first child (see ``comp_match``)
+            def time_range(item: "item.Item",
+                           components: List[vobject.base.Component],
+                           trigger: TRIGGER,
+                           match: TimeRangePredicate = compile_time_range(
+                               filter_[0]),
+                           match_occurrences: Callable[
+                               [Occurrences], Optional[bool]] = (
+                               compile_occurrences_match(filter_[0]))
+                           ) -> bool:
+                tag = item.name if level == 0 else item.component_name
+                occurrences = item.occurrences
+                if (not trigger and occurrences is not None and
+                        item.component_name in ("VTODO", "VEVENT",
+                                                "VJOURNAL") and
+                        (level == 0 and name == "VCALENDAR" or
+                         level == 1)):
+                    matched = match_occurrences(occurrences)
+                    if matched is not None:
+                        return matched
+                if (level == 0) and (name == "VCALENDAR"):
+                    for name_try in ("VTODO", "VEVENT", "VJOURNAL"):
+                        try:
+                            if match(item.vobject_item, name_try, trigger):
+                                return True
+                        except Exception:
+                            continue
+                    return False
+                return match(item.vobject_item, tag, trigger)
+            children.append(time_range)
         elif child.tag == xmlutils.make_clark("C:comp-filter"):
-            logger.trace("ITEM/FILTER/comp_match: comp-filter level=%d", level)
-            if not comp_match(item, child, level=level + 1):
-                return False
+            def comp_filter(item: "item.Item",
+                            components: List[vobject.base.Component],
+                            trigger: TRIGGER,
+                            match: ItemPredicate = compile_comp_filter(
+                                child, level + 1)) -> bool:
+                return match(item)
+            children.append(comp_filter)
         else:
-            raise ValueError("Unexpected %r in comp-filter" % child.tag)
-    return True
+            children.append(_invalid("Unexpected %r in comp-filter" %
+                                     child.tag))
+
+    def match(item: "item.Item") -> bool:
+        tag = item.name if level == 0 else item.component_name
+        if not tag:
+            return False
+        if is_defined:
+            return name == tag
+        if is_not_defined:
+            return name != tag
+        if (level < 2) and (name != tag):
+            return False
+        if not supported:
+            logger.warning("Filtering %s is not supported", name)
+            return True
+        trigger = None
+        components: List[vobject.base.Component] = []
+        if not needs_components:
+            pass
+        elif level == 0:
+            components = [item.vobject_item]
+        else:
+            components = list(getattr(item.vobject_item,
+                                      "%s_list" % tag.lower()))
+        if level == 2:
+            for comp in components:
+                subcomp = getattr(comp, name.lower(), None)
+                if not subcomp:
+                    return False
+                if hasattr(subcomp, "trigger"):
+                    # rfc4791-7.8.5:
+                    trigger = subcomp.trigger.value
+        return all(child(item, components, trigger) for child in children)
+    return match
 
 
-def prop_match(vobject_item: vobject.base.Component,
-               filter_: ET.Element, ns: str) -> bool:
-    """Check whether the ``item`` matches the prop ``filter_``.
+def comp_match(item: "item.Item", filter_: ET.Element, level: int = 0) -> bool:
+    """Check whether the ``item`` matches the comp ``filter_``.
 
-    See rfc4791-9.7.2 and rfc6352-10.5.1.
+    If ``level`` is ``0``, the filter is applied on the
+    item's collection. Otherwise, it's applied on the item.
+
+    See rfc4791-9.7.1.
+
+    """
+    logger.trace("ITEM/FILTER/comp_match: name=%s level=%d",
+                 filter_.get("name", "").upper(), level)
+    return compile_comp_filter(filter_, level)(item)
+
+
+def compile_prop_filter(filter_: ET.Element, ns: str) -> ComponentPredicate:
+    """Compile the prop ``filter_`` into a predicate for components.
+
+    See ``prop_match``.
 
     """
     name = filter_.get("name", "").lower()
     if len(filter_) == 0:
         # Point #1 of rfc4791-9.7.2
-        return name in vobject_item.contents
+        return lambda vobject_item: name in vobject_item.contents
     if len(filter_) == 1:
         if filter_[0].tag == xmlutils.make_clark("%s:is-not-defined" % ns):
             # Point #2 of rfc4791-9.7.2
-            return name not in vobject_item.contents
-    if name not in vobject_item.contents:
-        return False
+            return lambda vobject_item: name not in vobject_item.contents
     # Point #3 and #4 of rfc4791-9.7.2
+    children: List[ComponentPredicate] = []
     for child in filter_:
         if ns == "C" and child.tag == xmlutils.make_clark("C:time-range"):
-            if not time_range_match(vobject_item, child, name, None):
-                return False
+            def time_range(vobject_item: vobject.base.Component,
+                           match: TimeRangePredicate = compile_time_range(
+                               child)) -> bool:
+                return match(vobject_item, name, None)
+            children.append(time_range)
         elif child.tag == xmlutils.make_clark("%s:text-match" % ns):
-            if not text_match(vobject_item, child, name, ns):
-                return False
+            children.append(compile_text_match(child, name, ns))
         elif child.tag == xmlutils.make_clark("%s:param-filter" % ns):
-            if not param_filter_match(vobject_item, child, name, ns):
-                return False
+            children.append(compile_param_filter(child, name, ns))
         else:
-            raise ValueError("Unexpected %r in prop-filter" % child.tag)
-    return True
+            children.append(_invalid("Unexpected %r in prop-filter" %
+                                     child.tag))
+
+    def match(vobject_item: vobject.base.Component) -> bool:
+        if name not in vobject_item.contents:
+            return False
+        return all(child(vobject_item) for child in children)
+    return match
+
+
+def prop_match(vobject_item: vobject.base.Component,
+               filter_: ET.Element, ns: str) -> bool:
+    """Check whether the ``item`` matches the prop ``filter_``.
+
+    See rfc4791-9.7.2 and rfc6352-10.5.1.
+
+    """
+    return compile_prop_filter(filter_, ns)(vobject_item)
+
+
+def compile_time_range(filter_: ET.Element) -> TimeRangePredicate:
+    """Compile the time-range ``filter_`` into a predicate.
+
+    See ``time_range_match``.
+
+    """
+    if not filter_.get("start") and not filter_.get("end"):
+        return lambda vobject_item, child_name, trigger: False
+    try:
+        start, end = parse_time_range(filter_)
+    except ValueError as e:
+        return _invalid(str(e))
+
+    def match(vobject_item: vobject.base.Component, child_name: str,
+              trigger: TRIGGER) -> bool:
+        return _time_range_match(vobject_item, start, end, child_name,
+                                 trigger)
+    return match
+
+
+def compile_occurrences_match(filter_: ET.Element
+                              ) -> Callable[[Occurrences], Optional[bool]]:
+    """Compile the time-range ``filter_`` into a predicate for precomputed
+    occurrences.
+
+    The predicate returns ``None`` if the occurrences don't cover the time
+    range, see ``time_range_match`` for the result otherwise.
+
+    """
+    if not filter_.get("start") and not filter_.get("end"):
+        return lambda occurrences: False
+    try:
+        start, end = parse_time_range(filter_)
+    except ValueError:
+        # The error is reported by ``time_range_match``
+        return lambda occurrences: None
+    start_us, end_us = _microseconds(start), _microseconds(end)
+
+    def match(occurrences: Occurrences) -> Optional[bool]:
+        if occurrences.horizon is not None and end_us > occurrences.horizon:
+            return None
+        # Time ranges before ``i`` start before the end of the filter
+        i = bisect.bisect_left(occurrences.starts, end_us)
+        return i > 0 and occurrences.ends[i - 1] > start_us
+    return match
+
+
+def find_occurrences(vobject_item: vobject.base.Component, child_name: str,
+                     max_occurrences: int) -> Optional[Occurrences]:
+    """Precompute the time ranges of the component ``child_name`` of
+    ``vobject_item`` for ``time_range_match``.
+
+    At most ``max_occurrences`` recurrences of the main component are
+    included. Returns ``None`` if the time ranges can't be precomputed.
+
+    """
+    # Every start of VEVENT and VJOURNAL has a single time range and the
+    # starts of the main component are visited in order, so matching any
+    # of the time ranges is equivalent to ``time_range_match``
+    if child_name not in ("VEVENT", "VJOURNAL") or max_occurrences <= 0:
+        return None
+    ranges: List[Tuple[int, int]] = []
+    horizon: Optional[int] = None
+    count = 0
+
+    def range_fn(range_start: datetime, range_end: datetime,
+                 is_recurrence: bool) -> bool:
+        nonlocal horizon, count
+        if not is_recurrence:
+            if count >= max_occurrences:
+                horizon = _microseconds(range_start)
+                return True
+            count += 1
+        ranges.append((_microseconds(range_start), _microseconds(range_end)))
+        return False
+
+    def infinity_fn(start: datetime) -> bool:
+        return False
+
+    try:
+        visit_time_ranges(vobject_item, child_name, range_fn, infinity_fn)
+    except Exception as e:
+        # Errors are reported by ``time_range_match``
+        logger.debug("Can't precompute occurrences: %s", e)
+        return None
+    return _sorted_occurrences(ranges, horizon)
+
+
+def occurrences_from_ranges(ranges: Iterable[Tuple[datetime, datetime]]
+                            ) -> Occurrences:
+    """Create ``Occurrences`` from all time ranges of a component."""
+    return _sorted_occurrences([
+        (_microseconds(range_start), _microseconds(range_end))
+        for range_start, range_end in ranges], None)
+
+
+def _sorted_occurrences(ranges: List[Tuple[int, int]],
+                        horizon: Optional[int]) -> Occurrences:
+    ranges.sort()
+    ends: List[int] = []
+    for _, range_end in ranges:
+        ends.append(max(ends[-1], range_end) if ends else range_end)
+    return Occurrences(tuple(range_start for range_start, _ in ranges),
+                       tuple(ends), horizon)
 
 
 def time_range_match(vobject_item: vobject.base.Component,
                      filter_: ET.Element, child_name: str, trigger: TRIGGER) -> bool:
     """Check whether the component/property ``child_name`` of
        ``vobject_item`` matches the time-range ``filter_``."""
-    # supporting since 3.5.4 now optional trigger (either absolute or relative offset)
+    return compile_time_range(filter_)(vobject_item, child_name, trigger)
 
-    if not filter_.get("start") and not filter_.get("end"):
-        return False
 
-    start, end = parse_time_range(filter_)
+def _time_range_match(vobject_item: vobject.base.Component, start: datetime,
+                      end: datetime, child_name: str, trigger: TRIGGER
+                      ) -> bool:
+    # supporting since 3.5.4 now optional trigger (either absolute or relative offset)
     matched = False
 
     def range_fn(range_start: datetime, range_end: datetime,
@@ -564,76 +776,277 @@ def visit_time_ranges(vobject_item: vobject.base.Component, child_name: str,
                 range_fn(child, child + DAY, False)
 
 
-def text_match(vobject_item: vobject.base.Component,
-               filter_: ET.Element, child_name: str, ns: str,
-               attrib_name: Optional[str] = None) -> bool:
-    """Check whether the ``item`` matches the text-match ``filter_``.
+def normalize_text(value: Any) -> str:
+    """Normalize a property value for text-match."""
+    if not isinstance(value, str):
+        # Some properties (e.g. N and ADR in vCard) are parsed by vobject
+        # into structured objects instead of plain strings. Use their text
+        # representation so text-match doesn't crash with AttributeError.
+        value = str(value)
+    return value.lower()
 
-    See rfc4791-9.7.5.
+
+def _text_matcher(filter_: ET.Element, ns: str) -> Callable[[str], bool]:
+    """Create a predicate for normalized values from the text-match
+    ``filter_`` (without ``negate-condition``).
+
+    ``ValueError`` is raised for invalid filters.
 
     """
     # TODO: collations are not supported, but the default ones needed
     # for DAV servers are actually pretty useless. Texts are lowered to
     # be case-insensitive, almost as the "i;ascii-casemap" value.
-    text = next(filter_.itertext()).lower()
+    text = next(filter_.itertext(), None)
+    if text is None:
+        raise ValueError("Empty text-match")
+    text = text.lower()
     match_type = "contains"
     if ns == "CR":
         match_type = filter_.get("match-type", match_type)
+    if match_type == "equals":
+        return text.__eq__
+    if match_type == "contains":
+        return lambda value: text in value
+    if match_type == "starts-with":
+        return lambda value: value.startswith(text)
+    if match_type == "ends-with":
+        return lambda value: value.endswith(text)
+    raise ValueError("Unexpected text-match match-type: %r" % match_type)
 
-    def match(value: str) -> bool:
-        if not isinstance(value, str):
-            # Some properties (e.g. N and ADR in vCard) are parsed by vobject
-            # into structured objects instead of plain strings. Use their text
-            # representation so text-match doesn't crash with AttributeError.
-            value = str(value)
-        value = value.lower()
-        if match_type == "equals":
-            return value == text
-        if match_type == "contains":
-            return text in value
-        if match_type == "starts-with":
-            return value.startswith(text)
-        if match_type == "ends-with":
-            return value.endswith(text)
-        raise ValueError("Unexpected text-match match-type: %r" % match_type)
-
-    children = getattr(vobject_item, "%s_list" % child_name, [])
-    if attrib_name is not None:
-        condition = any(
-            match(attrib) for child in children
-            for attrib in child.params.get(attrib_name, []))
-    else:
-        res = []
-        for child in children:
-            # Some filters such as CATEGORIES provide a list in child.value
-            if type(child.value) is list:
-                for value in child.value:
-                    res.append(match(value))
-            else:
-                res.append(match(child.value))
-        condition = any(res)
-    if filter_.get("negate-condition") == "yes":
-        return not condition
-    return condition
 
+def compile_text_match(filter_: ET.Element, child_name: str, ns: str,
+                       attrib_name: Optional[str] = None
+                       ) -> ComponentPredicate:
+    """Compile the text-match ``filter_`` into a predicate for components.
 
-def param_filter_match(vobject_item: vobject.base.Component,
-                       filter_: ET.Element, parent_name: str, ns: str) -> bool:
-    """Check whether the ``item`` matches the param-filter ``filter_``.
+    See ``text_match``.
 
-    See rfc4791-9.7.3.
+    """
+    try:
+        match_text = _text_matcher(filter_, ns)
+    except ValueError as e:
+        match_text = _invalid(str(e))
+    negate = filter_.get("negate-condition") == "yes"
+
+    def match_value(value: Any) -> bool:
+        return match_text(normalize_text(value))
+
+    def match(vobject_item: vobject.base.Component) -> bool:
+        children = getattr(vobject_item, "%s_list" % child_name, [])
+        if attrib_name is not None:
+            condition = any(
+                match_value(attrib) for child in children
+                for attrib in child.params.get(attrib_name, []))
+        else:
+            res = []
+            for child in children:
+                # Some filters such as CATEGORIES provide a list in child.value
+                if type(child.value) is list:
+                    for value in child.value:
+                        res.append(match_value(value))
+                else:
+                    res.append(match_value(child.value))
+            condition = any(res)
+        if negate:
+            return not condition
+        return condition
+    return match
+
+
+def text_match(vobject_item: vobject.base.Component,
+               filter_: ET.Element, child_name: str, ns: str,
+               attrib_name: Optional[str] = None) -> bool:
+    """Check whether the ``item`` matches the text-match ``filter_``.
+
+    See rfc4791-9.7.5.
+
+    """
+    return compile_text_match(filter_, child_name, ns, attrib_name)(
+        vobject_item)
+
+
+def compile_param_filter(filter_: ET.Element, parent_name: str, ns: str
+                         ) -> ComponentPredicate:
+    """Compile the param-filter ``filter_`` into a predicate for components.
+
+    See ``param_filter_match``.
 
     """
     name = filter_.get("name", "").upper()
-    children = getattr(vobject_item, "%s_list" % parent_name, [])
-    condition = any(name in child.params for child in children)
+    match_text: Optional[ComponentPredicate] = None
+    is_not_defined = False
     if len(filter_) > 0:
         if filter_[0].tag == xmlutils.make_clark("%s:text-match" % ns):
-            return condition and text_match(
-                vobject_item, filter_[0], parent_name, ns, name)
-        if filter_[0].tag == xmlutils.make_clark("%s:is-not-defined" % ns):
+            match_text = compile_text_match(filter_[0], parent_name, ns, name)
+        elif filter_[0].tag == xmlutils.make_clark("%s:is-not-defined" % ns):
+            is_not_defined = True
+
+    def match(vobject_item: vobject.base.Component) -> bool:
+        children = getattr(vobject_item, "%s_list" % parent_name, [])
+        condition = any(name in child.params for child in children)
+        if match_text is not None:
+            return condition and match_text(vobject_item)
+        if is_not_defined:
             return not condition
-    return condition
+        return condition
+    return match
+
+
+def param_filter_match(vobject_item: vobject.base.Component,
+                       filter_: ET.Element, parent_name: str, ns: str) -> bool:
+    """Check whether the ``item`` matches the param-filter ``filter_``.
+
+    See rfc4791-9.7.3.
+
+    """
+    return compile_param_filter(filter_, parent_name, ns)(vobject_item)
+
+
+IndexPredicate = Callable[[Mapping[str, Tuple[str, ...]]], bool]
+
+
+def _prefilter_prop(filter_: ET.Element, ns: str, single: bool
+                    ) -> Optional[IndexPredicate]:
+    """Create a predicate for the indexed properties of an item from the
+    prop ``filter_``.
+
+    The predicate only returns ``False`` if no component of the item can
+    match the filter. ``single`` indicates that the properties are
+    indexed from a single component. Properties that are not indexed
+    always match.
+
+    """
+    name = filter_.get("name", "").lower()
+    if len(filter_) == 0:
+        return lambda index: name not in index or bool(index[name])
+    if len(filter_) == 1 and filter_[0].tag == xmlutils.make_clark(
+            "%s:is-not-defined" % ns):
+        if not single:
+            return None
+        return lambda index: name not in index or not index[name]
+    matchers: List[Callable[[str], bool]] = []
+    for child in filter_:
+        if (child.tag != xmlutils.make_clark("%s:text-match" % ns) or
+                child.get("negate-condition") == "yes"):
+            continue
+        try:
+            matchers.append(_text_matcher(child, ns))
+        except ValueError:
+            # The error is reported when the filter is evaluated
+            continue
+
+    def match(index: Mapping[str, Tuple[str, ...]]) -> bool:
+        if name not in index:
+            return True
+        values = index[name]
+        return bool(values) and all(any(match_text(value) for value in values)
+                                    for match_text in matchers)
+    return match
+
+
+def prefilter_properties(filters: Iterable[ET.Element], collection_tag: str
+                         ) -> Optional[IndexPredicate]:
+    """Create a predicate for the indexed properties of an item (see
+    ``item.index_properties``) from ``filters``.
+
+    The predicate only returns ``False`` if the item can't match
+    ``filters``, it's not an exact evaluation of ``filters``. Returns
+    ``None`` if ``filters`` contain no conditions on properties.
+
+    """
+    conditions: List[IndexPredicate] = []
+    for filter_ in filters:
+        if collection_tag == "VCALENDAR":
+            for col_filter in filter_:
+                if (col_filter.tag != xmlutils.make_clark("C:comp-filter") or
+                        col_filter.get("name", "").upper() != "VCALENDAR"):
+                    continue
+                for comp_filter in col_filter:
+                    if (comp_filter.tag != xmlutils.make_clark(
+                            "C:comp-filter") or
+                            comp_filter.get("name", "").upper() not in (
+                                "VTODO", "VEVENT", "VJOURNAL") or
+                            comp_filter.find(xmlutils.make_clark(
+                                "C:is-not-defined")) is not None):
+                        continue
+                    for prop_filter in comp_filter:
+                        if prop_filter.tag != xmlutils.make_clark(
+                                "C:prop-filter"):
+                            continue
+                        condition = _prefilter_prop(prop_filter, "C", False)
+                        if condition is not None:
+                            conditions.append(condition)
+        elif collection_tag == "VADDRESSBOOK":
+            prop_conditions = [
+                _prefilter_prop(prop_filter, "CR", True)
+                for prop_filter in filter_ if prop_filter.tag ==
+                xmlutils.make_clark("CR:prop-filter")]
+            test = filter_.get("test", "anyof")
+            if test == "allof":
+                conditions.extend(condition for condition in prop_conditions
+                                  if condition is not None)
+            elif test == "anyof" and prop_conditions and all(
+                    condition is not None for condition in prop_conditions):
+                def any_condition(index: Mapping[str, Tuple[str, ...]],
+                                  prop_conditions: Sequence[Optional[
+                                      IndexPredicate]] = prop_conditions
+                                  ) -> bool:
+                    return any(condition(index) for condition in
+                               prop_conditions if condition is not None)
+                conditions.append(any_condition)
+    if not conditions:
+        return None
+    return lambda index: all(condition(index) for condition in conditions)
+
+
+def text_tokens(text: str) -> List[str]:
+    """Split the normalized ``text`` into words.
+
+    A text that contains another text contains the words of the other text
+    as substrings of its words (the first and last word may be partial).
+
+    """
+    return re.findall(r"\w+", text)
+
+
+def prefilter_terms(filters: Iterable[ET.Element], collection_tag: str
+                    ) -> List[List[Tuple[str, str]]]:
+    """Collect terms from the ``text-match`` conditions of an
+    addressbook-query.
+
+    Returns a list of alternatives. Items can only match ``filters`` if, for
+    every alternative, a value of the property ``name`` of one of the terms
+    ``(name, text)`` contains the normalized ``text``.
+
+    """
+    if collection_tag != "VADDRESSBOOK":
+        return []
+    conditions: List[List[Tuple[str, str]]] = []
+    for filter_ in filters:
+        prop_terms: List[List[Tuple[str, str]]] = []
+        for prop_filter in filter_:
+            if prop_filter.tag != xmlutils.make_clark("CR:prop-filter"):
+                continue
+            name = prop_filter.get("name", "").lower()
+            terms = []
+            for child in prop_filter:
+                if (child.tag != xmlutils.make_clark("CR:text-match") or
+                        child.get("negate-condition") == "yes"):
+                    continue
+                try:
+                    _text_matcher(child, "CR")
+                except ValueError:
+                    # The error is reported when the filter is evaluated
+                    continue
+                terms.append((name, next(child.itertext()).lower()))
+            prop_terms.append(terms)
+        test = filter_.get("test", "anyof")
+        if test == "allof":
+            conditions.extend([term] for terms in prop_terms
+                              for term in terms)
+        elif test == "anyof" and prop_terms and all(prop_terms):
+            conditions.append([terms[0] for terms in prop_terms])
+    return conditions
 
 
 def simplify_prefilters(filters: Iterable[ET.Element], collection_tag: str
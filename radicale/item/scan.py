@@ -0,0 +1,562 @@
+# This file is part of Radicale - CalDAV and CardDAV server
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Extraction of the metadata of simple items without VObject.
+
+The text of an item is scanned line by line for the UID, the component
+name and the time range. Only items that VObject would parse to the same
+values are accepted: a single non-recurring component with UTC, floating or
+date values, without time zones and without encoded properties. The text
+must also be exactly what VObject serializes the item to, because it is
+served and hashed for the ETag as it is (see ``_serialized``). Everything
+else is left to the full VObject path (see ``scan``).
+
+"""
+
+import math
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from radicale.item import filter as radicale_filter
+from radicale.item.select import (_content_lines, _property_name, _split_value,
+                                  _unfold)
+
+# Properties of the main component that require recurrence expansion
+RECURRENCE_PROPERTIES: Tuple[str, ...] = (
+    "RRULE", "RDATE", "EXDATE", "EXRULE", "RECURRENCE-ID")
+
+# Properties that VObject parses into structured values or dates
+STRUCTURED_PROPERTIES: Dict[str, Tuple[str, ...]] = {
+    "VCALENDAR": ("dtstart", "dtend", "due", "duration", "dtstamp",
+                  "created", "last-modified", "completed", "recurrence-id",
+                  "rdate", "exdate", "trigger"),
+    "VCARD": ("n", "adr")}
+
+_DATE_RE = re.compile(r"(\d{4})(\d{2})(\d{2})")
+_DATETIME_RE = re.compile(r"(\d{4})(\d{2})(\d{2})T(\d{2})(\d{2})(\d{2})(Z?)")
+_DURATION_RE = re.compile(
+    r"\+?P(?:(\d+)W|(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?)")
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")
+_NAME_RE = re.compile(r"[A-Z0-9-]+")
+_GROUP_RE = re.compile(r"[A-Za-z0-9-]+")
+_UTC_DATETIME_RE = re.compile(r"\d{8}T\d{6}Z")
+_SIGNED_DURATION_RE = re.compile(
+    r"(-?)P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?")
+
+# Line length used by VObject for folding
+FOLD_LENGTH: int = 75
+
+# Children that VObject serializes before all others (``sortFirst``)
+SORT_FIRST: Dict[str, Tuple[str, ...]] = {
+    "VCALENDAR": ("version", "calscale", "method", "prodid", "vtimezone"),
+    "VEVENT": ("uid", "recurrence-id", "dtstart", "duration", "dtend"),
+    "VCARD": ("version", "prodid", "uid")}
+
+# Properties that VObject generates if they are missing
+IMPLICIT_PROPERTIES: Dict[str, Tuple[str, ...]] = {
+    "VCALENDAR": ("PRODID", "VERSION"),
+    "VEVENT": ("UID", "DTSTAMP"),
+    "VTODO": ("UID", "DTSTAMP"),
+    "VJOURNAL": ("UID", "DTSTAMP"),
+    "VALARM": ("ACTION", "TRIGGER"),
+    "VCARD": ("VERSION",)}
+
+# Properties that may occur more than once in a component (besides ``X-``)
+REPEATED_PROPERTIES: Dict[str, Tuple[str, ...]] = {
+    "VEVENT": ("ATTACH", "ATTENDEE", "CATEGORIES", "COMMENT", "CONTACT",
+               "RELATED-TO", "RESOURCES"),
+    "VTODO": ("ATTACH", "ATTENDEE", "CATEGORIES", "COMMENT", "CONTACT",
+              "RELATED-TO", "RESOURCES"),
+    "VJOURNAL": ("ATTACH", "ATTENDEE", "CATEGORIES", "COMMENT", "CONTACT",
+                 "RELATED-TO")}
+
+# Properties that VObject splits at commas
+MULTI_TEXT_PROPERTIES: Dict[str, Tuple[str, ...]] = {
+    "VEVENT": ("CATEGORIES", "RESOURCES"),
+    "VTODO": ("CATEGORIES", "RESOURCES"),
+    "VJOURNAL": ("CATEGORIES",),
+    "VCARD": ("CATEGORIES",)}
+
+# Number of fields of structured vCard properties, ``0`` if variable
+VCARD_FIELDS: Dict[str, int] = {"N": 5, "ADR": 7, "ORG": 0}
+
+# Properties with values that VObject rewrites in ways not checked here
+REWRITTEN_PROPERTIES: Tuple[str, ...] = (
+    "RRULE", "EXRULE", "RDATE", "EXDATE", "REQUEST-STATUS", "FREEBUSY",
+    "PHOTO")
+
+# A content line as (parameters, value)
+Property = Tuple[str, str]
+
+
+class ScannedItem:
+    """Metadata of an item extracted by ``scan``.
+
+    ``ranges`` contains the time ranges of the main component as visited by
+    ``radicale_filter.visit_time_ranges``. ``props`` maps the lowercase
+    names of the properties of the main component to their raw values.
+
+    """
+
+    uid: str
+    name: str
+    component_name: str
+    ranges: List[Tuple[datetime, datetime]]
+    props: Dict[str, List[str]]
+
+    def __init__(self, uid: str, name: str, component_name: str,
+                 ranges: List[Tuple[datetime, datetime]],
+                 props: Dict[str, List[str]]) -> None:
+        self.uid = uid
+        self.name = name
+        self.component_name = component_name
+        self.ranges = ranges
+        self.props = props
+
+    @property
+    def time_range(self) -> Tuple[int, int]:
+        """See ``radicale_item.find_time_range``."""
+        if not self.component_name:
+            return radicale_filter.TIMESTAMP_MIN, radicale_filter.TIMESTAMP_MAX
+        start = min((start for start, _ in self.ranges),
+                    default=radicale_filter.DATETIME_MIN)
+        end = max((end for _, end in self.ranges),
+                  default=radicale_filter.DATETIME_MAX)
+        return math.floor(start.timestamp()), math.ceil(end.timestamp())
+
+    def index_properties(self, names: Iterable[str]
+                         ) -> Optional[Dict[str, Tuple[str, ...]]]:
+        """See ``radicale_item.index_properties``.
+
+        Returns ``None`` if VObject might parse a value differently.
+
+        """
+        index: Dict[str, Tuple[str, ...]] = {}
+        for name in names:
+            values = self.props.get(name, [])
+            if values and (
+                    name in STRUCTURED_PROPERTIES.get(self.name, ()) or
+                    any(c in value for value in values for c in "\\,;")):
+                return None
+            index[name] = tuple(dict.fromkeys(
+                map(radicale_filter.normalize_text, values)))
+        return index
+
+    def occurrences(self, max_occurrences: int
+                    ) -> Optional[radicale_filter.Occurrences]:
+        """See ``radicale_filter.find_occurrences``."""
+        if (self.component_name not in ("VEVENT", "VJOURNAL") or
+                max_occurrences <= 0):
+            return None
+        return radicale_filter.occurrences_from_ranges(self.ranges)
+
+
+def _parse_params(head: str) -> Optional[Dict[str, str]]:
+    if "\"" in head:
+        return None
+    params: Dict[str, str] = {}
+    for param in head.split(";")[1:]:
+        key, sep, value = param.partition("=")
+        if not sep:
+            return None
+        params[key.upper()] = value.upper()
+    return params
+
+
+def _parse_date(prop: Property) -> Optional[Union[date, datetime]]:
+    """Parse a DATE or DATE-TIME value in UTC or floating time."""
+    params = _parse_params(prop[0])
+    if params is None:
+        return None
+    value_type = params.pop("VALUE", "DATE-TIME")
+    if params:
+        # e.g. TZID
+        return None
+    try:
+        if value_type == "DATE":
+            match = _DATE_RE.fullmatch(prop[1])
+            if match is None or match.group(1) == "0000":
+                return None
+            return date(*map(int, match.groups()))
+        if value_type == "DATE-TIME":
+            match = _DATETIME_RE.fullmatch(prop[1])
+            if match is None or match.group(1) == "0000":
+                return None
+            year, month, day, hour, minute, second = map(
+                int, match.groups()[:6])
+            return datetime(year, month, day, hour, minute, second,
+                            tzinfo=timezone.utc if match.group(7) else None)
+    except ValueError:
+        pass
+    return None
+
+
+def _parse_duration(prop: Property) -> Optional[timedelta]:
+    if prop[0].upper() != "DURATION":
+        return None
+    match = _DURATION_RE.fullmatch(prop[1])
+    if match is None or prop[1].endswith(("P", "T")):
+        return None
+    weeks, days, hours, minutes, seconds = (
+        int(group or 0) for group in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes,
+                     seconds=seconds)
+
+
+def _time_ranges(component_name: str, props: Dict[str, List[Property]]
+                 ) -> Optional[List[Tuple[datetime, datetime]]]:
+    """Time ranges of a non-recurring component as visited by
+    ``radicale_filter.visit_time_ranges``."""
+    values: Dict[str, Union[date, datetime, timedelta]] = {}
+    for name in ("DTSTART", "DTEND", "DUE", "DURATION"):
+        if name not in props:
+            continue
+        if len(props[name]) != 1:
+            return None
+        value = (_parse_duration(props[name][0]) if name == "DURATION" else
+                 _parse_date(props[name][0]))
+        if value is None:
+            return None
+        values[name] = value
+    dtstart = values.get("DTSTART")
+    duration = values.get("DURATION")
+    assert dtstart is None or isinstance(dtstart, date)
+    assert duration is None or isinstance(duration, timedelta)
+    if component_name == "VEVENT":
+        dtend = values.get("DTEND")
+        assert dtend is None or isinstance(dtend, date)
+        if dtstart is None or (dtend is not None and duration is not None):
+            return None
+        start = radicale_filter.date_to_datetime(dtstart)
+        if dtend is not None:
+            if (type(dtstart) is not type(dtend) or
+                    isinstance(dtstart, datetime) and
+                    isinstance(dtend, datetime) and
+                    (dtstart.tzinfo is None) != (dtend.tzinfo is None)):
+                return None
+            # Line 1
+            return [(start, start + (dtend - dtstart))]
+        if duration is not None:
+            # Line 2 and 3
+            return [(start, start + (duration if duration.total_seconds() > 0
+                                     else radicale_filter.SECOND))]
+        # Line 4 and 5
+        return [(start, start + (radicale_filter.SECOND
+                                 if isinstance(dtstart, datetime) else
+                                 radicale_filter.DAY))]
+    if component_name == "VTODO":
+        due = values.get("DUE")
+        assert due is None or isinstance(due, date)
+        second = radicale_filter.SECOND
+        if dtstart is not None:
+            start = radicale_filter.date_to_datetime(dtstart)
+            if duration is not None:
+                # Line 1
+                return [(start, start + duration + second),
+                        (start + duration - second,
+                         start + duration + second)]
+            if due is not None:
+                # Line 2
+                end = radicale_filter.date_to_datetime(due)
+                return [(start, end), (start, start + second),
+                        (end - second, end), (end - second, start + second)]
+            # Line 3
+            return [(start, start + second)]
+        if due is not None:
+            # Line 4
+            end = radicale_filter.date_to_datetime(due)
+            return [(end - second, end)]
+        if "COMPLETED" in props or "CREATED" in props:
+            return None
+        # Line 8
+        return [(radicale_filter.DATETIME_MIN, radicale_filter.DATETIME_MAX)]
+    if component_name == "VJOURNAL":
+        if dtstart is None:
+            return []
+        start = radicale_filter.date_to_datetime(dtstart)
+        # Line 1 and 2
+        return [(start, start + (radicale_filter.SECOND
+                                 if isinstance(dtstart, datetime) else
+                                 radicale_filter.DAY))]
+    return None
+
+
+def _fold(line: str) -> str:
+    """Fold the content line ``line`` like ``vobject.base.foldOneLine``."""
+    if len(line) < FOLD_LENGTH:
+        return line + "\r\n"
+    result: List[str] = []
+    length = 0
+    for char in line:
+        size = len(char.encode("utf-8"))
+        if length + size > FOLD_LENGTH:
+            result.append("\r\n ")
+            length = 1
+        result.append(char)
+        length += size
+    result.append("\r\n")
+    return "".join(result)
+
+
+def _split_text(value: str) -> Optional[List[List[str]]]:
+    """Split ``value`` at unescaped semicolons and then at unescaped commas.
+
+    Returns ``None`` if the value contains escapes that VObject does not
+    write.
+
+    """
+    fields: List[List[str]] = [[""]]
+    escaped = False
+    for char in value:
+        if escaped:
+            if char not in "\\;,n":
+                return None
+            fields[-1][-1] += "\\" + char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ";":
+            fields.append([""])
+        elif char == ",":
+            fields[-1].append("")
+        else:
+            fields[-1][-1] += char
+    return None if escaped else fields
+
+
+def _serialized_list(values: List[str]) -> bool:
+    # VObject drops an empty last value
+    return len(values) == 1 or bool(values[-1])
+
+
+def _serialized_duration(value: str) -> bool:
+    """Check that ``value`` is formatted like
+    ``vobject.icalendar.timedeltaToString``."""
+    match = _SIGNED_DURATION_RE.fullmatch(value)
+    if match is None:
+        return False
+    days, hours, minutes, seconds = (
+        int(group or 0) for group in match.groups()[1:])
+    if hours > 23 or minutes > 59 or seconds > 59:
+        return False
+    time = "".join("%d%s" % (number, unit) for number, unit in (
+        (hours, "H"), (minutes, "M"), (seconds, "S")) if number)
+    if time:
+        time = "T" + time
+    elif not days:
+        time = "T0S"
+    sign = "-" if match.group(1) and (days or time != "T0S") else ""
+    return value == "%sP%s%s" % (sign, "%dD" % days if days else "", time)
+
+
+def _serialized_value(component: str, name: str, params: Dict[str, str],
+                      value: str) -> bool:
+    """Check that VObject writes ``value`` of the property ``name`` in
+    ``component`` unchanged."""
+    if name in REWRITTEN_PROPERTIES:
+        return False
+    if name in ("DTSTAMP", "CREATED", "LAST-MODIFIED", "COMPLETED") or (
+            name == "TRIGGER" and params == {"VALUE": "DATE-TIME"}):
+        return (component != "VCARD" and
+                params == ({"VALUE": "DATE-TIME"} if name == "TRIGGER" else
+                           {}) and
+                bool(_UTC_DATETIME_RE.fullmatch(value)) and
+                _parse_date(("", value)) is not None)
+    if name in ("DTSTART", "DTEND", "DUE", "RECURRENCE-ID"):
+        return (component != "VCARD" and
+                params in ({}, {"VALUE": "DATE"}) and
+                _parse_date((";VALUE=DATE" if params else "", value))
+                is not None)
+    if name in ("DURATION", "TRIGGER"):
+        return (component != "VCARD" and set(params) <= (
+            {"RELATED"} if name == "TRIGGER" else set()) and
+            _serialized_duration(value))
+    fields = _split_text(value)
+    if fields is None:
+        return False
+    if component == "VCARD" and name in VCARD_FIELDS:
+        if VCARD_FIELDS[name]:
+            return len(fields) == VCARD_FIELDS[name] and all(
+                map(_serialized_list, fields))
+        return (all(len(values) == 1 for values in fields) and
+                _serialized_list([values[0] for values in fields]))
+    if len(fields) != 1:
+        return False
+    if name in MULTI_TEXT_PROPERTIES.get(component, ()):
+        return _serialized_list(fields[0])
+    return len(fields[0]) == 1
+
+
+def _serialized_order(component: str, children: List[Tuple[str, bool]]
+                      ) -> bool:
+    """Check that the ``children`` of ``component`` as (lowercase name,
+    is component) are in the order of VObject's serialization."""
+    sort_first = SORT_FIRST.get(component, ())
+
+    def key(child: Tuple[str, bool]) -> Tuple[bool, int, str]:
+        name, is_component = child
+        # Only ``VCALENDAR`` writes its properties before its components
+        first = is_component and component == "VCALENDAR"
+        if name in sort_first:
+            return first, sort_first.index(name), ""
+        return first, len(sort_first), name
+    return children == sorted(children, key=key)
+
+
+def _serialized(text: str) -> bool:
+    """Check that ``text`` is exactly what VObject serializes it to.
+
+    The check is conservative: it only accepts a subset of iCalendar and
+    vCard that is known to pass through VObject unchanged.
+
+    """
+    # Names and children of the enclosing components
+    stack: List[Tuple[str, List[Tuple[str, bool]]]] = []
+    for lines in _content_lines(text):
+        line = _unfold(lines)
+        if _fold(line) != "".join(lines):
+            # e.g. LF line endings or different folding
+            return False
+        head = _split_value(line)
+        if len(head) == len(line) or "\"" in head:
+            return False
+        group, _, name = head.split(";")[0].rpartition(".")
+        value = line[len(head) + 1:]
+        if not _NAME_RE.fullmatch(name) or group and not (
+                stack and stack[0][0] == "VCARD" and
+                _GROUP_RE.fullmatch(group)):
+            return False
+        params: Dict[str, str] = {}
+        for param in head.split(";")[1:]:
+            key, sep, param_value = param.partition("=")
+            # VObject joins repeated parameters and sorts them by name
+            if (not sep or not _NAME_RE.fullmatch(key) or key == "TZID" or
+                    params and key <= list(params)[-1] or
+                    "" in param_value.split(",")):
+                return False
+            params[key] = param_value
+        if name in ("BEGIN", "END") and (
+                params or group or not _NAME_RE.fullmatch(value)):
+            return False
+        if name == "BEGIN":
+            if stack:
+                if (stack[-1][0], value) not in (
+                        ("VCALENDAR", "VEVENT"), ("VCALENDAR", "VTODO"),
+                        ("VCALENDAR", "VJOURNAL"), ("VEVENT", "VALARM"),
+                        ("VTODO", "VALARM")):
+                    return False
+                stack[-1][1].append((value.lower(), True))
+            elif value not in ("VCALENDAR", "VCARD"):
+                return False
+            stack.append((value, []))
+        elif name == "END":
+            if not stack or stack[-1][0] != value:
+                return False
+            component, children = stack.pop()
+            names = [child.upper() for child, is_component in children
+                     if not is_component]
+            if not _serialized_order(component, children) or any(
+                    implicit not in names
+                    for implicit in IMPLICIT_PROPERTIES[component]):
+                return False
+            # VObject refuses to serialize components with too many
+            # properties of the same name
+            if any(names.count(child) > 1 and not child.startswith("X-") and
+                   child not in REPEATED_PROPERTIES.get(component, ()) and
+                   (component != "VCARD" or child in ("N", "VERSION",
+                                                      "PRODID"))
+                   for child in names):
+                return False
+        elif not stack or not _serialized_value(
+                stack[-1][0], name, params, value):
+            return False
+        else:
+            stack[-1][1].append((name.lower(), False))
+    return bool(text) and not stack
+
+
+def scan(text: str, collection_tag: str) -> Optional[ScannedItem]:
+    """Extract the metadata of the item ``text`` in a collection with tag
+    ``collection_tag``.
+
+    Returns ``None`` if the item must be parsed with VObject. The checks of
+    ``radicale_item.check_and_sanitize_items`` are not required for accepted
+    items.
+
+    """
+    if _CONTROL_RE.search(text) or not _serialized(text):
+        return None
+    name = ""
+    component_name = ""
+    # Names of the enclosing components
+    stack: List[str] = []
+    # Properties of the main component
+    props: Dict[str, List[Property]] = {}
+    for lines in _content_lines(text):
+        line = _unfold(lines)
+        head = _split_value(line)
+        if not line.strip() or len(head) == len(line):
+            return None
+        if "ENCODING=" in head.upper() or "CHARSET=" in head.upper():
+            return None
+        prop_name = _property_name(head)
+        value = line[len(head) + 1:]
+        if prop_name == "BEGIN":
+            value = value.strip().upper()
+            if not stack:
+                if name:
+                    # Multiple objects
+                    return None
+                name = value
+            elif len(stack) == 1 and name == "VCALENDAR":
+                if value not in ("VEVENT", "VTODO", "VJOURNAL") or (
+                        component_name):
+                    # e.g. VTIMEZONE or multiple components
+                    return None
+                component_name = value
+            stack.append(value)
+        elif prop_name == "END":
+            if not stack or stack.pop() != value.strip().upper():
+                return None
+        elif not stack:
+            return None
+        elif len(stack) == (2 if name == "VCALENDAR" else 1):
+            props.setdefault(prop_name, []).append((head, value))
+    if stack:
+        return None
+    if (name, collection_tag) not in (("VCALENDAR", "VCALENDAR"),
+                                      ("VCARD", "VADDRESSBOOK")):
+        return None
+    if name == "VCALENDAR":
+        if not component_name or any(
+                prop in props for prop in RECURRENCE_PROPERTIES):
+            return None
+        ranges = _time_ranges(component_name, props)
+        if ranges is None:
+            return None
+    else:
+        # Required by VObject for serialization
+        if "FN" not in props or len(props.get("VERSION", [])) != 1:
+            return None
+        ranges = []
+    uids = props.get("UID", [])
+    if len(uids) != 1 or not uids[0][1] or "\\" in uids[0][1]:
+        return None
+    return ScannedItem(
+        uids[0][1], name, component_name, ranges,
+        {prop_name.lower(): [value for _, value in values]
+         for prop_name, values in props.items()})
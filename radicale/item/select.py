@@ -0,0 +1,165 @@
+# This file is part of Radicale - CalDAV and CardDAV server
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Partial retrieval of calendar and address data.
+
+Select the components and properties requested with ``C:calendar-data``
+(see rfc4791-9.6) or ``CR:address-data`` (see rfc6352-10.4) from the text of
+an item. The text is processed line by line without parsing it with
+VObject.
+
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Optional
+
+from radicale import xmlutils
+
+
+class Selection:
+    """Selected properties and subcomponents of a component.
+
+    ``props`` maps the names of the selected properties to ``novalue``,
+    ``None`` selects all properties. ``comps`` maps the names of the
+    selected subcomponents to their selection, ``None`` selects all
+    subcomponents.
+
+    """
+
+    name: str
+    props: Optional[Dict[str, bool]]
+    comps: Optional[Dict[str, "Selection"]]
+
+    def __init__(self, name: str, props: Optional[Dict[str, bool]] = None,
+                 comps: Optional[Dict[str, "Selection"]] = None) -> None:
+        self.name = name
+        self.props = props
+        self.comps = comps
+
+
+def _parse_props(element: ET.Element, namespace: str
+                 ) -> Optional[Dict[str, bool]]:
+    if element.find(xmlutils.make_clark("%s:allprop" % namespace)) is not None:
+        return None
+    return {prop.get("name", "").upper(): prop.get("novalue") == "yes"
+            for prop in element.findall(
+                xmlutils.make_clark("%s:prop" % namespace))}
+
+
+def _parse_comp(element: ET.Element) -> Selection:
+    comps: Optional[Dict[str, Selection]] = None
+    if element.find(xmlutils.make_clark("C:allcomp")) is None:
+        comps = {}
+        for comp in element.findall(xmlutils.make_clark("C:comp")):
+            selection = _parse_comp(comp)
+            comps[selection.name] = selection
+    return Selection(element.get("name", "").upper(),
+                     _parse_props(element, "C"), comps)
+
+
+def parse_selection(element: ET.Element) -> Optional[Selection]:
+    """Parse the selection of a ``C:calendar-data`` or ``CR:address-data``
+    element.
+
+    Returns ``None`` if the complete data is requested.
+
+    """
+    if element.tag == xmlutils.make_clark("C:calendar-data"):
+        comp = element.find(xmlutils.make_clark("C:comp"))
+        if comp is None:
+            return None
+        return _parse_comp(comp)
+    if element.tag == xmlutils.make_clark("CR:address-data"):
+        props = _parse_props(element, "CR")
+        if not props:
+            return None
+        # VERSION is required in every vCard
+        props.setdefault("VERSION", False)
+        return Selection("VCARD", props, {})
+    return None
+
+
+def _content_lines(text: str) -> Iterator[List[str]]:
+    """Group the physical lines of ``text`` by (folded) content line."""
+    lines: List[str] = []
+    for line in text.splitlines(keepends=True):
+        if lines and line[:1] in (" ", "\t"):
+            lines.append(line)
+            continue
+        if lines:
+            yield lines
+        lines = [line]
+    if lines:
+        yield lines
+
+
+def _unfold(lines: List[str]) -> str:
+    return "".join(line.rstrip("\r\n")[(1 if i else 0):]
+                   for i, line in enumerate(lines))
+
+
+def _split_value(line: str) -> str:
+    """Return the name and parameters of a content line without value."""
+    quoted = False
+    for i, char in enumerate(line):
+        if char == "\"":
+            quoted = not quoted
+        elif char == ":" and not quoted:
+            return line[:i]
+    return line
+
+
+def _property_name(line: str) -> str:
+    name = line.split(":", 1)[0].split(";", 1)[0]
+    # Remove the group (e.g. ``item1.EMAIL``)
+    return name.rpartition(".")[2].upper()
+
+
+def select(text: str, selection: Selection) -> str:
+    """Select the components and properties of ``selection`` from the
+    text of an item."""
+    result: List[str] = []
+    # Selection of the enclosing components, ``None`` if excluded
+    stack: List[Optional[Selection]] = []
+    for lines in _content_lines(text):
+        name = _property_name(lines[0])
+        parent = stack[-1] if stack else None
+        if name == "BEGIN":
+            comp_name = _unfold(lines).split(":", 1)[-1].strip().upper()
+            comp: Optional[Selection]
+            if not stack:
+                comp = selection if comp_name == selection.name else None
+            elif parent is None:
+                comp = None
+            elif parent.comps is None:
+                comp = Selection(comp_name)
+            else:
+                comp = parent.comps.get(comp_name)
+            stack.append(comp)
+            if comp is not None:
+                result.extend(lines)
+        elif name == "END":
+            if stack and stack.pop() is not None:
+                result.extend(lines)
+        elif parent is not None:
+            if parent.props is None:
+                result.extend(lines)
+            elif name in parent.props:
+                if parent.props[name]:
+                    result.append("%s:\r\n" % _split_value(_unfold(lines)))
+                else:
+                    result.extend(lines)
+    return "".join(result)
@@ -23,6 +23,7 @@ Built-in WSGI server.
 
 """
 
+import contextlib
 import http
 import os
 import platform
@@ -30,15 +31,20 @@ import select
 import socket
 import socketserver
 import ssl
+import stat
 import sys
 import wsgiref.simple_server
 from typing import (Any, Callable, Dict, List, MutableMapping, Optional, Set,
                     Tuple, Union)
 from urllib.parse import unquote
 
-from radicale import Application, config, utils
+from radicale import Application, config, pathutils, utils
 from radicale.log import logger
 
+if sys.platform != "win32":
+    import grp
+    import pwd
+
 COMPAT_EAI_ADDRFAMILY: int
 if hasattr(socket, "EAI_ADDRFAMILY"):
     COMPAT_EAI_ADDRFAMILY = socket.EAI_ADDRFAMILY  # type:ignore[attr-defined]
@@ -62,6 +68,9 @@ elif sys.platform == "win32":
 # IPv4 (host, port) and IPv6 (host, port, flowinfo, scopeid)
 ADDRESS_TYPE = utils.ADDRESS_TYPE
 
+# First file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START: int = 3
+
 
 class ParallelHTTPServer(socketserver.ThreadingMixIn,
                          wsgiref.simple_server.WSGIServer):
@@ -69,6 +78,7 @@ class ParallelHTTPServer(socketserver.ThreadingMixIn,
     configuration: config.Configuration
     worker_sockets: Set[socket.socket]
     _timeout: float
+    _socket_activated: bool
 
     # We wait for child threads ourself (ThreadingMixIn)
     block_on_close: bool = False
@@ -76,14 +86,37 @@ class ParallelHTTPServer(socketserver.ThreadingMixIn,
 
     def __init__(self, configuration: config.Configuration, family: int,
                  address: Tuple[str, int], RequestHandlerClass:
-                 Callable[..., http.server.BaseHTTPRequestHandler]) -> None:
+                 Callable[..., http.server.BaseHTTPRequestHandler],
+                 listen_socket: Optional[socket.socket] = None) -> None:
+        """``listen_socket`` is an already bound and listening socket
+        (e.g. passed by systemd socket activation), ``address`` is ignored
+        in this case."""
         self.configuration = configuration
         self.address_family = family
-        super().__init__(address, RequestHandlerClass)
+        self._socket_activated = listen_socket is not None
+        super().__init__(address, RequestHandlerClass,
+                         bind_and_activate=listen_socket is None)
+        if listen_socket is not None:
+            self.socket.close()
+            self.socket = listen_socket
+            try:
+                self.server_bind()
+                self.server_activate()
+            except BaseException:
+                self.server_close()
+                raise
         self.worker_sockets = set()
         self._timeout = configuration.get("server", "timeout")
 
     def server_bind(self) -> None:
+        if self._socket_activated:
+            # HACK: Skip `TCPServer.server_bind`, the socket is already bound
+            self.server_address = self.socket.getsockname()
+            host, port = self.server_address[:2]
+            self.server_name = socket.getfqdn(host)  # type:ignore[arg-type]
+            self.server_port = port
+            self.setup_environ()
+            return
         if self.address_family == socket.AF_INET6:
             # Only allow IPv6 connections to the IPv6 socket
             self.socket.setsockopt(COMPAT_IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
@@ -226,6 +259,67 @@ class ParallelHTTPSServer(ParallelHTTPServer):
         return super().finish_request_locked(request, client_address)
 
 
+class ParallelHTTPUnixServer(ParallelHTTPServer):
+    """Server listening on a Unix domain socket (e.g. behind a reverse
+    proxy on the same host)."""
+
+    def __init__(self, configuration: config.Configuration, path: str,
+                 RequestHandlerClass:
+                 Callable[..., http.server.BaseHTTPRequestHandler],
+                 listen_socket: Optional[socket.socket] = None) -> None:
+        super().__init__(configuration, socket.AF_UNIX,
+                         path, RequestHandlerClass,  # type:ignore[arg-type]
+                         listen_socket)
+
+    def server_bind(self) -> None:
+        if self._socket_activated:
+            # Ownership and mode are managed by the socket provider
+            self.server_address = self.socket.getsockname()
+            self.server_name = "localhost"
+            self.server_port = 80
+            self.setup_environ()
+            return
+        path: str = self.server_address  # type:ignore[assignment]
+        # Remove stale socket left behind by a previous instance
+        with contextlib.suppress(FileNotFoundError):
+            if stat.S_ISSOCK(os.lstat(path).st_mode):
+                os.remove(path)
+        mode: str = self.configuration.get("server", "unix_socket_mode")
+        owner: str = self.configuration.get("server", "unix_socket_owner")
+        group: str = self.configuration.get("server", "unix_socket_group")
+        # Only the owner can connect until the configured mode and
+        # ownership are applied (the umask is process-wide, the server is
+        # bound before any requests are handled)
+        old_umask = os.umask(0o177)
+        try:
+            # HACK: `HTTPServer.server_bind` expects a (host, port) address
+            socketserver.TCPServer.server_bind(self)
+        finally:
+            os.umask(old_umask)
+        self.server_name = "localhost"
+        self.server_port = 80
+        self.setup_environ()
+        if owner or group:
+            uid = pwd.getpwnam(owner).pw_uid if owner else -1
+            gid = grp.getgrnam(group).gr_gid if group else -1
+            os.chown(path, uid, gid)
+        # Without a configured mode the socket gets the mode of the umask
+        os.chmod(path, int(mode, 8) if mode else 0o777 & ~old_umask)
+
+    def get_request(  # type:ignore[override]
+            self) -> Tuple[socket.socket, Tuple[ADDRESS_TYPE, socket.socket]]:
+        request, (_, worker_socket) = super().get_request()
+        # Peers of Unix domain sockets have no address, the reverse proxy
+        # forwards the client address in headers (e.g. X-Forwarded-For)
+        return request, (("", 0), worker_socket)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if not self._socket_activated:
+            with contextlib.suppress(OSError):
+                os.remove(self.server_address)  # type:ignore[arg-type]
+
+
 class ServerHandler(wsgiref.simple_server.ServerHandler):
 
     # Don't pollute WSGI environ with OS environment
@@ -235,6 +329,23 @@ class ServerHandler(wsgiref.simple_server.ServerHandler):
         logger.error("An exception occurred during request: %s",
                      exc_info[1], exc_info=exc_info)  # type:ignore[arg-type]
 
+    def sendfile(self) -> bool:
+        """Send files returned with ``wsgi.file_wrapper`` directly from the
+        file to the socket (``os.sendfile``)."""
+        connection = self.request_handler.connection  # type:ignore[attr-defined]
+        file = self.result.filelike  # type:ignore[attr-defined]
+        try:
+            file.fileno()
+        except (AttributeError, OSError):
+            return False
+        if not self.headers_sent:  # type:ignore[attr-defined]
+            self.send_headers()
+        self._flush()
+        # Falls back to ``send`` for SSL sockets
+        self.bytes_sent += connection.sendfile(  # type:ignore[attr-defined]
+            file)
+        return True
+
 
 class RequestHandler(wsgiref.simple_server.WSGIRequestHandler):
     """HTTP requests handler."""
@@ -283,6 +394,56 @@ class RequestHandler(wsgiref.simple_server.WSGIRequestHandler):
         handler.run(app)
 
 
+def _systemd_listen_sockets() -> List[socket.socket]:
+    """Get the listening sockets passed by systemd socket activation.
+
+    See ``sd_listen_fds(3)``, the environment variables are unset.
+
+    """
+    if os.environ.get("LISTEN_PID") != str(os.getpid()):
+        return []
+    try:
+        count = int(os.environ.get("LISTEN_FDS", "0"))
+    except ValueError:
+        logger.warning("Invalid LISTEN_FDS in environment: %r",
+                       os.environ.get("LISTEN_FDS"))
+        count = 0
+    for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+    listen_sockets = []
+    for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count):
+        try:
+            os.set_inheritable(fd, False)
+            listen_socket = socket.socket(fileno=fd)
+        except OSError as e:
+            logger.warning("Ignoring file descriptor %d passed by socket "
+                           "activation: %s", fd, e)
+            continue
+        if listen_socket.type != socket.SOCK_STREAM:
+            logger.warning("Ignoring file descriptor %d passed by socket "
+                           "activation: not a stream socket", fd)
+            listen_socket.detach()
+            continue
+        listen_sockets.append(listen_socket)
+    return listen_sockets
+
+
+def _systemd_notify(state: str) -> None:
+    """Send ``state`` to the service manager (see ``sd_notify(3)``)."""
+    address = os.environ.get("NOTIFY_SOCKET", "")
+    if not address or not hasattr(socket, "AF_UNIX"):
+        return
+    if address.startswith("@"):
+        # Abstract namespace socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode())
+    except OSError as e:
+        logger.warning("Failed to notify service manager: %s", e)
+
+
 def serve(configuration: config.Configuration,
           shutdown_socket: Optional[socket.socket] = None) -> None:
     """Serve radicale from configuration.
@@ -306,10 +467,35 @@ def serve(configuration: config.Configuration,
 
     use_ssl: bool = configuration.get("server", "ssl")
     server_class = ParallelHTTPSServer if use_ssl else ParallelHTTPServer
-    application = Application(configuration)
-    servers = {}
+    servers: Dict[socket.socket, ParallelHTTPServer] = {}
     try:
-        hosts: List[Tuple[str, int]] = configuration.get("server", "hosts")
+        # Bind (or take over) the listening sockets before loading the
+        # application, connections are queued while storage is initialized
+        listen_sockets = _systemd_listen_sockets()
+        for listen_socket in listen_sockets:
+            server: ParallelHTTPServer
+            address = listen_socket.getsockname()
+            if not isinstance(address, tuple):
+                # AF_UNIX: the path as str (or bytes in the abstract
+                # namespace)
+                server = ParallelHTTPUnixServer(
+                    configuration, "", RequestHandler, listen_socket)
+                logger.info("Listening on Unix domain socket %r "
+                            "(socket activation)", address)
+            else:
+                server = server_class(
+                    configuration, listen_socket.family, ("", 0),
+                    RequestHandler, listen_socket)
+                logger.info("Listening on %r%s (socket activation)",
+                            utils.format_address(address),
+                            " with SSL" if use_ssl else "")
+            servers[server.socket] = server
+        if listen_sockets:
+            logger.info("Sockets passed by socket activation, ignoring "
+                        "options 'hosts' and 'unix_socket' in section "
+                        "'server'")
+        hosts: List[Tuple[str, int]] = [] if listen_sockets else (
+            configuration.get("server", "hosts"))
         for address_port in hosts:
             # retrieve IPv4/IPv6 address of address
             try:
@@ -326,13 +512,29 @@ def serve(configuration: config.Configuration,
                     logger.warning("cannot create server socket on '%s': %s" % (utils.format_address(socket_address), e))
                     continue
                 servers[server.socket] = server
-                server.set_app(application)
                 logger.info("Listening on %r%s",
                             utils.format_address(server.server_address),
                             " with SSL" if use_ssl else "")
+        unix_socket: str = "" if listen_sockets else (
+            configuration.get("server", "unix_socket"))
+        if unix_socket:
+            if not hasattr(socket, "AF_UNIX") or sys.platform == "win32":
+                raise RuntimeError("Unix domain sockets are not supported "
+                                   "on this platform")
+            # SSL is not applied, the socket is only reachable locally
+            server = ParallelHTTPUnixServer(configuration, unix_socket,
+                                            RequestHandler)
+            servers[server.socket] = server
+            logger.info("Listening on Unix domain socket %r (permissions: %s)",
+                        unix_socket,
+                        pathutils.path_permissions_as_string(unix_socket))
         if not servers:
             raise RuntimeError("No servers started")
 
+        application = Application(configuration)
+        for server in servers.values():
+            server.set_app(application)
+
         # Mainloop
         select_timeout = None
         if sys.platform == "win32":
@@ -341,6 +543,7 @@ def serve(configuration: config.Configuration,
         max_connections: int = configuration.get("server", "max_connections")
         logger.info("Maximum parallel connections: %d", max_connections)
         logger.info("Radicale server ready")
+        _systemd_notify("READY=1\nSTATUS=Radicale server ready")
         while True:
             rlist: List[socket.socket] = []
             # Wait for finished clients
@@ -356,6 +559,7 @@ def serve(configuration: config.Configuration,
             rset = set(rlist)
             if shutdown_socket in rset:
                 logger.info("Stopping Radicale")
+                _systemd_notify("STOPPING=1")
                 break
             for server in servers.values():
                 finished_sockets = server.worker_sockets.intersection(rset)
@@ -27,8 +27,9 @@ Take a look at the class ``BaseCollection`` if you want to implement your own.
 import json
 import xml.etree.ElementTree as ET
 from hashlib import sha256
-from typing import (Callable, ContextManager, Dict, Iterable, Iterator, List,
-                    Mapping, Optional, Sequence, Set, Tuple, Union, overload)
+from typing import (BinaryIO, Callable, ContextManager, Dict, Iterable,
+                    Iterator, List, Mapping, Optional, Sequence, Set, Tuple,
+                    Union, overload)
 
 import vobject
 
@@ -42,7 +43,7 @@ from radicale.utils import format_ut
 INTERNAL_TYPES: Sequence[str] = ("multifilesystem", "multifilesystem_nolock",)
 
 # NOTE: change only if cache structure is modified to avoid cache invalidation on update
-CACHE_VERSION_RADICALE = "3.3.1"
+CACHE_VERSION_RADICALE = "3.8.0"
 
 CACHE_VERSION: bytes = (
             "%s=%s;%s=%s;" % ("radicale", CACHE_VERSION_RADICALE, "vobject", utils.package_version("vobject"))).encode()
@@ -124,6 +125,22 @@ class BaseCollection:
             raise ValueError("Sync token are not supported")
         return token, hrefs_iter()
 
+    def sync_page(self, old_token: str = "", limit: int = 0
+                  ) -> Tuple[str, Iterable[str], bool]:
+        """Get a sync token and at most ``limit`` changed items for
+        synchronization.
+
+        Like ``sync``, but the changes are truncated to ``limit`` items
+        (``0`` for no limit). The returned flag is set if the changes were
+        truncated, the returned sync token is then the base of the next
+        page (see RFC 6578 3.6).
+
+        WARNING: This simple default implementation doesn't truncate.
+
+        """
+        token, changes = self.sync(old_token)
+        return token, changes, False
+
     def get_multi(self, hrefs: Iterable[str]) -> Iterable[Tuple[str, Optional["radicale_item.Item"]]]:
         """Fetch multiple items.
 
@@ -154,10 +171,21 @@ class BaseCollection:
         """
         if not self.tag:
             return
+        yield from self._prefilter_items(self.get_all(), filters)
+
+    def _prefilter_items(self, items: Iterable["radicale_item.Item"],
+                         filters: Iterable[ET.Element]
+                         ) -> Iterable[Tuple["radicale_item.Item", bool]]:
+        """Skip ``items`` that can't match ``filters``.
+
+        See ``get_filtered``.
+
+        """
         tag, start, end, simple = radicale_filter.simplify_prefilters(
             filters, self.tag)
+        props_match = radicale_filter.prefilter_properties(filters, self.tag)
         logger.trace("STORAGE/get_filtered: prefilter tag=%s start=%s end=%s simple=%s", tag, format_ut(start), format_ut(end), simple)
-        for item in self.get_all():
+        for item in items:
             logger.trace("STORAGE/get_filtered: component_name=%s tag=%s", item.component_name, tag)
             if tag is not None and tag != item.component_name:
                 continue
@@ -166,6 +194,10 @@ class BaseCollection:
             if istart >= end or iend <= start:
                 logger.trace("STORAGE/get_filtered: skip iuid=%s", item.uid)
                 continue
+            if (props_match is not None and item.indexed_props is not None
+                    and not props_match(item.indexed_props)):
+                logger.trace("STORAGE/get_filtered: skip iuid=%s (properties)", item.uid)
+                continue
             logger.trace("STORAGE/get_filtered: add iuid=%s", item.uid)
             yield item, simple and (start <= istart or iend <= end)
 
@@ -223,21 +255,141 @@ class BaseCollection:
         """Get the HTTP-datetime of when the collection was modified."""
         raise NotImplementedError
 
+    def get_export_cache(self, rendition: str) -> Optional[bytes]:
+        """Get a cached export of the whole collection.
+
+        ``rendition`` identifies the kind of export (e.g. conversion and
+        content encoding). Cached exports are only valid as long as the
+        etag of the collection doesn't change.
+
+        Returns ``None`` if the export is not cached.
+
+        """
+        return None
+
+    def set_export_cache(self, rendition: str, content: bytes) -> None:
+        """Store an export of the whole collection in the cache.
+
+        See ``get_export_cache``.
+
+        """
+
+    def get_export_cache_path(self, rendition: str, reference: bool = False
+                              ) -> Optional[str]:
+        """Get the path of a cached export in the file system.
+
+        See ``get_export_cache``.
+
+        ``reference`` marks the file as used by a reader outside of the
+        storage lock (e.g. a reverse proxy). The file is kept for a while
+        even if the collection changes in the meantime.
+
+        Returns ``None`` if the export is not cached as file.
+
+        """
+        return None
+
+    def get_converted_item(
+            self, href: str, conversion: str, key: str,
+            convert: Callable[[], Optional["radicale_item.Item"]]
+            ) -> Optional["radicale_item.Item"]:
+        """Get the item ``href`` converted by ``convert`` (e.g. a calendar
+        item created from a vCard by ``Item.convert_vcf_to_ics``).
+
+        The storage can cache the result of ``convert`` (including
+        ``None``) per ``conversion`` and ``href`` as long as ``key`` doesn't
+        change.
+
+        """
+        return convert()
+
+    def open_item_file(self, href: str) -> Optional[BinaryIO]:
+        """Open the stored content of the item ``href`` for reading.
+
+        It can be sent as is if ``Item.stored_as`` is true for the
+        response encoding.
+
+        Returns ``None`` if not supported or if the item doesn't exist.
+
+        """
+        return None
+
+    def get_item_path(self, href: str) -> Optional[str]:
+        """Get the path of the stored content of the item ``href`` in the
+        file system.
+
+        See ``open_item_file``.
+
+        Returns ``None`` if not supported or if the item doesn't exist.
+
+        """
+        return None
+
     def serialize(self, vcf_to_ics: bool = False, ShareActions: dict = {}) -> str:
         """Get the unicode string representing the whole collection."""
+        return "".join(self.serialize_stream(vcf_to_ics, ShareActions))
+
+    def serialize_stream(self, vcf_to_ics: bool = False,
+                         ShareActions: dict = {},
+                         items: Optional[Iterable["radicale_item.Item"]] = None
+                         ) -> Iterator[str]:
+        """Get the unicode string representing the whole collection in
+        chunks (one chunk per item).
+
+        ``items`` are the items of the collection (default: ``get_all``).
+
+        The storage must be locked while the iterator is consumed. If
+        ``items`` is given, only the properties of the collection are read
+        (before the first chunk is returned).
+
+        """
+        if items is None:
+            items = self.get_all()
         if self.tag == "VCALENDAR":
-            in_vcalendar = False
-            vtimezones = ""
+            template = vobject.iCalendar()
+            displayname = self.get_meta("D:displayname")
+            if displayname:
+                template.add("X-WR-CALNAME")
+                template.x_wr_calname.value_param = "TEXT"
+                template.x_wr_calname.value = displayname
+            description = self.get_meta("C:calendar-description")
+            if description:
+                template.add("X-WR-CALDESC")
+                template.x_wr_caldesc.value_param = "TEXT"
+                template.x_wr_caldesc.value = description
+            template = template.serialize()
+            template_insert_pos = template.find("\r\nEND:VCALENDAR\r\n") + 2
+            assert template_insert_pos != -1
+            yield template[:template_insert_pos]
             included_tzids: Set[str] = set()
-            vtimezone = []
-            tzid = None
-            components = ""
-            # Concatenate all child elements of VCALENDAR from all items
-            # together, while preventing duplicated VTIMEZONE entries.
+            # Emit all child elements of VCALENDAR item by item, while
+            # preventing duplicated VTIMEZONE entries. New VTIMEZONEs are
+            # emitted in front of the components of the item using them.
             # VTIMEZONEs are only distinguished by their TZID, if different
             # timezones share the same TZID this produces erroneous output.
             # VObject fails at this too.
-            for item in self.get_all():
+            for item in items:
+                vtimezones: List[str] = []
+                components: List[str] = []
+                if item.vtimezones is not None:
+                    # The VTIMEZONEs of the item are already known (see
+                    # ``radicale_item.find_vtimezones``)
+                    text = item.serialize()
+                    pos = text.find("\r\nBEGIN:") + 2
+                    for offset, item_tzid, item_vtimezone in item.vtimezones:
+                        components.append(text[pos:offset])
+                        pos = offset + len(item_vtimezone)
+                        if not item_tzid or item_tzid not in included_tzids:
+                            vtimezones.append(item_vtimezone)
+                        if item_tzid:
+                            included_tzids.add(item_tzid)
+                    components.append(
+                        text[pos:-len("END:VCALENDAR\r\n")])
+                    yield "".join(vtimezones) + "".join(components)
+                    continue
+                vtimezone: List[str] = []
+                tzid = None
+                in_vcalendar = False
                 depth = 0
                 for line in item.serialize().split("\r\n"):
                     if line.startswith("BEGIN:"):
@@ -255,49 +407,29 @@ class BaseCollection:
                                 tzid = line[len("TZID:"):]
                             elif depth == 2 and line.startswith("END:"):
                                 if tzid is None or tzid not in included_tzids:
-                                    vtimezones += "".join(vtimezone)
+                                    vtimezones.extend(vtimezone)
                                 if tzid is not None:
                                     included_tzids.add(tzid)
                                 vtimezone.clear()
                                 tzid = None
                         elif depth >= 2:
-                            components += line + "\r\n"
+                            components.append(line + "\r\n")
                     if line.startswith("END:"):
                         depth -= 1
-            template = vobject.iCalendar()
-            displayname = self.get_meta("D:displayname")
-            if displayname:
-                template.add("X-WR-CALNAME")
-                template.x_wr_calname.value_param = "TEXT"
-                template.x_wr_calname.value = displayname
-            description = self.get_meta("C:calendar-description")
-            if description:
-                template.add("X-WR-CALDESC")
-                template.x_wr_caldesc.value_param = "TEXT"
-                template.x_wr_caldesc.value = description
-            template = template.serialize()
-            template_insert_pos = template.find("\r\nEND:VCALENDAR\r\n") + 2
-            assert template_insert_pos != -1
-            return (template[:template_insert_pos] +
-                    vtimezones + components +
-                    template[template_insert_pos:])
-        if self.tag == "VADDRESSBOOK":
+                yield "".join(vtimezones) + "".join(components)
+            yield template[template_insert_pos:]
+        elif self.tag == "VADDRESSBOOK":
             if vcf_to_ics:
                 logger.trace("storage: convert VCF to ICS")
-
-                items = []
-                for item in self.get_all():
+                for item in items:
                     logger.trace("storage/convert VCF to ICS: %r:", item)
                     item_ics = item.convert_vcf_to_ics(ShareActions=ShareActions)
                     if item_ics is None:
                         continue
-                    else:
-                        pass
-                    items.append(item_ics.vobject_item)
-                return "".join((item.serialize() for item in items))
+                    yield item_ics.serialize()
             else:
-                return "".join((item.serialize() for item in self.get_all()))
-        return ""
+                for item in items:
+                    yield item.serialize()
 
 
 class BaseStorage:
@@ -385,6 +517,14 @@ class BaseStorage:
         """
         raise NotImplementedError
 
+    def get_change_token(self) -> Optional[str]:
+        """Get a token that changes whenever the storage is modified.
+
+        Returns ``None`` if modifications are not tracked.
+
+        """
+        return None
+
     def verify(self) -> bool:
         """Check the storage for errors."""
         raise NotImplementedError
@@ -39,6 +39,8 @@ from radicale.storage.multifilesystem.delete import CollectionPartDelete
 from radicale.storage.multifilesystem.discover import StoragePartDiscover
 from radicale.storage.multifilesystem.get import CollectionPartGet
 from radicale.storage.multifilesystem.history import CollectionPartHistory
+from radicale.storage.multifilesystem.index import (CollectionPartIndex,
+                                                    StoragePartIndex)
 from radicale.storage.multifilesystem.lock import (CollectionPartLock,
                                                    StoragePartLock)
 from radicale.storage.multifilesystem.meta import CollectionPartMeta
@@ -46,6 +48,7 @@ from radicale.storage.multifilesystem.move import StoragePartMove
 from radicale.storage.multifilesystem.sync import CollectionPartSync
 from radicale.storage.multifilesystem.upload import CollectionPartUpload
 from radicale.storage.multifilesystem.verify import StoragePartVerify
+from radicale.storage.multifilesystem.vtimezone import StoragePartVTimezone
 
 # 999 second, 999 ms, 999 us, 999 ns
 MTIME_NS_TEST: int = 999999999999
@@ -53,7 +56,8 @@ MTIME_NS_TEST: int = 999999999999
 
 class Collection(
         CollectionPartDelete, CollectionPartMeta, CollectionPartSync,
-        CollectionPartUpload, CollectionPartGet, CollectionPartCache,
+        CollectionPartUpload, CollectionPartIndex, CollectionPartGet,
+        CollectionPartCache,
         CollectionPartLock, CollectionPartHistory, CollectionBase):
 
     _etag_cache: Optional[str]
@@ -88,7 +92,8 @@ class Collection(
 
 class Storage(
         StoragePartCreateCollection, StoragePartLock, StoragePartMove,
-        StoragePartVerify, StoragePartDiscover, StorageBase):
+        StoragePartVerify, StoragePartDiscover, StoragePartIndex,
+        StoragePartVTimezone, StorageBase):
 
     _collection_class: ClassVar[Type[Collection]] = Collection
 
@@ -20,7 +20,7 @@
 import os
 import sys
 from tempfile import TemporaryDirectory
-from typing import IO, AnyStr, ClassVar, Iterator, Optional, Type
+from typing import IO, AnyStr, ClassVar, Iterator, Optional, Sequence, Type
 
 from radicale import config, logger, pathutils, storage, types, utils
 from radicale.storage import multifilesystem  # noqa:F401
@@ -83,6 +83,9 @@ class StorageBase(storage.BaseStorage):
     _folder_umask: str
     _config_umask: int
     _max_resource_size: int
+    _max_export_cache_size: int
+    _indexed_properties: Sequence[str]
+    _max_cached_occurrences: int
 
     def __init__(self, configuration: config.Configuration) -> None:
         super().__init__(configuration)
@@ -106,6 +109,12 @@ class StorageBase(storage.BaseStorage):
             "logging", "storage_cache_actions_on_debug")
         self._max_resource_size = configuration.get(
             "server", "max_resource_size")
+        self._max_export_cache_size = configuration.get(
+            "storage", "max_export_cache_size")
+        self._indexed_properties = configuration.get(
+            "storage", "indexed_properties")
+        self._max_cached_occurrences = configuration.get(
+            "storage", "max_cached_occurrences")
         self._max_vevent_rrule_occurrence = configuration.get("server", "max_vevent_rrule_occurrence")
 
     def _get_collection_root_folder(self) -> str:
@@ -118,7 +127,7 @@ class StorageBase(storage.BaseStorage):
             return os.path.join(self._filesystem_folder, "collection-cache")
 
     def _get_collection_cache_subfolder(self, path, folder, subfolder) -> str:
-        if (self._use_cache_subfolder_for_item is True) and (subfolder == "item"):
+        if (self._use_cache_subfolder_for_item is True) and (subfolder in ("item", "export", "bday")):
             path = path.replace(self._get_collection_root_folder(), self._get_collection_cache_folder())
         elif (self._use_cache_subfolder_for_history is True) and (subfolder == "history"):
             path = path.replace(self._get_collection_root_folder(), self._get_collection_cache_folder())
@@ -22,16 +22,36 @@ import os
 import pickle
 import time
 from hashlib import sha256
-from typing import BinaryIO, Iterable, NamedTuple, Optional, cast
+from typing import (BinaryIO, Callable, Dict, Iterable, NamedTuple, Optional,
+                    Tuple, cast)
 
 import radicale.item as radicale_item
 from radicale import pathutils, storage
+from radicale.item import filter as radicale_filter
+from radicale.item import scan as radicale_scan
 from radicale.log import logger
 from radicale.storage.multifilesystem.base import CollectionBase
+from radicale.storage.multifilesystem.vtimezone import VTIMEZONE_MAX_AGE
 
 CacheContent = NamedTuple("CacheContent", [
     ("uid", str), ("etag", str), ("text", str), ("name", str), ("tag", str),
-    ("start", int), ("end", int)])
+    ("start", int), ("end", int),
+    ("indexed_props", Dict[str, Tuple[str, ...]]),
+    ("occurrences", Optional[Tuple[Tuple[int, ...], Tuple[int, ...],
+                                   Optional[int]]]),
+    # ``(offset, tzid, text)`` of the VTIMEZONE components, the text is
+    # replaced by its hash in the registry in the stored entries
+    ("vtimezones", Optional[Tuple[Tuple[int, str, str], ...]]),
+    # ``text`` is the content of the file (not reserialized by VObject)
+    ("verbatim", bool)])
+
+# Seconds that a referenced export of an old version of a collection is kept
+# (see ``get_export_cache_path``)
+EXPORT_REFERENCE_AGE: int = 60
+
+ConversionCacheContent = NamedTuple("ConversionCacheContent", [
+    ("href", Optional[str]), ("uid", str), ("etag", str), ("text", str),
+    ("name", str), ("tag", str), ("time_range", Optional[Tuple[int, int]])])
 
 
 class CollectionPartCache(CollectionBase):
@@ -78,8 +98,43 @@ class CollectionPartCache(CollectionBase):
         return str(storage.CACHE_VERSION.decode()) + "size=" + str(size) + ";mtime=" + str(raw_text)
 
     def _item_cache_content(self, item: radicale_item.Item) -> CacheContent:
-        return CacheContent(item.uid, item.etag, item.serialize(), item.name,
-                            item.component_name, *item.time_range)
+        indexed_props = radicale_item.index_properties(
+            item.vobject_item, item.component_name,
+            self._storage._indexed_properties)
+        occurrences = radicale_filter.find_occurrences(
+            item.vobject_item, item.component_name,
+            self._storage._max_cached_occurrences)
+        text = item.serialize()
+        return CacheContent(item.uid, item.etag, text, item.name,
+                            item.component_name, *item.time_range,
+                            indexed_props,
+                            None if occurrences is None else
+                            (occurrences.starts, occurrences.ends,
+                             occurrences.horizon),
+                            radicale_item.find_vtimezones(text), True)
+
+    def _scanned_item_cache_content(self, text: str,
+                                    scanned: radicale_scan.ScannedItem
+                                    ) -> Optional[CacheContent]:
+        """Like ``_item_cache_content`` for an item that was accepted by
+        ``radicale_scan.scan``.
+
+        Returns ``None`` if the item must be parsed with VObject.
+
+        """
+        indexed_props = scanned.index_properties(
+            self._storage._indexed_properties)
+        if indexed_props is None:
+            return None
+        occurrences = scanned.occurrences(
+            self._storage._max_cached_occurrences)
+        return CacheContent(scanned.uid, radicale_item.get_etag(text), text,
+                            scanned.name, scanned.component_name,
+                            *scanned.time_range, indexed_props,
+                            None if occurrences is None else
+                            (occurrences.starts, occurrences.ends,
+                             occurrences.horizon),
+                            radicale_item.find_vtimezones(text), True)
 
     def _store_item_cache(self, href: str, item: radicale_item.Item,
                           cache_hash: str = "") -> CacheContent:
@@ -89,17 +144,62 @@ class CollectionPartCache(CollectionBase):
             else:
                 cache_hash = self._item_cache_hash(
                     item.serialize().encode(self._encoding))
+        return self._write_item_cache(
+            href, self._item_cache_content(item), cache_hash)
+
+    def _write_item_cache(self, href: str, content: CacheContent,
+                          cache_hash: str) -> CacheContent:
         cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "item")
-        content = self._item_cache_content(item)
         self._storage._makedirs_synced(cache_folder)
         # Race: Other processes might have created and locked the file.
         # TODO: better fix for "mypy"
         with contextlib.suppress(PermissionError), self._atomic_write(  # type: ignore
                 os.path.join(cache_folder, href), "wb") as fo:
             fb = cast(BinaryIO, fo)
-            pickle.dump((cache_hash, *content), fb)
+            pickle.dump(self._item_cache_entry(content, cache_hash), fb)
         return content
 
+    def _item_cache_entry(self, content: CacheContent, cache_hash: str
+                          ) -> Tuple:
+        """Create the stored entry of the item cache.
+
+        The VTIMEZONE components are replaced by references to the
+        registry (see ``StoragePartVTimezone``).
+
+        """
+        if content.vtimezones:
+            parts = []
+            pos = 0
+            for offset, _, vtimezone in content.vtimezones:
+                parts.append(content.text[pos:offset])
+                pos = offset + len(vtimezone)
+            parts.append(content.text[pos:])
+            content = content._replace(text="".join(parts), vtimezones=tuple(
+                (offset, tzid, self._storage._intern_vtimezone(vtimezone))
+                for offset, tzid, vtimezone in content.vtimezones))
+        return (cache_hash, *content)
+
+    def _resolve_vtimezones(self, content: CacheContent
+                            ) -> Optional[CacheContent]:
+        """Replace the references to VTIMEZONEs in a stored entry by their
+        text.
+
+        Returns ``None`` if a VTIMEZONE is missing in the registry.
+
+        """
+        if not content.vtimezones:
+            return content
+        vtimezones = []
+        for offset, tzid, hash_ in content.vtimezones:
+            vtimezone = self._storage._load_vtimezone(hash_)
+            if vtimezone is None:
+                return None
+            vtimezones.append((offset, tzid, vtimezone))
+        return content._replace(
+            text=radicale_item.join_vtimezones(content.text, (
+                (offset, vtimezone) for offset, _, vtimezone in vtimezones)),
+            vtimezones=tuple(vtimezones))
+
     def _load_item_cache(self, href: str, cache_hash: str
                          ) -> Optional[CacheContent]:
         cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "item")
@@ -107,10 +207,21 @@ class CollectionPartCache(CollectionBase):
         try:
             with open(path, "rb") as f:
                 hash_, *remainder = pickle.load(f)
-                if hash_ and hash_ == cache_hash:
+                content = (CacheContent(*remainder)
+                           if hash_ and hash_ == cache_hash and
+                           len(remainder) == len(CacheContent._fields)
+                           else None)
+                # Entries with other indexed properties are outdated
+                if content is not None and (
+                        content.indexed_props.keys() !=
+                        set(self._storage._indexed_properties)):
+                    content = None
+                if content is not None:
+                    content = self._resolve_vtimezones(content)
+                if content is not None:
                     if self._storage._debug_cache_actions is True:
                         logger.debug("Item cache match     : %r with hash %r", path, cache_hash)
-                    return CacheContent(*remainder)
+                    return content
                 else:
                     if self._storage._debug_cache_actions is True:
                         logger.debug("Item cache no match  : %r with hash %r", path, cache_hash)
@@ -124,7 +235,152 @@ class CollectionPartCache(CollectionBase):
         return None
 
     def _clean_item_cache(self) -> None:
-        cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "item")
-        self._clean_cache(cache_folder, (
-            e.name for e in os.scandir(cache_folder) if not
-            os.path.isfile(os.path.join(self._filesystem_path, e.name))))
+        for subfolder in ("item", "bday"):
+            cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", subfolder)
+            if subfolder != "item" and not os.path.isdir(cache_folder):
+                continue
+            self._clean_cache(cache_folder, (
+                e.name for e in os.scandir(cache_folder) if not
+                os.path.isfile(os.path.join(self._filesystem_path, e.name))))
+        registry_folder = self._storage._get_vtimezone_folder()
+        if os.path.isdir(registry_folder):
+            self._clean_cache(registry_folder, (
+                e.name for e in os.scandir(registry_folder) if e.is_file()),
+                max_age=VTIMEZONE_MAX_AGE)
+
+    def get_converted_item(
+            self, href: str, conversion: str, key: str,
+            convert: Callable[[], Optional[radicale_item.Item]]
+            ) -> Optional[radicale_item.Item]:
+        if conversion != "bday" or not pathutils.is_safe_filesystem_path_component(href):
+            return convert()
+        cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", conversion)
+        path = os.path.join(cache_folder, href)
+        content: Optional[ConversionCacheContent]
+        try:
+            with open(path, "rb") as f:
+                key_, *remainder = pickle.load(f)
+            if key_ == key and (
+                    remainder == [None] or
+                    len(remainder) == len(ConversionCacheContent._fields)):
+                if self._storage._debug_cache_actions is True:
+                    logger.debug("Conversion cache match : %r", path)
+                if remainder == [None]:
+                    return None
+                content = ConversionCacheContent(*remainder)
+                return radicale_item.Item(
+                    collection=self, href=content.href, uid=content.uid,
+                    etag=content.etag, text=content.text, name=content.name,
+                    component_name=content.tag, time_range=content.time_range)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, ValueError) as e:
+            logger.warning("Failed to load conversion cache entry %r in %r: "
+                           "%s", href, self.path, e, exc_info=True)
+        if self._storage._debug_cache_actions is True:
+            logger.debug("Conversion cache miss  : %r", path)
+        item = convert()
+        content = None
+        if item is not None:
+            time_range: Optional[Tuple[int, int]]
+            try:
+                time_range = item.time_range
+            except Exception as e:
+                # e.g. multiple VEVENTs with different UIDs for the ages
+                logger.debug("Can't find time range of converted item %r: %s",
+                             item.href, e)
+                time_range = None
+            content = ConversionCacheContent(
+                item.href, item.uid, item.etag, item.serialize(), item.name,
+                item.component_name, time_range)
+        self._storage._makedirs_synced(cache_folder)
+        # Race: Other processes might have created and locked the file.
+        # TODO: better fix for "mypy"
+        with contextlib.suppress(PermissionError), self._atomic_write(  # type: ignore
+                path, "wb") as fo:
+            fb = cast(BinaryIO, fo)
+            pickle.dump((key, *(content or (None,))), fb)
+        return item
+
+    def _export_cache_name(self, rendition: str) -> str:
+        if not pathutils.is_safe_filesystem_path_component(rendition):
+            raise ValueError("Invalid export rendition: %r" % rendition)
+        return "%s.%s" % (rendition, self.etag.strip("\""))
+
+    def _export_cache_path(self, rendition: str) -> str:
+        cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "export")
+        return os.path.join(cache_folder, self._export_cache_name(rendition))
+
+    def get_export_cache(self, rendition: str) -> Optional[bytes]:
+        if not self._storage._max_export_cache_size:
+            return None
+        path = self._export_cache_path(rendition)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            if self._storage._debug_cache_actions is True:
+                logger.debug("Export cache not found : %r", path)
+            return None
+        if self._storage._debug_cache_actions is True:
+            logger.debug("Export cache match     : %r", path)
+        return content
+
+    def get_export_cache_path(self, rendition: str, reference: bool = False
+                              ) -> Optional[str]:
+        if not self._storage._max_export_cache_size:
+            return None
+        path = self._export_cache_path(rendition)
+        if reference:
+            # The modification time in the future protects the file from
+            # the removal of exports of old versions in ``set_export_cache``
+            expires = time.time() + EXPORT_REFERENCE_AGE
+            try:
+                os.utime(path, (expires, expires))
+            except OSError:
+                return None
+        elif not os.path.isfile(path):
+            return None
+        return path
+
+    def set_export_cache(self, rendition: str, content: bytes) -> None:
+        max_size = self._storage._max_export_cache_size
+        if not max_size or len(content) > max_size:
+            return
+        cache_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "export")
+        name = self._export_cache_name(rendition)
+        self._storage._makedirs_synced(cache_folder)
+        # Remove exports of other versions of the collection and keep the
+        # remaining exports within the size budget
+        etag_suffix = name[len(rendition):]
+        size = len(content)
+        now = time.time()
+        modified = False
+        for entry in os.scandir(cache_folder):
+            # Skip temporary files of other processes
+            if entry.name == name or entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+                if (entry.name.endswith(etag_suffix) or
+                        stat.st_mtime > now):
+                    # Referenced exports of old versions are still read
+                    size += stat.st_size
+                    continue
+                os.remove(entry.path)
+            except (FileNotFoundError, PermissionError):
+                continue
+            modified = True
+        if modified:
+            self._storage._sync_directory(cache_folder)
+        if size > max_size:
+            logger.debug("Export cache of %r is full, not storing %r",
+                         self.path, rendition)
+            return
+        # Race: Other processes might have created and locked the file.
+        with contextlib.suppress(PermissionError), self._atomic_write(  # type: ignore
+                os.path.join(cache_folder, name), "wb") as fo:
+            fb = cast(BinaryIO, fo)
+            fb.write(content)
+        if self._storage._debug_cache_actions is True:
+            logger.debug("Export cache stored    : %r", name)
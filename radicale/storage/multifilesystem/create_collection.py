@@ -108,6 +108,8 @@ class StoragePartCreateCollection(StorageBase):
                     new_item_hrefs = list(col._list())
                     os.rename(tmp_filesystem_path, filesystem_path)
                 self._sync_directory(parent_dir)
+                cast(multifilesystem.Storage, self)._drop_property_index(
+                    filesystem_path)
         except Exception as e:
             raise ValueError("Failed to create collection %r as %r %s" %
                              (href, filesystem_path, e)) from e
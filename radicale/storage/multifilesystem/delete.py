@@ -24,9 +24,11 @@ from typing import Optional
 from radicale import pathutils, storage
 from radicale.storage.multifilesystem.base import CollectionBase
 from radicale.storage.multifilesystem.history import CollectionPartHistory
+from radicale.storage.multifilesystem.index import CollectionPartIndex
 
 
-class CollectionPartDelete(CollectionPartHistory, CollectionBase):
+class CollectionPartDelete(CollectionPartIndex, CollectionPartHistory,
+                           CollectionBase):
 
     def delete(self, href: Optional[str] = None) -> None:
         if href is None:
@@ -42,6 +44,7 @@ class CollectionPartDelete(CollectionPartHistory, CollectionBase):
                     self._storage._sync_directory(parent_dir)
             else:
                 self._storage._sync_directory(parent_dir)
+            self._storage._drop_property_index(self._filesystem_path)
         else:
             # Delete an item
             if not pathutils.is_safe_filesystem_path_component(href):
@@ -51,12 +54,14 @@ class CollectionPartDelete(CollectionPartHistory, CollectionBase):
                 raise storage.ComponentNotFoundError(href)
             os.remove(path)
             self._storage._sync_directory(os.path.dirname(path))
+            self._update_property_index(href, None)
             # Track the change
             self._update_history_etag(href, None)
             self._clean_history()
-            # Remove item from cache
-            cache_folder = self._storage._get_collection_cache_subfolder(os.path.dirname(path), ".Radicale.cache", "item")
-            cache_file = os.path.join(cache_folder, os.path.basename(path))
-            if os.path.isfile(cache_file):
-                os.remove(cache_file)
-                self._storage._sync_directory(cache_folder)
+            # Remove item from caches
+            for subfolder in ("item", "bday"):
+                cache_folder = self._storage._get_collection_cache_subfolder(os.path.dirname(path), ".Radicale.cache", subfolder)
+                cache_file = os.path.join(cache_folder, os.path.basename(path))
+                if os.path.isfile(cache_file):
+                    os.remove(cache_file)
+                    self._storage._sync_directory(cache_folder)
@@ -20,10 +20,12 @@
 import os
 import sys
 import time
-from typing import Iterable, Iterator, Optional, Tuple
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
 
 import radicale.item as radicale_item
 from radicale import pathutils
+from radicale.item import filter as radicale_filter
+from radicale.item import scan as radicale_scan
 from radicale.log import logger
 from radicale.storage import multifilesystem
 from radicale.storage.multifilesystem.base import CollectionBase
@@ -69,6 +71,8 @@ class CollectionPartGet(CollectionPartCache, CollectionPartLock,
         else:
             path = os.path.join(self._filesystem_path, href)
         item_stat: Optional[os.stat_result] = None
+        # The content of the file if it was read
+        raw: Optional[bytes] = None
         try:
             if self._storage._use_mtime_and_size_for_item_cache is True:
                 # try to avoid "open"
@@ -88,6 +92,7 @@ class CollectionPartGet(CollectionPartCache, CollectionPartLock,
                     if self._storage._debug_cache_actions is True:
                         logger.debug("Item cache early read: %r", path)
                     raw_text = f.read()
+                raw = raw_text
         except (FileNotFoundError, IsADirectoryError):
             return None
         except PermissionError:
@@ -125,18 +130,36 @@ class CollectionPartGet(CollectionPartCache, CollectionPartLock,
                             logger.debug("Item cache late read : %r", path)
                         with open(path, "rb") as f:
                             raw_text = f.read()
+                        raw = raw_text
                     try:
-                        vobject_items = radicale_item.read_components(
-                            raw_text.decode(self._encoding))
-                        radicale_item.check_and_sanitize_items(
-                            vobject_items, tag=self.tag, max_vevent_rrule_occurrence=self._storage._max_vevent_rrule_occurrence)
-                        vobject_item, = vobject_items
-                        temp_item = radicale_item.Item(
-                            collection=self, vobject_item=vobject_item)
-                        if self._storage._debug_cache_actions is True:
-                            logger.debug("Item cache store  for: %r", path)
-                        cache_content = self._store_item_cache(
-                            href, temp_item, cache_hash)
+                        text = raw_text.decode(self._encoding)
+                        # Simple items don't need to be parsed with VObject
+                        scanned = radicale_scan.scan(text, self.tag)
+                        if scanned is not None:
+                            cache_content = self._scanned_item_cache_content(
+                                text, scanned)
+                        if cache_content is not None:
+                            if self._storage._debug_cache_actions is True:
+                                logger.debug("Item cache store  for: %r (scanned)", path)
+                            cache_content = self._write_item_cache(
+                                href, cache_content, cache_hash)
+                        else:
+                            vobject_items = radicale_item.read_components(text)
+                            radicale_item.check_and_sanitize_items(
+                                vobject_items, tag=self.tag, max_vevent_rrule_occurrence=self._storage._max_vevent_rrule_occurrence)
+                            vobject_item, = vobject_items
+                            temp_item = radicale_item.Item(
+                                collection=self, vobject_item=vobject_item)
+                            if self._storage._debug_cache_actions is True:
+                                logger.debug("Item cache store  for: %r", path)
+                            cache_content = self._item_cache_content(
+                                temp_item)
+                            # VObject might have changed the text
+                            cache_content = cache_content._replace(
+                                verbatim=cache_content.text.encode(
+                                    self._encoding) == raw_text)
+                            cache_content = self._write_item_cache(
+                                href, cache_content, cache_hash)
                     except Exception as e:
                         if self._skip_broken_item:
                             logger.warning("Skip broken item %r in %r: %s", href, self.path, e)
@@ -157,13 +180,49 @@ class CollectionPartGet(CollectionPartCache, CollectionPartLock,
             time.gmtime(item_stat.st_mtime if item_stat is not None
                         else os.path.getmtime(path)))
         # Don't keep reference to ``vobject_item``, because it requires a lot
-        # of memory.
+        # of memory. Verbatim content that was read is only kept as bytes.
+        if not cache_content.verbatim:
+            raw = None
         return radicale_item.Item(
             collection=self, href=href, last_modified=last_modified,
-            etag=cache_content.etag, text=cache_content.text,
+            etag=cache_content.etag,
+            text=cache_content.text if raw is None else None,
             uid=cache_content.uid, name=cache_content.name,
             component_name=cache_content.tag,
-            time_range=(cache_content.start, cache_content.end))
+            time_range=(cache_content.start, cache_content.end),
+            indexed_props=cache_content.indexed_props,
+            occurrences=None if cache_content.occurrences is None else
+            radicale_filter.Occurrences(*cache_content.occurrences),
+            vtimezones=cache_content.vtimezones,
+            raw=raw,
+            raw_encoding=self._encoding if cache_content.verbatim else "")
+
+    def _item_path(self, href: str) -> Optional[str]:
+        try:
+            if not pathutils.is_safe_filesystem_path_component(href):
+                raise pathutils.UnsafePathError(href)
+            return pathutils.path_to_filesystem(self._filesystem_path, href,
+                                                self._is_collision_free)
+        except ValueError as e:
+            logger.debug(
+                "Can't translate name %r safely to filesystem in %r: %s",
+                href, self.path, e, exc_info=True)
+            return None
+
+    def open_item_file(self, href: str) -> Optional[BinaryIO]:
+        path = self._item_path(href)
+        if path is None:
+            return None
+        try:
+            return open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def get_item_path(self, href: str) -> Optional[str]:
+        path = self._item_path(href)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
 
     def get_multi(self, hrefs: Iterable[str]
                   ) -> Iterator[Tuple[str, Optional[radicale_item.Item]]]:
@@ -0,0 +1,223 @@
+# This file is part of Radicale - CalDAV and CardDAV server
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-memory inverted index of the indexed properties of address books.
+
+The words of the values of the properties listed in
+``[storage] indexed_properties`` are indexed by all their suffixes, a sorted
+list of the suffixes answers ``contains``, ``starts-with``, ``ends-with``
+and ``equals`` text-matches with a prefix search. The index of a collection
+is kept up to date by uploads and deletions of this process and is checked
+against the ``stat`` of the files before every query.
+
+"""
+
+import bisect
+import os
+import threading
+import xml.etree.ElementTree as ET
+from typing import (Dict, Iterable, Iterator, List, Mapping, Optional, Set,
+                    Tuple, Union)
+
+import radicale.item as radicale_item
+from radicale import pathutils
+from radicale.item import filter as radicale_filter
+from radicale.log import logger
+from radicale.storage.multifilesystem.base import CollectionBase, StorageBase
+from radicale.storage.multifilesystem.get import CollectionPartGet
+
+# ``(st_ino, st_mtime_ns, st_size)`` of an item file
+Stamp = Tuple[int, int, int]
+
+
+def _stamp(stat: Union[os.stat_result, os.DirEntry]) -> Stamp:
+    if isinstance(stat, os.DirEntry):
+        stat = stat.stat()
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class PropertyIndex:
+    """Inverted index of the indexed properties of a collection."""
+
+    lock: threading.Lock
+
+    _entries: Dict[str, Tuple[Stamp, Mapping[str, Tuple[str, ...]]]]
+    _postings: Dict[Tuple[str, str], Set[str]]
+    _suffixes: Optional[Dict[str, List[str]]]
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._entries = {}
+        self._postings = {}
+        self._suffixes = None
+
+    @staticmethod
+    def _keys(indexed_props: Mapping[str, Tuple[str, ...]]
+              ) -> Set[Tuple[str, str]]:
+        return {(name, word[i:])
+                for name, values in indexed_props.items()
+                for value in values
+                for word in radicale_filter.text_tokens(value)
+                for i in range(len(word))}
+
+    @property
+    def stamps(self) -> Dict[str, Stamp]:
+        return {href: stamp for href, (stamp, _) in self._entries.items()}
+
+    def update(self, href: str, stamp: Stamp,
+               indexed_props: Mapping[str, Tuple[str, ...]]) -> None:
+        self.remove(href)
+        self._entries[href] = (stamp, indexed_props)
+        for key in self._keys(indexed_props):
+            self._postings.setdefault(key, set()).add(href)
+        self._suffixes = None
+
+    def remove(self, href: str) -> None:
+        entry = self._entries.pop(href, None)
+        if entry is None:
+            return
+        for key in self._keys(entry[1]):
+            hrefs = self._postings[key]
+            hrefs.discard(href)
+            if not hrefs:
+                del self._postings[key]
+        self._suffixes = None
+
+    def candidates(self, name: str, text: str) -> Optional[Set[str]]:
+        """Find the items with a value of the property ``name`` that can
+        contain the normalized ``text``.
+
+        Returns ``None`` if ``text`` contains no words.
+
+        """
+        words = radicale_filter.text_tokens(text)
+        if not words:
+            return None
+        word = max(words, key=len)
+        if self._suffixes is None:
+            self._suffixes = {}
+            for key_name, suffix in self._postings:
+                self._suffixes.setdefault(key_name, []).append(suffix)
+            for suffixes in self._suffixes.values():
+                suffixes.sort()
+        suffixes = self._suffixes.get(name, [])
+        hrefs: Set[str] = set()
+        for i in range(bisect.bisect_left(suffixes, word), len(suffixes)):
+            if not suffixes[i].startswith(word):
+                break
+            hrefs.update(self._postings[(name, suffixes[i])])
+        return hrefs
+
+
+class StoragePartIndex(StorageBase):
+
+    _property_indexes: Dict[str, PropertyIndex]
+    _property_indexes_lock: threading.Lock
+
+    def __init__(self, configuration) -> None:
+        super().__init__(configuration)
+        self._property_indexes = {}
+        self._property_indexes_lock = threading.Lock()
+
+    def _drop_property_index(self, filesystem_path: str) -> None:
+        with self._property_indexes_lock:
+            self._property_indexes.pop(filesystem_path, None)
+
+
+class CollectionPartIndex(CollectionPartGet, CollectionBase):
+
+    def _property_index(self, create: bool = True
+                        ) -> Optional[PropertyIndex]:
+        with self._storage._property_indexes_lock:
+            index = self._storage._property_indexes.get(
+                self._filesystem_path)
+            if index is None and create:
+                index = PropertyIndex()
+                self._storage._property_indexes[
+                    self._filesystem_path] = index
+            return index
+
+    def _update_property_index(self, href: str,
+                               item: Optional[radicale_item.Item]) -> None:
+        """Update the entry of ``href`` in an existing index."""
+        index = self._property_index(create=False)
+        if index is None:
+            return
+        with index.lock:
+            if item is None or item.indexed_props is None:
+                index.remove(href)
+            else:
+                index.update(href, _stamp(os.stat(os.path.join(
+                    self._filesystem_path, href))), item.indexed_props)
+
+    def _sync_property_index(self, index: PropertyIndex) -> None:
+        stamps = index.stamps
+        for entry in os.scandir(self._filesystem_path):
+            href = entry.name
+            # Same entries as ``_list``
+            if href not in stamps and not (
+                    entry.is_file() and
+                    pathutils.is_safe_filesystem_path_component(href)):
+                continue
+            try:
+                stamp = _stamp(entry)
+            except FileNotFoundError:
+                continue
+            if stamps.pop(href, None) == stamp:
+                continue
+            item = self._get(href, verify_href=False)
+            if item is None or item.indexed_props is None:
+                index.remove(href)
+            else:
+                index.update(href, stamp, item.indexed_props)
+        for href in stamps:
+            index.remove(href)
+
+    def get_filtered(self, filters: Iterable[ET.Element]
+                     ) -> Iterator[Tuple[radicale_item.Item, bool]]:
+        filters = list(filters)
+        terms = radicale_filter.prefilter_terms(filters, self.tag)
+        if not terms:
+            yield from super().get_filtered(filters)
+            return
+        index = self._property_index()
+        assert index is not None
+        with index.lock:
+            self._sync_property_index(index)
+            hrefs: Optional[Set[str]] = None
+            for alternatives in terms:
+                candidates: Optional[Set[str]] = set()
+                for name, text in alternatives:
+                    if name not in self._storage._indexed_properties:
+                        candidates = None
+                        break
+                    term_candidates = index.candidates(name, text)
+                    if term_candidates is None:
+                        candidates = None
+                        break
+                    assert candidates is not None
+                    candidates |= term_candidates
+                if candidates is not None:
+                    hrefs = (candidates if hrefs is None
+                             else hrefs & candidates)
+        if hrefs is None:
+            yield from super().get_filtered(filters)
+            return
+        logger.trace("STORAGE/get_filtered: property index selected %d "
+                     "item(s)", len(hrefs))
+        yield from self._prefilter_items(
+            (item for _, item in self.get_multi(sorted(hrefs))
+             if item is not None), filters)
@@ -24,7 +24,9 @@ import shlex
 import signal
 import subprocess
 import sys
-from typing import Iterator
+import uuid
+from tempfile import TemporaryDirectory
+from typing import Iterator, Optional
 
 from radicale import config, pathutils, types
 from radicale.log import logger
@@ -52,6 +54,7 @@ class StoragePartLock(StorageBase):
 
     _lock: pathutils.RwLock
     _hook: str
+    _change_token_path: str
 
     def __init__(self, configuration: config.Configuration) -> None:
         super().__init__(configuration)
@@ -59,11 +62,48 @@ class StoragePartLock(StorageBase):
         logger.debug("Lock file (StoragePartLock): %r" % lock_path)
         self._lock = pathutils.RwLock(lock_path)
         self._hook = configuration.get("storage", "hook")
+        self._change_token_path = os.path.join(self._filesystem_folder,
+                                               ".Radicale.changes")
+
+    def _write_change_token(self) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            with TemporaryDirectory(prefix=".Radicale.tmp-",
+                                    dir=self._filesystem_folder) as tmp_dir:
+                tmp_path = os.path.join(tmp_dir, ".Radicale.changes")
+                with open(tmp_path, "w", encoding="ascii") as f:
+                    f.write(token)
+                os.replace(tmp_path, self._change_token_path)
+        except OSError as e:
+            logger.warning("Failed to update change token %r: %s",
+                           self._change_token_path, e)
+            # Entries created with the old token must not be used anymore
+            with contextlib.suppress(OSError):
+                os.remove(self._change_token_path)
+            return None
+        return token
+
+    def get_change_token(self) -> Optional[str]:
+        try:
+            with open(self._change_token_path, encoding="ascii") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Failed to read change token %r: %s",
+                           self._change_token_path, e)
+            return None
+        # Race: Writers replace the token after their modifications
+        return self._write_change_token()
 
     @types.contextmanager
     def acquire_lock(self, mode: str, user: str = "", *args, **kwargs) -> Iterator[None]:
         with self._lock.acquire(mode):
-            yield
+            try:
+                yield
+            finally:
+                if mode == "w":
+                    self._write_change_token()
             # execute hook
             if mode == "w" and self._hook:
                 debug = logger.isEnabledFor(logging.DEBUG)
@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
 import os
 
 from radicale import item as radicale_item
@@ -61,6 +62,13 @@ class StoragePartMove(StorageBase):
             self._makedirs_synced(to_cache_folder)
             if cache_folder != to_cache_folder:
                 self._makedirs_synced(cache_folder)
+        # Converted items contain the href, they are recreated on demand
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self._get_collection_cache_subfolder(
+                item.collection._filesystem_path, ".Radicale.cache", "bday"),
+                item.href))
+        item.collection._update_property_index(item.href, None)
+        to_collection._update_property_index(to_href, item)
         # Track the change
         to_collection._update_history_etag(to_href, item)
         item.collection._update_history_etag(item.href, None)
@@ -21,7 +21,7 @@ import itertools
 import os
 import pickle
 from hashlib import sha256
-from typing import BinaryIO, Iterable, Tuple, cast
+from typing import BinaryIO, Dict, Iterable, Tuple, cast
 
 from radicale.log import logger
 from radicale.storage.multifilesystem.base import CollectionBase
@@ -33,6 +33,17 @@ class CollectionPartSync(CollectionPartCache, CollectionPartHistory,
                          CollectionBase):
 
     def sync(self, old_token: str = "") -> Tuple[str, Iterable[str]]:
+        token, changes, _ = self._sync(old_token)
+        return token, changes
+
+    def sync_page(self, old_token: str = "", limit: int = 0
+                  ) -> Tuple[str, Iterable[str], bool]:
+        if not limit:
+            return super().sync_page(old_token)
+        return self._sync(old_token, limit)
+
+    def _sync(self, old_token: str = "", limit: int = 0
+              ) -> Tuple[str, Iterable[str], bool]:
         # The sync token has the form http://radicale.org/ns/sync/TOKEN_NAME
         # where TOKEN_NAME is the sha256 hash of all history etags of present
         # and past items of the collection.
@@ -66,9 +77,8 @@ class CollectionPartSync(CollectionPartCache, CollectionPartHistory,
         token = "http://radicale.org/ns/sync/%s" % token_name
         if token_name == old_token_name:
             # Nothing changed
-            return token, ()
+            return token, (), False
         token_folder = self._storage._get_collection_cache_subfolder(self._filesystem_path, ".Radicale.cache", "sync-token")
-        token_path = os.path.join(token_folder, token_name)
         old_state = {}
         if old_token_name:
             # load the old token state
@@ -88,8 +98,41 @@ class CollectionPartSync(CollectionPartCache, CollectionPartHistory,
                                              PermissionError):
                         os.remove(old_token_path)
                 raise ValueError("Token not found: %r" % old_token)
+        self._store_sync_token(token_folder, token_name, state)
+        changes = []
+        # Find all new, changed and deleted (that are still in the item cache)
+        # items
+        for href, history_etag in state.items():
+            if history_etag != old_state.get(href):
+                changes.append(href)
+        # Find all deleted items that are no longer in the item cache
+        for href, history_etag in old_state.items():
+            if href not in state:
+                changes.append(href)
+        if not limit or len(changes) <= limit:
+            return token, changes, False
+        # Only return the first changes with a sync token for the state
+        # after these changes
+        changes = sorted(changes)[:limit]
+        page_state = dict(old_state)
+        for href in changes:
+            if href in state:
+                page_state[href] = state[href]
+            else:
+                del page_state[href]
+        page_token_name_hash = sha256()
+        for href, history_etag in sorted(page_state.items()):
+            page_token_name_hash.update((href + "/" + history_etag).encode())
+        page_token_name = page_token_name_hash.hexdigest()
+        self._store_sync_token(token_folder, page_token_name, page_state)
+        return ("http://radicale.org/ns/sync/%s" % page_token_name, changes,
+                True)
+
+    def _store_sync_token(self, token_folder: str, token_name: str,
+                          state: Dict[str, str]) -> None:
         # write the new token state or update the modification time of
         # existing token state
+        token_path = os.path.join(token_folder, token_name)
         if not os.path.exists(token_path):
             self._storage._makedirs_synced(token_folder)
             try:
@@ -110,14 +153,3 @@ class CollectionPartSync(CollectionPartCache, CollectionPartHistory,
             with contextlib.suppress(FileNotFoundError):
                 # Race: Another process might have deleted the file.
                 os.utime(token_path)
-        changes = []
-        # Find all new, changed and deleted (that are still in the item cache)
-        # items
-        for href, history_etag in state.items():
-            if history_etag != old_state.get(href):
-                changes.append(href)
-        # Find all deleted items that are no longer in the item cache
-        for href, history_etag in old_state.items():
-            if href not in state:
-                changes.append(href)
-        return token, changes
@@ -30,10 +30,12 @@ from radicale.storage.multifilesystem.base import CollectionBase
 from radicale.storage.multifilesystem.cache import CollectionPartCache
 from radicale.storage.multifilesystem.get import CollectionPartGet
 from radicale.storage.multifilesystem.history import CollectionPartHistory
+from radicale.storage.multifilesystem.index import CollectionPartIndex
 
 
-class CollectionPartUpload(CollectionPartGet, CollectionPartCache,
-                           CollectionPartHistory, CollectionBase):
+class CollectionPartUpload(CollectionPartIndex, CollectionPartGet,
+                           CollectionPartCache, CollectionPartHistory,
+                           CollectionBase):
 
     def upload(self, href: str, item: radicale_item.Item
                ) -> Tuple[radicale_item.Item, Optional[radicale_item.Item]]:
@@ -69,6 +71,7 @@ class CollectionPartUpload(CollectionPartGet, CollectionPartCache,
         uploaded_item = self._get(href, verify_href=False)
         if uploaded_item is None:
             raise RuntimeError("Storage modified externally")
+        self._update_property_index(href, uploaded_item)
         return uploaded_item, old_item
 
     def _upload_all_nonatomic(self, items: Iterable[radicale_item.Item],
@@ -134,7 +137,8 @@ class CollectionPartUpload(CollectionPartGet, CollectionPartCache,
             if self._storage._debug_cache_actions is True:
                 logger.debug("Item cache store into: %r", path_cache)
             with open(os.path.join(cache_folder, href), "wb") as fb:
-                pickle.dump((cache_hash, *cache_content), fb)
+                pickle.dump(self._item_cache_entry(cache_content, cache_hash),
+                            fb)
                 fb.flush()
                 self._storage._fsync(fb)
         self._storage._sync_directory(cache_folder)
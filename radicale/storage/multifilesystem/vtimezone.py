@@ -0,0 +1,169 @@
+# This file is part of Radicale - CalDAV and CardDAV server
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Registry of the VTIMEZONE components of all items.
+
+Item cache entries reference their VTIMEZONE components by the hash of
+their text instead of embedding them. The texts are stored once per storage
+in ``.Radicale.cache/vtimezone`` and interned in memory, so identical
+definitions are shared by all items.
+
+Files that were not used for ``VTIMEZONE_MAX_AGE`` seconds are removed
+together with the item cache (see ``CollectionPartCache``). Cache entries
+that reference a removed file are invalid and get recreated.
+
+"""
+
+import collections
+import contextlib
+import os
+import threading
+import time
+from hashlib import sha256
+from tempfile import TemporaryDirectory
+from typing import Optional, Tuple
+
+from radicale import pathutils
+from radicale.log import logger
+from radicale.storage.multifilesystem.base import StorageBase
+
+# Seconds after which unused files are removed from the registry
+VTIMEZONE_MAX_AGE: int = 30 * 24 * 60 * 60
+
+# Maximum number of VTIMEZONE components kept in memory
+MAX_VTIMEZONES_IN_MEMORY: int = 1024
+
+
+class StoragePartVTimezone(StorageBase):
+
+    # The text and the time when the file was last marked as used
+    _vtimezones: "collections.OrderedDict[str, Tuple[str, float]]"
+    _vtimezones_lock: threading.Lock
+
+    def __init__(self, configuration) -> None:
+        super().__init__(configuration)
+        self._vtimezones = collections.OrderedDict()
+        self._vtimezones_lock = threading.Lock()
+
+    def _get_vtimezone_folder(self) -> str:
+        folder = (self._get_collection_cache_folder()
+                  if self._use_cache_subfolder_for_item else
+                  self._filesystem_folder)
+        return os.path.join(folder, ".Radicale.cache", "vtimezone")
+
+    def _intern_vtimezone(self, text: str) -> str:
+        """Add the text of a VTIMEZONE to the registry.
+
+        Returns the hash of the text.
+
+        """
+        hash_ = sha256(text.encode()).hexdigest()
+        if self._get_interned_vtimezone(hash_) is not None:
+            return hash_
+        folder = self._get_vtimezone_folder()
+        path = os.path.join(folder, hash_)
+        if self._touch_vtimezone(hash_):
+            self._remember_vtimezone(hash_, text, time.time())
+            return hash_
+        self._makedirs_synced(folder)
+        # Race: Other processes might store the same file
+        with contextlib.suppress(PermissionError), TemporaryDirectory(
+                prefix=".Radicale.tmp-", dir=folder) as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, hash_)
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+                f.flush()
+                self._fsync(f)
+            os.replace(tmp_path, path)
+            self._sync_directory(folder)
+        self._remember_vtimezone(hash_, text, time.time())
+        return hash_
+
+    def _load_vtimezone(self, hash_: str) -> Optional[str]:
+        """Get the text of a VTIMEZONE from the registry.
+
+        Returns ``None`` if the hash is unknown.
+
+        """
+        text = self._get_interned_vtimezone(hash_)
+        if text is not None:
+            return text
+        if not pathutils.is_safe_filesystem_path_component(hash_):
+            return None
+        path = os.path.join(self._get_vtimezone_folder(), hash_)
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                text = f.read()
+                used = os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+        if sha256(text.encode()).hexdigest() != hash_:
+            logger.warning("Invalid VTIMEZONE in cache: %r", path)
+            return None
+        if time.time() - used > VTIMEZONE_MAX_AGE / 2:
+            self._touch_vtimezone(hash_)
+            used = time.time()
+        return self._remember_vtimezone(hash_, text, used)
+
+    def _get_interned_vtimezone(self, hash_: str) -> Optional[str]:
+        """Get the text of a VTIMEZONE from memory.
+
+        The file is marked as used again, if it wasn't for half of
+        ``VTIMEZONE_MAX_AGE``. Returns ``None`` if the file was removed in
+        the meantime.
+
+        """
+        with self._vtimezones_lock:
+            entry = self._vtimezones.get(hash_)
+            if entry is None:
+                return None
+            self._vtimezones.move_to_end(hash_)
+        text, used = entry
+        if time.time() - used > VTIMEZONE_MAX_AGE / 2:
+            if not self._touch_vtimezone(hash_):
+                with self._vtimezones_lock:
+                    self._vtimezones.pop(hash_, None)
+                return None
+            self._remember_vtimezone(hash_, text, time.time())
+        return text
+
+    def _remember_vtimezone(self, hash_: str, text: str, used: float) -> str:
+        with self._vtimezones_lock:
+            # Keep the interned text
+            entry = self._vtimezones.get(hash_)
+            if entry is not None:
+                text = entry[0]
+            self._vtimezones[hash_] = (text, used)
+            self._vtimezones.move_to_end(hash_)
+            while len(self._vtimezones) > MAX_VTIMEZONES_IN_MEMORY:
+                self._vtimezones.popitem(last=False)
+        return text
+
+    def _touch_vtimezone(self, hash_: str) -> bool:
+        """Mark the file of a VTIMEZONE as used.
+
+        Returns ``False`` if the file doesn't exist.
+
+        """
+        path = os.path.join(self._get_vtimezone_folder(), hash_)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        except PermissionError:
+            # Files of other users can't be touched, but they exist
+            return os.path.isfile(path)
+        return True
@@ -29,6 +29,7 @@ from radicale.storage import BaseCollection, multifilesystem
 class Collection(multifilesystem.Collection):
 
     sync = BaseCollection.sync
+    sync_page = BaseCollection.sync_page
 
 
 class Storage(multifilesystem.Storage):
@@ -22,18 +22,25 @@ Radicale tests with simple requests.
 """
 
 import datetime
+import gzip
 import logging
 import os
 import posixpath
 import sys
 import urllib
-from typing import Any, Callable, ClassVar, Iterable, List, Optional, Tuple
+import wsgiref.util
+import xml.etree.ElementTree as ET
+from typing import (Any, Callable, ClassVar, Dict, Iterable, List, Optional,
+                    Set, Tuple)
 
 import defusedxml.ElementTree as DefusedET
 import pytest
 import vobject
 
+import radicale.item as radicale_item
 from radicale import pathutils, storage, utils, xmlutils
+from radicale.app import propfind as app_propfind
+from radicale.app import report as app_report
 from radicale.tests import RESPONSES, BaseTest
 from radicale.tests.helpers import get_file_content
 
@@ -151,6 +158,38 @@ permissions: RrWw""")
         assert "Event" in answer
         assert "UID:event" in answer
 
+    def test_get_conditional(self) -> None:
+        """Conditional GET and HEAD with If-None-Match and
+        If-Modified-Since."""
+        self.mkcalendar("/calendar.ics/")
+        event = get_file_content("event1.ics")
+        path = "/calendar.ics/event1.ics"
+        self.put(path, event)
+        for path in ("/calendar.ics/event1.ics", "/calendar.ics/"):
+            _, headers, _ = self.request("GET", path, check=200)
+            etag = headers["ETag"]
+            last_modified = headers["Last-Modified"]
+            for method in ("GET", "HEAD"):
+                _, headers, answer = self.request(
+                    method, path, check=304, HTTP_IF_NONE_MATCH=etag)
+                assert headers["ETag"] == etag and not answer
+                self.request(method, path, check=304,
+                             HTTP_IF_NONE_MATCH="\"other\", W/%s" % etag)
+                self.request(method, path, check=304, HTTP_IF_NONE_MATCH="*")
+                self.request(method, path, check=200,
+                             HTTP_IF_NONE_MATCH="\"other\"")
+                self.request(method, path, check=304,
+                             HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.request(method, path, check=200,
+                             HTTP_IF_MODIFIED_SINCE="Thu, 01 Jan 1970 "
+                             "00:00:00 GMT")
+                self.request(method, path, check=200,
+                             HTTP_IF_MODIFIED_SINCE="invalid")
+                # If-None-Match takes precedence
+                self.request(method, path, check=200,
+                             HTTP_IF_NONE_MATCH="\"other\"",
+                             HTTP_IF_MODIFIED_SINCE=last_modified)
+
     def test_add_event_y2040(self) -> None:
         """Add an event with year 2040."""
         self.mkcalendar("/calendar.ics/")
@@ -626,6 +665,86 @@ permissions: RrWw""")
         assert "\r\nUID:event\r\n" in answer and "\r\nUID:todo\r\n" in answer
         assert "\r\nUID:event1\r\n" not in answer
 
+    def test_get_whole_calendar_streamed(self) -> None:
+        """Get a whole calendar as a streamed response."""
+        self.mkcalendar("/calendar.ics/")
+        vevent_count = 0
+        for name in ("event1.ics", "event2.ics", "event3.ics"):
+            event = get_file_content(name)
+            vevent_count += event.count("BEGIN:VEVENT")
+            self.put("/calendar.ics/%s" % name, event)
+        _, headers, answer = self.request("GET", "/calendar.ics/", check=200)
+        assert "Content-Length" not in headers
+        assert headers["Content-Type"] == "text/calendar; charset=utf-8"
+        # Shared timezones are only included once
+        assert answer.count("BEGIN:VTIMEZONE") == 1
+        assert answer.count("BEGIN:VEVENT") == vevent_count
+        calendar = vobject.readOne(answer)
+        assert len(calendar.vevent_list) == vevent_count
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/calendar.ics/",
+                   "HTTP_ACCEPT_ENCODING": "gzip"}
+        wsgiref.util.setup_testing_defaults(environ)
+        headers.clear()
+
+        def start_response(status: str, headers_: List[Tuple[str, str]]
+                           ) -> None:
+            assert status.startswith("200 ")
+            headers.update(headers_)
+        answers = self.application(environ, start_response)
+        assert headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(b"".join(answers)).decode() == answer
+        # The body is a snapshot of the collection, the storage is not
+        # locked while it is sent
+        del environ["HTTP_ACCEPT_ENCODING"]
+        answers = self.application(environ, start_response)
+        self.request("DELETE", "/calendar.ics/event1.ics", check=200)
+        assert b"".join(answers).decode() == answer
+
+    def test_compression(self) -> None:
+        """Compress responses depending on size and Accept-Encoding."""
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+
+        def request(path: str, accept_encoding: str
+                    ) -> Tuple[Dict[str, str], bytes]:
+            environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path,
+                       "HTTP_ACCEPT_ENCODING": accept_encoding}
+            wsgiref.util.setup_testing_defaults(environ)
+            headers: Dict[str, str] = {}
+
+            def start_response(status: str, headers_: List[Tuple[str, str]]
+                               ) -> None:
+                assert status.startswith("200 ")
+                headers.update(headers_)
+            answer = b"".join(self.application(environ, start_response))
+            return headers, answer
+        _, event = self.get("/calendar.ics/event1.ics")
+        self.configure({"server": {"compression": "gzip",
+                                   "compression_min_size": "1",
+                                   "compression_level": "19"}})
+        headers, answer = request("/calendar.ics/event1.ics", "gzip")
+        assert headers["Content-Encoding"] == "gzip"
+        assert headers["Vary"] == "Accept-Encoding"
+        assert headers["Content-Length"] == str(len(answer))
+        assert gzip.decompress(answer).decode() == event
+        # Unknown or refused codings
+        for accept_encoding in ("br", "gzip;q=0", "*;q=0", ""):
+            headers, answer = request("/calendar.ics/event1.ics",
+                                      accept_encoding)
+            assert "Content-Encoding" not in headers
+            assert answer.decode() == event
+        headers, answer = request("/calendar.ics/event1.ics", "br, *")
+        assert headers["Content-Encoding"] == "gzip"
+        # Small responses are not compressed
+        self.configure({"server": {"compression_min_size": "65536"}})
+        headers, answer = request("/calendar.ics/event1.ics", "gzip")
+        assert "Content-Encoding" not in headers
+        assert answer.decode() == event
+        self.configure({"server": {"compression": ""}})
+        headers, answer = request("/calendar.ics/", "gzip")
+        assert "Content-Encoding" not in headers
+        assert "Vary" not in headers
+
     def test_put_whole_calendar_without_uids(self) -> None:
         """Create a whole calendar without UID."""
         event = get_file_content("event_multiple.ics")
@@ -944,6 +1063,71 @@ permissions: RrWw""")
         _, headers, answer = self.request("HEAD", "/", check=302)
         assert int(headers.get("Content-Length", "0")) > 0 and not answer
 
+    def test_head_item_and_collection(self) -> None:
+        """HEAD requests return the headers of GET requests."""
+        self.mkcalendar("/calendar.ics/")
+        event = get_file_content("event1.ics")
+        self.put("/calendar.ics/event1.ics", event)
+        for path in ("/calendar.ics/event1.ics", "/calendar.ics/"):
+            _, get_headers, get_answer = self.request("GET", path, check=200)
+            _, headers, answer = self.request("HEAD", path, check=200)
+            assert not answer
+            for key in ("Content-Type", "ETag", "Last-Modified"):
+                assert headers[key] == get_headers[key]
+            if path.endswith(".ics/"):
+                # The size of the export is unknown
+                assert "Content-Length" not in headers
+            else:
+                assert headers["Content-Length"] == str(
+                    len(get_answer.encode()))
+
+    def test_head_compression(self, monkeypatch) -> None:
+        """HEAD requests return the content coding of GET requests
+        without serializing items."""
+        self.configure({"server": {"compression": "gzip",
+                                   "compression_min_size": "100"}})
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+
+        def request(method: str, path: str) -> Tuple[Dict[str, str], bytes]:
+            environ = {"REQUEST_METHOD": method, "PATH_INFO": path,
+                       "HTTP_ACCEPT_ENCODING": "gzip"}
+            wsgiref.util.setup_testing_defaults(environ)
+            headers: Dict[str, str] = {}
+
+            def start_response(status: str, headers_: List[Tuple[str, str]]
+                               ) -> None:
+                assert status.startswith("200 ")
+                headers.update(headers_)
+            answer = b"".join(self.application(environ, start_response))
+            return headers, answer
+
+        def fail(*args, **kwargs):
+            raise AssertionError("item serialized")
+        for path in ("/calendar.ics/event1.ics", "/calendar.ics/"):
+            get_headers, get_answer = request("GET", path)
+            with monkeypatch.context() as m:
+                m.setattr(radicale_item.Item, "serialize", fail)
+                m.setattr(radicale_item.Item, "serialize_bytes", fail)
+                headers, answer = request("HEAD", path)
+            assert not answer
+            assert get_headers["Content-Encoding"] == "gzip"
+            for key in ("Content-Type", "Content-Encoding", "Vary", "ETag"):
+                assert headers[key] == get_headers[key]
+            # The size of the compressed content is unknown
+            assert "Content-Length" not in headers
+        # Small items are not compressed, the size is taken from the storage
+        self.configure({"server": {"compression_min_size": "100000"}})
+        path = "/calendar.ics/event1.ics"
+        get_headers, get_answer = request("GET", path)
+        with monkeypatch.context() as m:
+            m.setattr(radicale_item.Item, "serialize", fail)
+            m.setattr(radicale_item.Item, "serialize_bytes", fail)
+            headers, _ = request("HEAD", path)
+        assert "Content-Encoding" not in headers
+        assert headers["Vary"] == get_headers["Vary"]
+        assert headers["Content-Length"] == str(len(get_answer))
+
     def test_options(self) -> None:
         _, headers, _ = self.request("OPTIONS", "/", check=200)
         assert "DAV" in headers
@@ -1147,6 +1331,100 @@ permissions: RrWw""")
         assert status == 200 and prop.text
         assert "C:max-resource-size" not in response
 
+    def test_propfind_fragments(self, monkeypatch) -> None:
+        """Verify that static property values are reused between
+        responses."""
+        for fragment in [app_propfind._href_property,
+                         app_propfind._current_user_privilege_set,
+                         app_propfind._supported_report_set,
+                         app_propfind._supported_calendar_component_set,
+                         app_propfind._supported_address_data,
+                         app_propfind._resourcetype]:
+            fragment.cache_clear()
+        built: List[ET.Element] = []
+        supported_report_set = app_propfind._supported_report_set
+
+        def recording_supported_report_set(reports):
+            built.append(supported_report_set(reports))
+            return built[-1]
+        monkeypatch.setattr(app_propfind, "_supported_report_set",
+                            recording_supported_report_set)
+        self.mkcalendar("/calendar.ics/")
+        self.mkcalendar("/tasks.ics/", """\
+<?xml version="1.0" encoding="UTF-8" ?>
+<C:mkcalendar xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:set><D:prop><C:supported-calendar-component-set>
+    <C:comp name="VTODO"/>
+  </C:supported-calendar-component-set></D:prop></D:set>
+</C:mkcalendar>""")
+        propfind = get_file_content("allprop.xml")
+        reports = []
+        for _ in range(2):
+            _, responses = self.propfind("/calendar.ics/", propfind)
+            response = responses["/calendar.ics/"]
+            assert not isinstance(response, int)
+            _, prop = response["D:supported-report-set"]
+            reports.append([report[0][0].tag for report in prop])
+        assert reports[0] == reports[1]
+        assert xmlutils.make_clark("C:calendar-query") in reports[0]
+        # The same element is used for both responses
+        assert len(built) == 2 and built[0] is built[1]
+        # Logging the response content doesn't format the shared element
+        assert all(element.text is None and element.tail is None
+                   for element in built[0].iter())
+        # The values depend on the properties of the collection
+        for path, components in [("/calendar.ics/", ["VTODO", "VEVENT",
+                                                     "VJOURNAL"]),
+                                 ("/tasks.ics/", ["VTODO"])]:
+            _, responses = self.propfind(path, propfind)
+            response = responses[path]
+            assert not isinstance(response, int)
+            _, prop = response["C:supported-calendar-component-set"]
+            assert [comp.get("name") for comp in prop] == components
+
+    def test_response_cache(self) -> None:
+        """Repeated PROPFIND and REPORT requests are answered from the
+        response cache until the storage changes."""
+        self.configure({"logging": {"request_content_on_debug": "False",
+                                    "response_content_on_debug": "False"},
+                        "reporting": {"max_response_cache_size": "1000000"}})
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        storage = self.application._storage
+        discover = storage.discover
+        discovered: List[str] = []
+
+        def counting_discover(path: str, *args, **kwargs):
+            discovered.append(path)
+            return discover(path, *args, **kwargs)
+        setattr(storage, "discover", counting_discover)
+        propfind = get_file_content("allprop.xml")
+        report = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/></D:prop>
+  <C:filter><C:comp-filter name="VCALENDAR"/></C:filter>
+</C:calendar-query>"""
+        for method, data in [("PROPFIND", propfind), ("REPORT", report)]:
+            discovered.clear()
+            _, _, answer1 = self.request(method, "/calendar.ics/", data,
+                                         check=207, HTTP_DEPTH="1")
+            assert discovered
+            discovered.clear()
+            _, _, answer2 = self.request(method, "/calendar.ics/", data,
+                                         check=207, HTTP_DEPTH="1")
+            assert answer1 == answer2 and not discovered
+            # A different request body is not answered from the cache
+            self.request(method, "/calendar.ics/", data + "\n", check=207,
+                         HTTP_DEPTH="1")
+            assert discovered
+        # Modifications invalidate the cached responses
+        self.put("/calendar.ics/event2.ics", get_file_content("event2.ics"))
+        for method, data in [("PROPFIND", propfind), ("REPORT", report)]:
+            _, _, answer = self.request(method, "/calendar.ics/", data,
+                                        check=207, HTTP_DEPTH="1")
+            assert "/calendar.ics/event2.ics" in answer
+
     def test_propfind_nonexistent(self) -> None:
         """Read a property that does not exist."""
         self.mkcalendar("/calendar.ics/")
@@ -1157,6 +1435,97 @@ permissions: RrWw""")
         status, prop = response["ICAL:calendar-color"]
         assert status == 404 and not prop.text
 
+    def test_propfind_streamed(self) -> None:
+        """Read properties of many items as a streamed response."""
+        # Logging of the response content disables streaming
+        self.configure({"logging": {"response_content_on_debug": "False"}})
+        self.mkcalendar("/calendar.ics/")
+        event = get_file_content("event1.ics")
+        for i in range(3):
+            self.put("/calendar.ics/event%d.ics" % i,
+                     event.replace("UID:event1", "UID:event1-%d" % i))
+        propfind = get_file_content("allprop.xml")
+        _, headers, answer = self.request(
+            "PROPFIND", "/calendar.ics/", propfind, check=207,
+            HTTP_DEPTH="1")
+        assert "Content-Length" not in headers
+        assert headers["Content-Type"] == "text/xml; charset=utf-8"
+        # Namespaces are only declared on the root element
+        assert answer.count('xmlns="DAV:"') == 1
+        responses = self.parse_responses(answer)
+        assert len(responses) == 4
+        for i in range(3):
+            response = responses["/calendar.ics/event%d.ics" % i]
+            assert not isinstance(response, int)
+            status, prop = response["D:getetag"]
+            assert status == 200 and prop.text
+
+    def test_report_partial_calendar_data(self) -> None:
+        """Partial retrieval of calendar data (see rfc4791-9.6)."""
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        _, responses = self.report("/calendar.ics/", """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop>
+    <C:calendar-data>
+      <C:comp name="VCALENDAR">
+        <C:prop name="VERSION"/>
+        <C:comp name="VEVENT">
+          <C:prop name="SUMMARY"/>
+          <C:prop name="UID"/>
+          <C:prop name="ATTENDEE" novalue="yes"/>
+        </C:comp>
+        <C:comp name="VTIMEZONE"/>
+      </C:comp>
+    </C:calendar-data>
+  </D:prop>
+</C:calendar-query>""")
+        response = responses["/calendar.ics/event1.ics"]
+        assert not isinstance(response, int)
+        status, prop = response["C:calendar-data"]
+        assert status == 200 and prop.text
+        assert prop.text.replace("\r\n", "\n") == """\
+BEGIN:VCALENDAR
+VERSION:2.0
+BEGIN:VTIMEZONE
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:event1
+ATTENDEE;CN=Jane Doe;PARTSTAT=TENTATIVE;ROLE=REQ-PARTICIPANT:
+ATTENDEE;CN=John Doe;DELEGATED-FROM="MAILTO:bob@host.com";PARTSTAT=ACCEPTED;\
+ROLE=REQ-PARTICIPANT:
+SUMMARY:Event
+END:VEVENT
+END:VCALENDAR
+"""
+
+    def test_report_partial_address_data(self) -> None:
+        """Partial retrieval of address data (see rfc6352-10.4)."""
+        self.create_addressbook("/contacts.vcf/")
+        self.put("/contacts.vcf/contact.vcf",
+                 get_file_content("contact_photo_with_data_uri.vcf"))
+        _, responses = self.report("/contacts.vcf/", """\
+<?xml version="1.0" encoding="utf-8" ?>
+<CR:addressbook-query xmlns:D="DAV:" xmlns:CR="urn:ietf:params:xml:ns:carddav">
+  <D:prop>
+    <CR:address-data>
+      <CR:prop name="FN"/>
+      <CR:prop name="UID"/>
+    </CR:address-data>
+  </D:prop>
+</CR:addressbook-query>""")
+        response = responses["/contacts.vcf/contact.vcf"]
+        assert not isinstance(response, int)
+        status, prop = response["CR:address-data"]
+        assert status == 200 and prop.text
+        assert "PHOTO" not in prop.text
+        vcard = vobject.readOne(prop.text)
+        assert vcard.fn.value == "Contact"
+        assert vcard.uid.value == "contact"
+        assert vcard.version.value == "3.0"
+        assert set(vcard.contents) == {"fn", "uid", "version"}
+
     def test_propfind_max_resource_size(self) -> None:
         """Read property C:max-resource-size"""
         self.mkcalendar("/calendar.ics/")
@@ -2297,6 +2666,94 @@ permissions: RrWw""")
         status, prop = response["D:getetag"]
         assert status == 200 and prop.text
 
+    def test_report_occurrences_limit(self) -> None:
+        """Hit the occurrences limit on a later item of a streamed
+        report."""
+        self.configure({"logging": {"request_content_on_debug": "False",
+                                    "response_content_on_debug": "False"},
+                        "reporting": {"max_expand_occurrence": "2"}})
+        self.mkcalendar("/calendar.ics/")
+        report = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <D:prop><C:calendar-data /></D:prop>
+    <C:filter>
+        <C:comp-filter name="VCALENDAR">
+            <C:comp-filter name="VEVENT" />
+        </C:comp-filter>
+    </C:filter>
+</C:calendar-query>"""
+        for name in ("event1.ics", "event3.ics"):
+            self.put("/calendar.ics/%s" % name, get_file_content(name))
+        _, responses = self.report("/calendar.ics/", report)
+        assert len(responses) == 2
+        # The todo is not counted, the third event exceeds the limit
+        self.put("/calendar.ics/todo1.ics", get_file_content("todo1.ics"))
+        self.report("/calendar.ics/", report)
+        self.put("/calendar.ics/event4.ics", get_file_content("event4.ics"))
+        self.request("REPORT", "/calendar.ics/", report, check=400)
+
+    def test_report_streamed(self, monkeypatch) -> None:
+        """Filter the items of a streamed report while it is sent."""
+        self.configure({"logging": {"request_content_on_debug": "False",
+                                    "response_content_on_debug": "False"}})
+        self.mkcalendar("/calendar.ics/")
+        report = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <D:prop><D:getetag /></D:prop>
+    <C:filter>
+        <C:comp-filter name="VCALENDAR">
+            <C:comp-filter name="VEVENT">
+                <C:prop-filter name="SUMMARY">
+                    <C:text-match>Event</C:text-match>
+                </C:prop-filter>
+            </C:comp-filter>
+        </C:comp-filter>
+    </C:filter>
+</C:calendar-query>"""
+        for name in ("event1.ics", "event3.ics"):
+            self.put("/calendar.ics/%s" % name, get_file_content(name))
+        events = []
+        original_compile_filter = app_report.compile_filter
+        original_xml_item_response = app_report.xml_item_response
+
+        def compile_filter(collection_tag, filter_):
+            filter_match = original_compile_filter(collection_tag, filter_)
+
+            def match(item):
+                events.append("match")
+                return filter_match(item)
+            return match
+
+        def xml_item_response(*args, **kwargs):
+            events.append("response")
+            return original_xml_item_response(*args, **kwargs)
+
+        with pytest.MonkeyPatch.context() as m:
+            m.setattr(app_report, "compile_filter", compile_filter)
+            m.setattr(app_report, "xml_item_response", xml_item_response)
+            _, headers, answer = self.request(
+                "REPORT", "/calendar.ics/", report, check=207)
+        # Streamed with the default occurrences limit, the items are
+        # filtered one after another
+        assert "Content-Length" not in headers
+        assert events == ["match", "response"] * 2
+        self.put("/calendar.ics/todo1.ics", get_file_content("todo1.ics"))
+        _, responses = self.report("/calendar.ics/", report)
+        assert set(responses) == {
+            "/calendar.ics/event1.ics", "/calendar.ics/event3.ics"}
+
+        def failing_compile_filter(collection_tag, filter_):
+            def match(item):
+                raise ValueError("invalid")
+            return match
+
+        # Errors while filtering the first item result in an error response
+        monkeypatch.setattr(app_report, "compile_filter",
+                            failing_compile_filter)
+        self.request("REPORT", "/calendar.ics/", report, check=400)
+
     def test_report_free_busy(self) -> None:
         """Test free busy report on a few items"""
         calendar_path = "/calendar.ics/"
@@ -2315,10 +2772,13 @@ permissions: RrWw""")
         assert len(responses) == 1
         vcalendar = list(responses.values())[0]
         assert isinstance(vcalendar, vobject.base.Component)
-        assert len(vcalendar.vfreebusy_list) == 3
+        assert len(vcalendar.vfreebusy_list) == 1
+        vfb = vcalendar.vfreebusy
+        assert vfb.dtstart.value == datetime.datetime(
+            2013, 9, 1, 14, tzinfo=datetime.timezone.utc)
         types = {}
-        for vfb in vcalendar.vfreebusy_list:
-            fbtype_val = vfb.fbtype.value
+        for freebusy in vfb.freebusy_list:
+            fbtype_val = freebusy.params["FBTYPE"][0]
             if fbtype_val not in types:
                 types[fbtype_val] = 0
             types[fbtype_val] += 1
@@ -2342,7 +2802,37 @@ permissions: RrWw""")
         assert len(responses) == 1
         vcalendar = list(responses.values())[0]
         assert isinstance(vcalendar, vobject.base.Component)
-        assert len(vcalendar.vfreebusy_list) == 3
+        assert len(vcalendar.vfreebusy.freebusy_list) == 3
+
+    def test_report_free_busy_coalesced(self) -> None:
+        """Test that free busy periods are merged per FBTYPE"""
+        calendar_path = "/calendar.ics/"
+        self.mkcalendar(calendar_path)
+        events = [("a", "20130901T100000Z", "20130901T120000Z", ""),
+                  ("b", "20130901T110000Z", "20130901T130000Z", ""),
+                  ("c", "20130901T130000Z", "20130901T140000Z", ""),
+                  ("d", "20130901T110000Z", "20130901T150000Z",
+                   "STATUS:TENTATIVE\r\n"),
+                  ("e", "20130831T220000Z", "20130901T010000Z",
+                   "RRULE:FREQ=DAILY;COUNT=3\r\n")]
+        for uid, start, end, extra in events:
+            self.put(posixpath.join(calendar_path, uid + ".ics"), (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nBEGIN:VEVENT\r\n"
+                "UID:%s\r\nDTSTAMP:20130801T000000Z\r\nDTSTART:%s\r\n"
+                "DTEND:%s\r\n%sEND:VEVENT\r\nEND:VCALENDAR\r\n" %
+                (uid, start, end, extra)))
+        _, _, answer = self.request("REPORT", calendar_path, """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:free-busy-query xmlns:C="urn:ietf:params:xml:ns:caldav">
+    <C:time-range start="20130901T000000Z" end="20130902T000000Z"/>
+</C:free-busy-query>""", check=200)
+        lines = answer.splitlines()
+        assert lines.count("BEGIN:VFREEBUSY") == 1
+        assert [line for line in lines if line.startswith("FREEBUSY")] == [
+            "FREEBUSY;FBTYPE=BUSY:20130901T000000Z/20130901T010000Z",
+            "FREEBUSY;FBTYPE=BUSY:20130901T100000Z/20130901T140000Z",
+            "FREEBUSY;FBTYPE=BUSY-TENTATIVE:20130901T110000Z/20130901T150000Z",
+            "FREEBUSY;FBTYPE=BUSY:20130901T220000Z/20130902T000000Z"]
 
     def _report_sync_token(
             self, calendar_path: str, sync_token: Optional[str] = None, **kwargs
@@ -2374,9 +2864,85 @@ permissions: RrWw""")
                 status, prop = response["D:getetag"]
                 assert status == 200 and prop.text and len(response) == 1
                 responses[href] = response = 200
-            assert response in (200, 404)
+            assert response in (200, 404, 507)
         return sync_token, responses
 
+    def test_report_sync_collection_paged(self) -> None:
+        """Test sync-collection report with truncated results"""
+        if not self.full_sync_token_support:
+            pytest.skip("sync-collection paging is not supported by backend")
+        self.configure({"reporting": {"max_results": "2"}})
+        calendar_path = "/calendar.ics/"
+        self.mkcalendar(calendar_path)
+        event = get_file_content("event1.ics")
+        for i in range(5):
+            self.put(posixpath.join(calendar_path, "event%d.ics" % i),
+                     event.replace("UID:event1", "UID:event%d" % i))
+        sync_token = None
+        hrefs: Set[str] = set()
+        for i in range(3):
+            sync_token, responses = self._report_sync_token(
+                calendar_path, sync_token)
+            assert responses.pop(calendar_path, None) == (
+                507 if i < 2 else None)
+            assert len(responses) == (2 if i < 2 else 1)
+            hrefs.update(responses)
+        assert hrefs == {posixpath.join(calendar_path, "event%d.ics" % i)
+                         for i in range(5)}
+        _, responses = self._report_sync_token(calendar_path, sync_token)
+        assert not responses
+        self.delete(posixpath.join(calendar_path, "event0.ics"))
+        # The limit of the client is used if it is smaller
+        self.configure({"reporting": {"max_results": "0"}})
+        status, _, answer = self.request("REPORT", calendar_path, """\
+<?xml version="1.0" encoding="utf-8" ?>
+<sync-collection xmlns="DAV:">
+    <prop>
+        <getetag />
+    </prop>
+    <sync-token />
+    <limit><nresults>3</nresults></limit>
+</sync-collection>""", check=207)
+        responses = self.parse_responses(answer)
+        assert responses.pop(calendar_path) == 507
+        assert len(responses) == 3
+        self.request("REPORT", calendar_path, """\
+<?xml version="1.0" encoding="utf-8" ?>
+<sync-collection xmlns="DAV:">
+    <prop>
+        <getetag />
+    </prop>
+    <sync-token />
+    <limit><nresults>0</nresults></limit>
+</sync-collection>""", check=400)
+
+    def test_report_addressbook_query_limit(self) -> None:
+        """Test addressbook-query report with truncated results"""
+        self.create_addressbook("/contacts.vcf/")
+        contact = get_file_content("contact1.vcf")
+        for i in range(3):
+            self.put("/contacts.vcf/contact%d.vcf" % i,
+                     contact.replace("UID:contact1", "UID:contact%d" % i))
+        _, responses = self.report("/contacts.vcf/", """\
+<?xml version="1.0" encoding="utf-8" ?>
+<CR:addressbook-query xmlns:D="DAV:" xmlns:CR="urn:ietf:params:xml:ns:carddav">
+  <D:prop>
+    <D:getetag/>
+  </D:prop>
+  <CR:limit><CR:nresults>2</CR:nresults></CR:limit>
+</CR:addressbook-query>""")
+        assert responses.pop("/contacts.vcf/") == 507
+        assert len(responses) == 2
+        self.configure({"reporting": {"max_results": "3"}})
+        _, responses = self.report("/contacts.vcf/", """\
+<?xml version="1.0" encoding="utf-8" ?>
+<CR:addressbook-query xmlns:D="DAV:" xmlns:CR="urn:ietf:params:xml:ns:carddav">
+  <D:prop>
+    <D:getetag/>
+  </D:prop>
+</CR:addressbook-query>""")
+        assert len(responses) == 3
+
     def test_report_sync_collection_no_change(self) -> None:
         """Test sync-collection report without modifying the collection"""
         calendar_path = "/calendar.ics/"
@@ -27,6 +27,9 @@ import os
 from typing import ClassVar, List, Optional
 from xml.etree import ElementTree
 
+import pytest
+
+import radicale.app.report
 from radicale.log import logger
 from radicale.tests import BaseTest
 from radicale.tests.helpers import get_file_content
@@ -231,6 +234,40 @@ permissions: RrWw""")
             1
         )
 
+    def test_report_with_expand_cache(self) -> None:
+        """Test that expanded calendar data is cached per item ETag"""
+        request = self._req_with_expand(
+            "event_daily_rrule", "20060103T000000Z", "20060105T000000Z")
+        expanded = []
+        original_expand = radicale.app.report._expand
+
+        def counting_expand(*args, **kwargs):
+            expanded.append(kwargs["item"].href)
+            return original_expand(*args, **kwargs)
+
+        def calendar_data() -> str:
+            _, responses = self.report("/calendar.ics/", request)
+            response = responses["/calendar.ics/event_daily_rrule.ics"]
+            assert isinstance(response, dict)
+            status, element = response["C:calendar-data"]
+            assert status == 200 and element.text
+            return element.text
+
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(radicale.app.report, "_expand",
+                                counting_expand)
+            text = calendar_data()
+            assert len(expanded) == 1
+            assert calendar_data() == text
+            assert len(expanded) == 1
+            assert "RECURRENCE-ID:20060104T170000Z" in text
+            # Modified items are expanded again
+            self.put("/calendar.ics/", get_file_content(
+                "event_daily_rrule.ics").replace(
+                    "SUMMARY:Recurring event", "SUMMARY:Modified"))
+            assert "SUMMARY:Modified" in calendar_data()
+            assert len(expanded) == 2
+
     def test_report_with_expand_property_start_inside(self) -> None:
         """Test report with expand property start inside"""
         self._test_expand(
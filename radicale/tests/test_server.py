@@ -22,12 +22,15 @@ Test the internal server.
 import errno
 import os
 import socket
+import socketserver
 import ssl
+import stat
 import subprocess
 import sys
 import threading
 import time
 from configparser import RawConfigParser
+from http import client
 from http.client import HTTPMessage
 from typing import IO, Callable, Dict, Optional, Tuple, cast
 from urllib import request
@@ -37,7 +40,8 @@ import pytest
 
 from radicale import config, server
 from radicale.tests import BaseTest
-from radicale.tests.helpers import configuration_to_dict, get_file_path
+from radicale.tests.helpers import (configuration_to_dict, get_file_content,
+                                    get_file_path)
 
 
 class DisabledRedirectHandler(request.HTTPRedirectHandler):
@@ -131,6 +135,49 @@ class TestBaseServerRequests(BaseTest):
         self.thread.start()
         self.get("/", check=302)
 
+    @pytest.mark.parametrize("use_mtime_and_size", ["False", "True"])
+    def test_sendfile(self, use_mtime_and_size: str) -> None:
+        """Verify that stored items are sent from the file."""
+        rights_file_path = os.path.join(self.colpath, "rights")
+        with open(rights_file_path, "w") as f:
+            f.write("[allow all]\nuser: .*\ncollection: .*\n"
+                    "permissions: RrWw\n")
+        self.configure({"auth": {"type": "none"},
+                        "rights": {"type": "from_file",
+                                   "file": rights_file_path},
+                        "storage": {"use_mtime_and_size_for_item_cache":
+                                    use_mtime_and_size}})
+        sent_files = []
+        sent = threading.Event()
+        original_sendfile = server.ServerHandler.sendfile
+
+        def sendfile(handler: server.ServerHandler) -> bool:
+            try:
+                result = original_sendfile(handler)
+                sent_files.append(result)
+            finally:
+                sent.set()
+            return result
+
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(server.ServerHandler, "sendfile", sendfile)
+            self.thread.start()
+            self.mkcalendar("/calendar.ics/")
+            event = get_file_content("event1.ics")
+            self.put("/calendar.ics/event1.ics", event)
+            _, headers, answer = self.request(
+                "GET", "/calendar.ics/event1.ics", check=200)
+            # The client receives the body before the server thread
+            # returns from ``sendfile``
+            assert sent.wait(10)
+        assert sent_files == [True]
+        path = os.path.join(self.colpath, "collection-root", "calendar.ics",
+                            "event1.ics")
+        with open(path, newline="") as f:
+            assert answer == f.read()
+        assert headers["Content-Length"] == str(os.path.getsize(path))
+        assert "charset=utf-8" in headers["Content-Type"]
+
     def test_ssl(self) -> None:
         self.configure({"server": {"ssl": "True",
                                    "certificate": get_file_path("cert.pem"),
@@ -183,6 +230,74 @@ class TestBaseServerRequests(BaseTest):
         self.thread.start()
         self.get("/", check=302)
 
+    @pytest.mark.skipif(sys.platform == "win32",
+                        reason="Unix domain sockets are not supported")
+    def test_unix_socket(self, monkeypatch) -> None:
+        path = os.path.join(self.colpath, "radicale.sock")
+        self.configure({"server": {"hosts": "", "unix_socket": path,
+                                   "unix_socket_mode": "0660"}})
+        bound_modes = []
+        server_bind = socketserver.TCPServer.server_bind
+
+        def recording_server_bind(server_: socketserver.TCPServer) -> None:
+            server_bind(server_)
+            bound_modes.append(stat.S_IMODE(os.stat(path).st_mode))
+        monkeypatch.setattr(socketserver.TCPServer, "server_bind",
+                            recording_server_bind)
+        self.thread.start()
+        while not os.path.exists(path) or (
+                stat.S_IMODE(os.stat(path).st_mode) != 0o660):
+            assert self.thread.is_alive()
+            time.sleep(0.1)
+        # The socket is only accessible by the owner until the mode is set
+        assert bound_modes == [0o600]
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            conn = client.HTTPConnection("localhost")
+            conn.sock = sock
+            conn.request("GET", "/", headers={"X-Forwarded-For": "10.0.0.1"})
+            response = conn.getresponse()
+            assert response.status == 302
+            response.read()
+        self.shutdown_socket.close()
+        self.thread.join()
+        assert not os.path.exists(path)
+
+    @pytest.mark.skipif(sys.platform == "win32",
+                        reason="Socket activation is not supported")
+    def test_socket_activation(self) -> None:
+        config_path = os.path.join(self.colpath, "config")
+        parser = RawConfigParser()
+        parser.read_dict(configuration_to_dict(self.configuration))
+        # Must be ignored in favor of the passed socket
+        parser.set("server", "hosts", "")
+        with open(config_path, "w") as f:
+            parser.write(f)
+        notify_path = os.path.join(self.colpath, "notify")
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock, \
+                socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as notify:
+            sock.bind(self.sockname)
+            sock.listen()
+            notify.bind(notify_path)
+            notify.settimeout(30)
+            env = os.environ.copy()
+            env["PYTHONPATH"] = os.pathsep.join(sys.path)
+            env["NOTIFY_SOCKET"] = notify_path
+            env["LISTEN_FDS"] = "1"
+            p = subprocess.Popen(
+                ["/bin/sh", "-c", 'LISTEN_PID=$$ exec "$0" "$@"',
+                 sys.executable, "-m", "radicale", "--config", config_path],
+                env=env, pass_fds=(server.SD_LISTEN_FDS_START,),
+                preexec_fn=lambda: os.dup2(sock.fileno(),
+                                           server.SD_LISTEN_FDS_START))
+            try:
+                assert notify.recv(1024).startswith(b"READY=1")
+                self.get("/", is_alive_fn=lambda: p.poll() is None,
+                         check=302)
+            finally:
+                p.terminate()
+                p.wait()
+
     def test_command_line_interface(self, with_bool_options=False) -> None:
         self.configure({"headers": {"Test-Server": "test"}})
         config_args = []
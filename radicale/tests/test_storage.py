@@ -21,20 +21,34 @@ Tests for storage backends.
 
 """
 
+import datetime
+import gzip
 import json
 import logging
 import os
+import pickle
 import re
 import shutil
 import tempfile
-from typing import ClassVar, cast
+import time
+import wsgiref.util
+from typing import ClassVar, Dict, List, Tuple, cast
 
 import pytest
+import vobject
 
+import radicale.item as radicale_item
 import radicale.tests.custom.storage_simple_sync
 from radicale import logger, pathutils
+from radicale.app import get as app_get
+from radicale.item import filter as radicale_filter
+from radicale.item import scan as radicale_scan
+from radicale.storage import multifilesystem
+from radicale.storage.multifilesystem import vtimezone
+from radicale.storage.multifilesystem.cache import CacheContent
+from radicale.storage.multifilesystem.vtimezone import VTIMEZONE_MAX_AGE
 from radicale.tests import BaseTest
-from radicale.tests.helpers import get_file_content
+from radicale.tests.helpers import get_file_content, get_file_path
 from radicale.tests.test_base import TestBaseRequests as _TestBaseRequests
 
 
@@ -143,6 +157,641 @@ class TestMultiFileSystem(BaseTest):
         assert answer1 == answer2
         assert os.path.exists(os.path.join(cache_folder, "event1.ics"))
 
+    def test_item_cache_indexed_properties(self) -> None:
+        """Verify that queries are prefiltered by the indexed properties in
+        the item cache."""
+        self.configure({"storage": {"indexed_properties": "NICKNAME, email"}})
+        self.create_addressbook("/contacts.vcf/")
+        self.put("/contacts.vcf/contact1.vcf",
+                 get_file_content("contact1.vcf"))
+        cache_file = os.path.join(self.colpath, "collection-root",
+                                  "contacts.vcf", ".Radicale.cache", "item",
+                                  "contact1.vcf")
+        with open(cache_file, "rb") as f:
+            cache_hash, *remainder = pickle.load(f)
+        content = CacheContent(*remainder)
+        assert content.indexed_props == {"nickname": ("test",), "email": ()}
+        query = """<?xml version="1.0" encoding="utf-8" ?>
+<CR:addressbook-query xmlns:D="DAV:" xmlns:CR="urn:ietf:params:xml:ns:carddav">
+  <D:prop><D:getetag/></D:prop>
+  <CR:filter test="allof">%s</CR:filter>
+</CR:addressbook-query>"""
+        nickname_filter = """<CR:prop-filter name="NICKNAME">
+  <CR:text-match match-type="equals">test</CR:text-match>
+</CR:prop-filter>"""
+        _, responses = self.report("/contacts.vcf/", query % nickname_filter)
+        assert "/contacts.vcf/contact1.vcf" in responses
+        # Items are skipped if the indexed values don't match
+        content = content._replace(
+            indexed_props={"nickname": ("other",), "email": ()})
+        with open(cache_file, "wb") as f:
+            pickle.dump((cache_hash, *content), f)
+        _, responses = self.report("/contacts.vcf/", query % nickname_filter)
+        assert "/contacts.vcf/contact1.vcf" not in responses
+        _, responses = self.report("/contacts.vcf/", query % """<CR:prop-filter name="FN">
+  <CR:text-match>contact</CR:text-match>
+</CR:prop-filter>""")
+        assert "/contacts.vcf/contact1.vcf" in responses
+        # Changing the indexed properties invalidates the item cache
+        self.configure({"storage": {"indexed_properties": "nickname"}})
+        _, responses = self.report("/contacts.vcf/", query % nickname_filter)
+        assert "/contacts.vcf/contact1.vcf" in responses
+        with open(cache_file, "rb") as f:
+            _, *remainder = pickle.load(f)
+        assert CacheContent(*remainder).indexed_props == {
+            "nickname": ("test",)}
+
+    def test_property_index(self) -> None:
+        """Verify that addressbook-query text searches only load the items
+        selected by the property index."""
+        self.create_addressbook("/contacts.vcf/")
+        names = ["John Smith", "Jane Doe", "Johanna Meyer", "Max Mustermann"]
+        for i, name in enumerate(names):
+            self.put("/contacts.vcf/contact%d.vcf" % i, (
+                "BEGIN:VCARD\r\nVERSION:3.0\r\nUID:contact%d\r\n"
+                "N:;;;;\r\nFN:%s\r\nEND:VCARD\r\n" % (i, name)))
+        query = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<CR:addressbook-query xmlns:D="DAV:" xmlns:CR="urn:ietf:params:xml:ns:carddav">
+  <D:prop><D:getetag/></D:prop>
+  <CR:filter>
+    <CR:prop-filter name="FN">
+      <CR:text-match match-type="%s">%s</CR:text-match>
+    </CR:prop-filter>
+  </CR:filter>
+</CR:addressbook-query>"""
+        # Build the index
+        self.report("/contacts.vcf/", query % ("contains", "x"))
+        loaded = []
+        collection_class = multifilesystem.Collection
+        original_get = collection_class._get
+
+        def counting_get(collection, href, *args, **kwargs):
+            loaded.append(href)
+            return original_get(collection, href, *args, **kwargs)
+
+        def search(match_type: str, text: str) -> set:
+            loaded.clear()
+            with pytest.MonkeyPatch.context() as monkeypatch:
+                monkeypatch.setattr(collection_class, "_get", counting_get)
+                _, responses = self.report("/contacts.vcf/",
+                                           query % (match_type, text))
+            return {href.rsplit("/", 1)[-1] for href in responses}
+
+        assert search("contains", "OH") == {"contact0.vcf", "contact2.vcf"}
+        assert sorted(loaded) == ["contact0.vcf", "contact2.vcf"]
+        assert search("starts-with", "jo") == {"contact0.vcf", "contact2.vcf"}
+        assert search("ends-with", "er") == {"contact2.vcf"}
+        assert search("equals", "jane doe") == {"contact1.vcf"}
+        assert loaded == ["contact1.vcf"]
+        assert search("contains", "n s") == {"contact0.vcf"}
+        assert search("contains", "zz") == set()
+        assert loaded == []
+        # Maintained on upload and delete
+        self.put("/contacts.vcf/contact4.vcf", (
+            "BEGIN:VCARD\r\nVERSION:3.0\r\nUID:contact4\r\n"
+            "N:;;;;\r\nFN:Johnny Cash\r\nEND:VCARD\r\n"))
+        self.delete("/contacts.vcf/contact0.vcf")
+        assert search("contains", "john") == {"contact4.vcf"}
+        assert loaded == ["contact4.vcf"]
+        # Checked against external modifications
+        with open(os.path.join(self.colpath, "collection-root", "contacts.vcf",
+                               "contact3.vcf"), "w", newline="") as f:
+            f.write("BEGIN:VCARD\r\nVERSION:3.0\r\nUID:contact3\r\n"
+                    "N:;;;;\r\nFN:John Doe\r\nEND:VCARD\r\n")
+        assert search("contains", "john") == {"contact3.vcf", "contact4.vcf"}
+
+    def test_item_cache_occurrences(self) -> None:
+        """Verify that time-range filters on precomputed occurrences match
+        the same items as the expansion of the recurrences."""
+        filenames = ["event1.ics", "event_daily_rrule.ics",
+                     "event_daily_rrule_forever.ics",
+                     "event_daily_rrule_overridden.ics",
+                     "event_weekly_rrule.ics", "event_full_day_rrule.ics",
+                     "event_rrule_rdate.ics", "todo1.ics"]
+        time_ranges = [("20130101T000000Z", "20140101T000000Z"),
+                       ("20060101T000000Z", "20060322T000000Z"),
+                       ("20060405T000000Z", "20060410T000000Z"),
+                       ("20130901T000000Z", "20130902T000000Z"),
+                       ("20131222T000000Z", "20131223T000000Z"),
+                       ("20300101T000000Z", "20300102T000000Z"),
+                       ("20000101T000000Z", "20000102T000000Z")]
+        query = """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/></D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="%s">
+        <C:time-range start="%s" end="%s"/>
+      </C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>"""
+
+        def search_all() -> list:
+            results = []
+            for start, end in time_ranges:
+                for tag in ("VEVENT", "VTODO"):
+                    _, responses = self.report("/calendar.ics/",
+                                               query % (tag, start, end))
+                    results.append(sorted(responses))
+            return results
+
+        results = {}
+        for max_cached_occurrences in ("0", "3", "1000"):
+            self.configure({"storage": {
+                "max_cached_occurrences": max_cached_occurrences}})
+            self.delete("/calendar.ics/", check=None)
+            self.mkcalendar("/calendar.ics/")
+            for filename in filenames:
+                self.put("/calendar.ics/" + filename,
+                         get_file_content(filename))
+            results[max_cached_occurrences] = search_all()
+        assert results["0"] == results["3"] == results["1000"]
+        assert any(results["0"])
+        # Items are not parsed for time ranges within the cached occurrences
+        parsed = []
+        original_read_one = vobject.readOne
+
+        def counting_read_one(*args, **kwargs):
+            parsed.append(args)
+            return original_read_one(*args, **kwargs)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(vobject, "readOne", counting_read_one)
+            _, responses = self.report("/calendar.ics/", query % (
+                "VEVENT", "20060405T000000Z", "20060410T000000Z"))
+        assert "/calendar.ics/event_daily_rrule_forever.ics" in responses
+        assert not parsed
+
+    def test_scan_items(self) -> None:
+        """Compare the metadata extracted by the scanner with the
+        metadata of the VObject path."""
+        names = ["summary", "categories", "status", "fn", "email", "tel",
+                 "org", "nickname", "uid", "dtstart"]
+        texts = {}
+        for filename in sorted(os.listdir(get_file_path(""))):
+            if filename.endswith((".ics", ".vcf")):
+                text = get_file_content(filename)
+                # The files use LF line endings
+                assert radicale_scan.scan(text, "VCALENDAR") is None
+                assert radicale_scan.scan(text, "VADDRESSBOOK") is None
+                try:
+                    vobject_item, = radicale_item.read_components(text)
+                    texts[filename] = vobject_item.serialize()
+                except Exception:
+                    texts[filename] = text
+        texts.update({
+            "todo_due.ics": (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                "BEGIN:VTODO\r\nUID:todo_due\r\n"
+                "DTSTAMP:20130901T000000Z\r\nDUE;VALUE=DATE:20130902\r\n"
+                "END:VTODO\r\nEND:VCALENDAR\r\n"),
+            "todo_duration.ics": (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                "BEGIN:VTODO\r\nDTSTAMP:20130901T000000Z\r\n"
+                "DTSTART:20130901T220000\r\nDURATION:P1DT2H\r\n"
+                "UID:todo_duration\r\nEND:VTODO\r\nEND:VCALENDAR\r\n"),
+            "event_duration.ics": (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                "BEGIN:VEVENT\r\nUID:event_duration\r\n"
+                "DTSTART:20130901T220000Z\r\nDURATION:PT0S\r\n"
+                "DTSTAMP:20130901T000000Z\r\nSUMMARY:%s\r\n %s\r\n"
+                "BEGIN:VALARM\r\nACTION:DISPLAY\r\nSUMMARY:Alarm\r\n"
+                "TRIGGER:-PT15M\r\nEND:VALARM\r\nEND:VEVENT\r\n"
+                "END:VCALENDAR\r\n" % ("Meeting " * 8, "Meeting")),
+            "event_date.ics": (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                "BEGIN:VEVENT\r\nUID:event_date\r\n"
+                "DTSTART;VALUE=DATE:20130901\r\nDTEND;VALUE=DATE:20130903\r\n"
+                "CATEGORIES:Work,Home\r\nDTSTAMP:20130901T000000Z\r\n"
+                "END:VEVENT\r\nEND:VCALENDAR\r\n"),
+            "journal_no_dtstart.ics": (
+                "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:test\r\n"
+                "BEGIN:VJOURNAL\r\nDTSTAMP:20130901T000000Z\r\n"
+                "UID:journal_no_dtstart\r\nEND:VJOURNAL\r\n"
+                "END:VCALENDAR\r\n"),
+            "contact_group.vcf": (
+                "BEGIN:VCARD\r\nVERSION:3.0\r\nUID:contact_group\r\n"
+                "item1.EMAIL:jane@example.com\r\nFN:Jane\r\n"
+                "N:Doe;Jane;;;\r\nORG:Example;Sales\r\nEND:VCARD\r\n")})
+        for filename in ["todo_due.ics", "event_duration.ics",
+                         "contact_group.vcf"]:
+            # Texts that VObject would serialize differently
+            text = texts[filename]
+            tag = "VCALENDAR" if filename.endswith(".ics") else "VADDRESSBOOK"
+            for variant in [
+                    text.replace("\r\n", "\n"),
+                    text.replace("PRODID:test\r\n", ""),
+                    text.replace("DTSTAMP:20130901T000000Z\r\n", ""),
+                    text.replace("VERSION:3.0\r\n", "VERSION:3.0\r\nNOTE:a,b\r\n"),
+                    text.replace("UID:", "UID:\r\n "),
+                    text.replace("VERSION:", "X-FIRST:1\r\nVERSION:"),
+                    text.replace("FN:", "fn:"),
+                    text.replace("N:Doe;Jane;;;", "N:Doe;Jane"),
+                    text.replace("ORG:Example;Sales", "ORG:Example;")]:
+                if variant != text:
+                    assert radicale_scan.scan(variant, tag) is None, filename
+        scanned_count = 0
+        for filename, text in texts.items():
+            tag = "VCALENDAR" if filename.endswith(".ics") else "VADDRESSBOOK"
+            scanned = radicale_scan.scan(text, tag)
+            if scanned is None:
+                continue
+            vobject_items = radicale_item.read_components(text)
+            radicale_item.check_and_sanitize_items(
+                vobject_items, tag=tag, max_vevent_rrule_occurrence=100)
+            item = radicale_item.Item(collection_path="test",
+                                      vobject_item=vobject_items[0])
+            # The text is used for GET and the ETag as it is
+            assert item.serialize() == text, filename
+            assert item.etag, filename
+            assert scanned.uid == item.uid, filename
+            assert scanned.name == item.name, filename
+            assert scanned.component_name == item.component_name, filename
+            assert scanned.time_range == item.time_range, filename
+            indexed_props = scanned.index_properties(names)
+            if indexed_props is not None:
+                assert indexed_props == radicale_item.index_properties(
+                    item.vobject_item, item.component_name, names), filename
+            for max_occurrences in (0, 1000):
+                assert scanned.occurrences(max_occurrences) == (
+                    radicale_filter.find_occurrences(
+                        item.vobject_item, item.component_name,
+                        max_occurrences)), filename
+            scanned_count += 1
+        assert scanned_count >= 14
+        for filename in ["event_daily_rrule.ics", "event_issue1847_1.ics",
+                         "event_multiple.ics", "contact_multiple.vcf",
+                         "contact_photo_with_data_uri.vcf"]:
+            assert radicale_scan.scan(texts[filename], "VCALENDAR") is None
+            assert radicale_scan.scan(texts[filename], "VADDRESSBOOK") is None
+
+    def test_scan_items_storage(self) -> None:
+        """Verify that the item cache of simple items is built without
+        VObject."""
+        self.mkcalendar("/calendar.ics/")
+        path = os.path.join(self.colpath, "collection-root", "calendar.ics")
+        shutil.copy(get_file_path("event1.ics"), path)
+        texts = {}
+        for filename in ["event11.ics", "todo10.ics"]:
+            vobject_item, = radicale_item.read_components(
+                get_file_content(filename))
+            texts[filename] = vobject_item.serialize()
+        # Same as event11.ics but with LF line endings
+        texts["event11_lf.ics"] = texts["event11.ics"].replace(
+            "event11", "event11_lf").replace("\r\n", "\n")
+        for filename, text in texts.items():
+            with open(os.path.join(path, filename), "w", encoding="utf-8",
+                      newline="") as f:
+                f.write(text)
+        parsed = []
+        original_read_components = radicale_item.read_components
+
+        def counting_read_components(text):
+            parsed.append(text)
+            return original_read_components(text)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(radicale_item, "read_components",
+                                counting_read_components)
+            _, responses = self.report("/calendar.ics/", """\
+<?xml version="1.0" encoding="utf-8" ?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/></D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="VEVENT">
+        <C:time-range start="20130901T000000Z" end="20130902T000000Z"/>
+      </C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>""")
+        assert sorted(responses) == ["/calendar.ics/event1.ics",
+                                     "/calendar.ics/event11.ics",
+                                     "/calendar.ics/event11_lf.ics"]
+        # The time zone of event1.ics requires VObject and VObject would
+        # serialize event11_lf.ics with CRLF line endings
+        assert sorted(parsed) == sorted([get_file_content("event1.ics"),
+                                         texts["event11_lf.ics"]])
+        _, answer = self.get("/calendar.ics/event11.ics")
+        assert answer == texts["event11.ics"]
+        _, headers, answer = self.request("GET", "/calendar.ics/event11_lf.ics")
+        vobject_item, = radicale_item.read_components(texts["event11_lf.ics"])
+        assert answer == vobject_item.serialize()
+        assert "\n" not in answer.replace("\r\n", "")
+        assert headers["ETag"] == radicale_item.get_etag(answer)
+
+    def test_export_cache(self) -> None:
+        """Verify that collection exports are cached per etag."""
+        self.configure({"storage": {"max_export_cache_size": "1000000"}})
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        _, headers, answer1 = self.request("GET", "/calendar.ics/", check=200)
+        assert headers["Content-Type"] == "text/calendar; charset=utf-8"
+        assert "UID:event1" in answer1
+        cache_folder = os.path.join(self.colpath, "collection-root",
+                                    "calendar.ics", ".Radicale.cache",
+                                    "export")
+        etag = headers["ETag"].strip("\"")
+        cache_file = os.path.join(cache_folder, "export.identity." + etag)
+        with open(cache_file, "rb") as f:
+            assert f.read().decode() == answer1
+        _, headers, answer = self.request("HEAD", "/calendar.ics/", check=200)
+        assert headers["Content-Length"] == str(len(answer1.encode()))
+        assert not answer
+        # Served from cache
+        with open(cache_file, "wb") as f:
+            f.write(answer1.replace("UID:event1", "UID:cached").encode())
+        _, answer2 = self.get("/calendar.ics/")
+        assert "UID:cached" in answer2
+        # Invalidated by changes of the collection
+        self.put("/calendar.ics/event2.ics", get_file_content("event2.ics"))
+        _, answer3 = self.get("/calendar.ics/")
+        assert "UID:event1" in answer3 and "UID:event2" in answer3
+        assert not os.path.exists(cache_file)
+        assert len(os.listdir(cache_folder)) == 1
+
+    def test_export_cache_size(self, monkeypatch) -> None:
+        """Verify that exports exceeding the size budget are streamed and
+        not cached."""
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        _, expected_export = self.get("/calendar.ics/")
+        self.configure({"server": {"compression": "gzip",
+                                   "compression_min_size": "0"},
+                        "storage": {"max_export_cache_size": "100"}})
+
+        def serialize(*args, **kwargs):
+            raise AssertionError("Export built in memory")
+
+        monkeypatch.setattr(multifilesystem.Collection, "serialize", serialize)
+
+        def request(accept_encoding: str) -> Tuple[Dict[str, str], bytes]:
+            environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/calendar.ics/",
+                       "HTTP_ACCEPT_ENCODING": accept_encoding}
+            wsgiref.util.setup_testing_defaults(environ)
+            headers: Dict[str, str] = {}
+
+            def start_response(status: str, headers_: List[Tuple[str, str]]
+                               ) -> None:
+                assert status.startswith("200 ")
+                headers.update(headers_)
+            answer = b"".join(self.application(environ, start_response))
+            return headers, answer
+        headers, answer = request("")
+        assert answer.decode() == expected_export
+        assert "Content-Length" not in headers
+        assert headers["Content-Type"] == "text/calendar; charset=utf-8"
+        headers, answer = request("gzip")
+        assert headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in headers
+        assert gzip.decompress(answer).decode() == expected_export
+        cache_folder = os.path.join(self.colpath, "collection-root",
+                                    "calendar.ics", ".Radicale.cache",
+                                    "export")
+        assert not os.path.exists(cache_folder)
+        # Exports within the size budget are cached
+        self.configure({"storage": {"max_export_cache_size": "1000000"}})
+        headers, answer = request("gzip")
+        assert gzip.decompress(answer).decode() == expected_export
+        name, = os.listdir(cache_folder)
+        assert name.startswith("export.gzip.")
+
+    def test_export_rendition(self) -> None:
+        """Verify that the renditions of birthday calendar exports depend on
+        the current year."""
+        share = {"Conversion": "bday", "Actions": {}}
+        assert app_get.export_rendition("gzip") == "export.gzip"
+        rendition = app_get.export_rendition("gzip", share)
+        assert rendition.startswith(
+            "bday-%d-" % datetime.date.today().year)
+        assert rendition.endswith(".gzip")
+        assert app_get.export_rendition(
+            "gzip", {"Conversion": "bday", "Actions": {"x": 1}}) != rendition
+
+    def test_sendfile(self) -> None:
+        """Verify that the reverse proxy is told to send cached exports."""
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        _, expected_export = self.get("/calendar.ics/")
+        self.configure({"server": {"sendfile": "x-accel-redirect",
+                                   "sendfile_prefix": "/internal/"},
+                        "storage": {"max_export_cache_size": "1000000"}})
+        _, headers, answer = self.request("GET", "/calendar.ics/", check=200)
+        assert not answer
+        assert headers["Content-Type"] == "text/calendar; charset=utf-8"
+        etag = headers["ETag"].strip("\"")
+        assert headers["X-Accel-Redirect"] == (
+            "/internal/collection-root/calendar.ics/.Radicale.cache/export/"
+            "export.identity." + etag)
+        export_path = os.path.join(
+            self.colpath, headers["X-Accel-Redirect"][len("/internal/"):])
+        with open(export_path, "rb") as f:
+            assert f.read().decode() == expected_export
+        # Files of items are replaced in place and sent by Radicale
+        _, headers, answer = self.request("GET", "/calendar.ics/event1.ics",
+                                          check=200)
+        assert "X-Accel-Redirect" not in headers
+        assert "UID:event1" in answer
+        # The referenced export of the old version is still available
+        self.put("/calendar.ics/event2.ics", get_file_content("event2.ics"))
+        self.configure({"server": {"sendfile": "x-sendfile"}})
+        _, headers, answer = self.request("GET", "/calendar.ics/", check=200)
+        assert not answer
+        assert headers["X-Sendfile"] != os.path.abspath(export_path)
+        assert os.path.dirname(headers["X-Sendfile"]) == os.path.dirname(
+            os.path.abspath(export_path))
+        with open(export_path, "rb") as f:
+            assert f.read().decode() == expected_export
+        # Exports are only sent from the export cache
+        self.put("/calendar.ics/event3.ics", get_file_content("event3.ics"))
+        for max_export_cache_size in ("100", "0"):
+            self.configure({"storage": {
+                "max_export_cache_size": max_export_cache_size}})
+            _, headers, answer = self.request("GET", "/calendar.ics/",
+                                              check=200)
+            assert "X-Sendfile" not in headers
+            assert "UID:event1" in answer and "UID:event2" in answer
+
+    def test_vtimezone_registry(self) -> None:
+        """Verify that item cache entries reference the VTIMEZONEs in the
+        registry and that exports are assembled from them."""
+        storage = self.application._storage
+        assert isinstance(storage, multifilesystem.Storage)
+        self.mkcalendar("/calendar.ics/")
+        filenames = ["event1.ics", "event2.ics", "event_issue2151.ics",
+                     "event11.ics", "todo1.ics", "journal1.ics"]
+        for filename in filenames:
+            self.put("/calendar.ics/" + filename, get_file_content(filename))
+        cache_folder = os.path.join(self.colpath, "collection-root",
+                                    "calendar.ics", ".Radicale.cache", "item")
+        with open(os.path.join(cache_folder, "event1.ics"), "rb") as f:
+            _, *remainder = pickle.load(f)
+        content = CacheContent(*remainder)
+        assert "BEGIN:VTIMEZONE" not in content.text
+        assert content.vtimezones is not None
+        (_, tzid, hash_), = content.vtimezones
+        assert tzid == "Europe/Paris"
+        registry_folder = os.path.join(self.colpath, ".Radicale.cache",
+                                       "vtimezone")
+        assert hash_ in os.listdir(registry_folder)
+        _, answer = self.get("/calendar.ics/event1.ics")
+        assert "BEGIN:VTIMEZONE" in answer
+        _, export = self.get("/calendar.ics/")
+        # Compare with the export of the items without known VTIMEZONEs
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(radicale_item, "find_vtimezones",
+                                lambda text: None)
+            shutil.rmtree(cache_folder)
+            shutil.rmtree(registry_folder)
+            storage._vtimezones.clear()
+            _, expected_export = self.get("/calendar.ics/")
+        assert export == expected_export
+        assert export.count("BEGIN:VTIMEZONE") == 2
+        # Missing VTIMEZONEs in the registry invalidate the cache entries
+        for filename in filenames:
+            self.put("/calendar.ics/" + filename, get_file_content(filename),
+                     check=204)
+        shutil.rmtree(registry_folder)
+        storage._vtimezones.clear()
+        _, answer = self.get("/calendar.ics/event1.ics")
+        assert "BEGIN:VTIMEZONE" in answer
+        assert os.listdir(registry_folder)
+
+    def test_vtimezone_registry_cleanup(self, monkeypatch) -> None:
+        """Verify that unused VTIMEZONEs are removed from the registry and
+        that the number of VTIMEZONEs in memory is bounded."""
+        storage = self.application._storage
+        assert isinstance(storage, multifilesystem.Storage)
+        self.mkcalendar("/calendar.ics/")
+        self.put("/calendar.ics/event1.ics", get_file_content("event1.ics"))
+        registry_folder = os.path.join(self.colpath, ".Radicale.cache",
+                                       "vtimezone")
+        hash_, = os.listdir(registry_folder)
+        path = os.path.join(registry_folder, hash_)
+        # Files that are used again get a new modification time
+        old = time.time() - VTIMEZONE_MAX_AGE + 60
+        os.utime(path, (old, old))
+        storage._vtimezones.clear()
+        self.get("/calendar.ics/event1.ics")
+        assert os.path.getmtime(path) > old + 60
+        # Unused files are removed with the item cache
+        old = time.time() - VTIMEZONE_MAX_AGE - 60
+        os.utime(path, (old, old))
+        storage._vtimezones.clear()
+        with storage.acquire_lock("w"):
+            collection, = storage.discover("/calendar.ics/")
+            assert isinstance(collection, multifilesystem.Collection)
+            collection._clean_item_cache()
+        assert not os.listdir(registry_folder)
+        _, answer = self.get("/calendar.ics/event1.ics")
+        assert "BEGIN:VTIMEZONE" in answer
+        assert os.listdir(registry_folder) == [hash_]
+        monkeypatch.setattr(vtimezone, "MAX_VTIMEZONES_IN_MEMORY", 1)
+        with storage.acquire_lock("w"):
+            other_hash = storage._intern_vtimezone(
+                "BEGIN:VTIMEZONE\r\nTZID:Other\r\nEND:VTIMEZONE\r\n")
+        assert list(storage._vtimezones) == [other_hash]
+        assert storage._load_vtimezone(hash_) is not None
+        assert list(storage._vtimezones) == [hash_]
+
+    def test_item_raw_bytes(self) -> None:
+        """Verify that items keep the stored bytes if they are not
+        reserialized."""
+        self.mkcalendar("/calendar.ics/")
+        for filename in ["event1.ics", "event2.ics"]:
+            self.put("/calendar.ics/" + filename, get_file_content(filename))
+        collection_path = os.path.join(self.colpath, "collection-root",
+                                       "calendar.ics")
+        # Reserialized by VObject
+        with open(os.path.join(collection_path, "event2.ics"), "wb") as f:
+            f.write(get_file_content("event2.ics").replace(
+                "\r\n", "\n").encode())
+        storage = self.application._storage
+        with storage.acquire_lock("r"):
+            collection, = storage.discover("/calendar.ics/")
+            assert isinstance(collection, multifilesystem.Collection)
+            items = {str(item.href): item for item in collection.get_all()}
+        assert not hasattr(items["event1.ics"], "__dict__")
+        for href, item in items.items():
+            with open(os.path.join(collection_path, href), "rb") as f:
+                raw = f.read()
+            assert (item.serialize_bytes("UTF-8") == raw) == (
+                href == "event1.ics")
+            # The stored bytes are returned without encoding
+            assert (item.serialize_bytes("UTF-8") is
+                    item.serialize_bytes("utf-8")) == (href == "event1.ics")
+            assert item.serialize_bytes("utf-8") == (
+                item.serialize().encode("utf-8"))
+            assert item.serialize_bytes("utf-16") == (
+                item.serialize().encode("utf-16"))
+            _, answer = self.get("/calendar.ics/" + href)
+            assert answer == item.serialize()
+            # The content is only kept once, either as bytes or as text
+            assert (item._raw is None) != (item._text is None)
+            assert (item._raw is not None) == (href == "event1.ics")
+            assert item.count("\nBEGIN:VEVENT") == (
+                item.serialize().count("\nBEGIN:VEVENT"))
+            assert item._text is None or href != "event1.ics"
+
+    def test_conversion_cache(self) -> None:
+        """Verify that birthday calendar items converted from vCards are
+        cached per etag of the vCard and share actions."""
+        self.create_addressbook("/contacts.vcf/")
+        for filename in ["contact1.vcf", "contact2-with-bday.vcf"]:
+            self.put("/contacts.vcf/" + filename, get_file_content(filename))
+        storage = self.application._storage
+        converted = []
+        original_convert = radicale_item.Item._convert_vcf_to_ics
+
+        def counting_convert(item, *args, **kwargs):
+            converted.append(item.href)
+            return original_convert(item, *args, **kwargs)
+
+        def convert_all(share_actions: dict) -> dict:
+            with storage.acquire_lock("r"):
+                collection, = storage.discover("/contacts.vcf/")
+                assert isinstance(collection, multifilesystem.Collection)
+                with pytest.MonkeyPatch.context() as monkeypatch:
+                    monkeypatch.setattr(radicale_item.Item,
+                                        "_convert_vcf_to_ics",
+                                        counting_convert)
+                    result = {}
+                    for item in collection.get_all():
+                        item_ics = item.convert_vcf_to_ics(share_actions)
+                        result[item.href] = item_ics and (
+                            item_ics.href, item_ics.etag, item_ics.serialize(),
+                            item_ics.time_range)
+                    return result
+
+        share_actions: dict = {"config": {
+            "conversion_bday_summary_template": "{fn}"}}
+        result = convert_all(share_actions)
+        assert sorted(converted) == ["contact1.vcf", "contact2-with-bday.vcf"]
+        assert result["contact1.vcf"] is None
+        href, etag, text, _ = result["contact2-with-bday.vcf"]
+        assert href == "contact2-with-bday.ics"
+        assert etag.startswith("\"bda019700101")
+        assert "SUMMARY:Test-FN\r\n" in text
+        cache_folder = os.path.join(self.colpath, "collection-root",
+                                    "contacts.vcf", ".Radicale.cache", "bday")
+        assert sorted(os.listdir(cache_folder)) == [
+            "contact1.vcf", "contact2-with-bday.vcf"]
+        converted.clear()
+        assert convert_all(share_actions) == result
+        assert converted == []
+        # Other share actions and modified vCards are converted again
+        convert_all({})
+        assert sorted(converted) == ["contact1.vcf", "contact2-with-bday.vcf"]
+        converted.clear()
+        self.put("/contacts.vcf/contact1.vcf", get_file_content(
+            "contact1.vcf").replace("END:VCARD", "BDAY:1980-05-05\nEND:VCARD"),
+            check=204)
+        assert convert_all({})["contact1.vcf"] is not None
+        assert converted == ["contact1.vcf"]
+        self.delete("/contacts.vcf/contact1.vcf")
+        assert os.listdir(cache_folder) == ["contact2-with-bday.vcf"]
+
     def test_put_items_multiple(self) -> None:
         """Upload 2 items to calendar, check that collection inode number stays."""
         self.configure({"logging": {"response_content_on_debug": "False",
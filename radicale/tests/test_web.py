@@ -19,7 +19,11 @@ Test web plugin.
 
 """
 
-from radicale import httputils
+import gzip
+import wsgiref.util
+from typing import Dict, List, Tuple
+
+from radicale import httputils, utils
 from radicale.tests import BaseTest
 
 
@@ -38,6 +42,54 @@ class TestBaseWebRequests(BaseTest):
         _, answer = self.get("/.web/js/config.js")
         assert "export const PREFER_BROWSER_LOGIN = true;" in answer
 
+    def test_internal_precompressed(self) -> None:
+        """Web assets are served precompressed."""
+        self.configure({"server": {"compression": "gzip"}})
+        _, content = self.get("/.web/css/main.css")
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/.web/css/main.css",
+                   "HTTP_ACCEPT_ENCODING": "gzip"}
+        wsgiref.util.setup_testing_defaults(environ)
+        headers: Dict[str, str] = {}
+
+        def start_response(status: str, headers_: List[Tuple[str, str]]
+                           ) -> None:
+            assert status.startswith("200 ")
+            headers.update(headers_)
+        answer = b"".join(self.application(environ, start_response))
+        assert headers["Content-Type"].startswith("text/css")
+        assert headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(answer).decode() == content
+        # Images are not compressed
+        environ["PATH_INFO"] = "/.web/css/icon.png"
+        headers.clear()
+        answer = b"".join(self.application(environ, start_response))
+        assert "Content-Encoding" not in headers
+
+    def test_internal_cache(self) -> None:
+        """Web assets are served from memory with validators."""
+        _, headers, answer = self.request("GET", "/.web/css/main.css",
+                                          check=200)
+        etag = headers["ETag"]
+        assert etag == '"%s"' % utils.sha256_bytes(answer.encode())
+        assert headers["Cache-Control"] == "max-age=3600"
+        _, headers, answer = self.request(
+            "GET", "/.web/css/main.css", check=304, HTTP_IF_NONE_MATCH=etag)
+        assert headers["ETag"] == etag and not answer
+        assert headers["Cache-Control"] == "max-age=3600"
+        self.request("HEAD", "/.web/css/main.css", check=304,
+                     HTTP_IF_NONE_MATCH=etag)
+        # The compressed representation has another entity tag
+        _, headers, _ = self.request("HEAD", "/.web/css/main.css", check=200,
+                                     HTTP_ACCEPT_ENCODING="gzip",
+                                     HTTP_IF_NONE_MATCH=etag)
+        assert headers["Content-Encoding"] == "gzip"
+        assert headers["ETag"] == etag[:-1] + '-gzip"'
+        _, headers, _ = self.request("GET", "/.web/", check=200)
+        assert headers["ETag"]
+        self.configure({"web": {"max_age": "0"}})
+        _, headers, _ = self.request("GET", "/.web/css/main.css", check=200)
+        assert headers["Cache-Control"] == "no-cache"
+
     def test_none(self) -> None:
         self.configure({"web": {"type": "none"}})
         _, answer = self.get("/.web")
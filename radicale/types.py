@@ -16,12 +16,33 @@
 # along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
 
 import contextlib
-from typing import (Any, Callable, ContextManager, Iterator, List, Mapping,
-                    MutableMapping, Protocol, Sequence, Tuple, TypeVar, Union,
-                    runtime_checkable)
+from typing import (Any, BinaryIO, Callable, ContextManager, Iterable,
+                    Iterator, List, Mapping, MutableMapping, Protocol,
+                    Sequence, Tuple, TypeVar, Union, runtime_checkable)
+
+
+class EncodedStream:
+    """Streamed content that is already encoded with the charset and the
+    ``Content-Encoding`` of the response."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._chunks)
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
 
 WSGIResponseHeaders = Union[Mapping[str, str], Sequence[Tuple[str, str]]]
-WSGIResponse = Tuple[int, WSGIResponseHeaders, Union[None, str, bytes], Union[None, str]]
+# Content can be streamed as iterator of chunks (without Content-Length) or
+# as open file (sent with ``wsgi.file_wrapper``)
+WSGIResponseContent = Union[None, str, bytes, Iterator[str], EncodedStream,
+                            BinaryIO]
+WSGIResponse = Tuple[int, WSGIResponseHeaders, WSGIResponseContent, Union[None, str]]
 WSGIEnviron = Mapping[str, Any]
 WSGIStartResponse = Callable[[str, List[Tuple[str, str]]], Any]
 
@@ -26,14 +26,87 @@ Features:
 
 """
 
-from radicale import httputils, types, web
+import functools
+from typing import Dict, Iterator, NamedTuple, Tuple
+
+from radicale import config, httputils, types, utils, web
+from radicale.log import logger
 
 MIMETYPES = httputils.MIMETYPES  # deprecated
 FALLBACK_MIMETYPE = httputils.FALLBACK_MIMETYPE  # deprecated
 
+# Headers that are repeated in 304 Not Modified responses (see RFC 7232 4.1)
+NOT_MODIFIED_HEADERS = ("Cache-Control", "ETag", "Last-Modified", "Vary")
+
+
+def _web_paths(traversable: httputils._TRAVERSABLE_LIKE_TYPE,
+               prefix: str = "/.web/") -> Iterator[str]:
+    """Yield the paths of all files below ``traversable``.
+
+    Folders containing an ``index.html`` are included with a trailing
+    slash.
+
+    """
+    for entry in traversable.iterdir():
+        if entry.is_dir():
+            yield from _web_paths(entry, prefix + entry.name + "/")
+        elif entry.is_file():
+            if entry.name == "index.html":
+                yield prefix
+            yield prefix + entry.name
+
+
+WebAsset = NamedTuple("WebAsset", [
+    ("headers", Dict[str, str]), ("etag", str), ("variants", Dict[str, bytes])])
+
+
+@functools.lru_cache(maxsize=2)
+def _load_assets(max_age: int, compression: Tuple[str, ...], min_size: int,
+                 level: int) -> Dict[str, WebAsset]:
+    """Read and hash the web assets once and compress them with all
+    enabled content codings.
+
+    The assets are shared by all instances with the same configuration.
+
+    """
+    assets: Dict[str, WebAsset] = {}
+    traversable = httputils.resource_traversable(
+        "radicale.web", "internal_data")
+    size = 0
+    for path in _web_paths(traversable):
+        status, headers, answer, _ = httputils.serve_resource(
+            "radicale.web", "internal_data", "", path)
+        if status != 200 or not isinstance(answer, bytes):
+            continue
+        headers = dict(headers)
+        headers["Cache-Control"] = (
+            "max-age=%d" % max_age if max_age else "no-cache")
+        variants = {"identity": answer}
+        if (len(answer) >= min_size and
+                httputils.is_compressible(headers["Content-Type"])):
+            for coding in compression:
+                variants[coding] = httputils.compress(answer, coding, level)
+        assets[path] = WebAsset(headers, utils.sha256_bytes(answer), variants)
+        size += sum(map(len, variants.values()))
+    logger.debug("Loaded %d web assets (%d bytes)", len(assets), size)
+    return assets
+
 
 class Web(web.BaseWeb):
 
+    _compression: Tuple[str, ...]
+    _assets: Dict[str, WebAsset]
+
+    def __init__(self, configuration: config.Configuration) -> None:
+        super().__init__(configuration)
+        self._compression = tuple(
+            coding for coding in configuration.get("server", "compression")
+            if coding in httputils.CONTENT_CODINGS)
+        self._assets = _load_assets(
+            configuration.get("web", "max_age"), self._compression,
+            configuration.get("server", "compression_min_size"),
+            configuration.get("server", "compression_level"))
+
     def get(
         self,
         environ: types.WSGIEnviron,
@@ -55,6 +128,26 @@ class Web(web.BaseWeb):
             )
             headers = {"Content-Type": "application/javascript"}
             return 200, headers, content, None
+        asset = self._assets.get(path)
+        if asset is not None:
+            coding = httputils.negotiate_content_coding(
+                environ, self._compression)
+            if coding not in asset.variants:
+                coding = "identity"
+            headers = dict(asset.headers)
+            # Each representation has its own strong entity tag
+            if coding == "identity":
+                headers["ETag"] = '"%s"' % asset.etag
+            else:
+                headers["ETag"] = '"%s-%s"' % (asset.etag, coding)
+                headers["Content-Encoding"] = coding
+            if len(asset.variants) > 1:
+                headers["Vary"] = "Accept-Encoding"
+            if httputils.not_modified(environ, headers["ETag"],
+                                      headers.get("Last-Modified", "")):
+                return 304, {key: value for key, value in headers.items()
+                             if key in NOT_MODIFIED_HEADERS}, None, None
+            return 200, headers, asset.variants[coding], None
         return httputils.serve_resource(
             "radicale.web", "internal_data", base_prefix, path
         )
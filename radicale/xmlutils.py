@@ -27,7 +27,7 @@ import copy
 import xml.etree.ElementTree as ET
 from collections import OrderedDict
 from http import client
-from typing import Dict, Mapping, Optional, Union
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Union
 from urllib.parse import quote
 
 from radicale import item, pathutils
@@ -141,6 +141,32 @@ def webdav_error(human_tag: str) -> ET.Element:
     return root
 
 
+def serialize_multistatus(elements: Iterable[ET.Element], encoding: str
+                          ) -> Iterator[str]:
+    """Serialize a ``D:multistatus`` element with the children ``elements``
+    incrementally.
+
+    Every child is serialized as soon as it is produced by ``elements``.
+    The known namespaces are declared once on the root element.
+
+    """
+    declarations = [' xmlns="%s"' % NAMESPACES["D"]]
+    declarations.extend(' xmlns:%s="%s"' % (short, url) for short, url in
+                        NAMESPACES.items() if short != "D")
+    yield "<?xml version='1.0' encoding='%s'?>\n<multistatus%s>" % (
+        encoding, "".join(declarations))
+    for element in elements:
+        xml = ET.tostring(element, "unicode")
+        # ElementTree declares all namespaces of the subtree on its first
+        # element, remove those that are already declared on the root
+        end = xml.index(">")
+        start_tag = xml[:end]
+        for declaration in declarations:
+            start_tag = start_tag.replace(declaration, "", 1)
+        yield start_tag + xml[end:]
+    yield "</multistatus>"
+
+
 def get_content_type(item: "item.Item", encoding: str) -> str:
     """Get the content-type of an item with charset and component parameters.
     """